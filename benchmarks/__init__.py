@@ -0,0 +1,8 @@
+"""Mesures de performance du pipeline de planification.
+
+    python -m benchmarks.run --doctors 20,60,120 --weeks 52 -o bench.json
+    python -m benchmarks.startup --max-import 1.5 --max-render 5
+
+Les classeurs sont générés par `benchmarks.synthetic` au format du modèle
+Excel de l'application.
+"""
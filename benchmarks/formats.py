@@ -0,0 +1,103 @@
+"""Relecture des feuilles d'entrée dans chaque format accepté.
+
+Les mêmes feuilles (`benchmarks.synthetic.make_sheets`, scores décimaux)
+sont écrites en classeur .xlsx, en archives zip de CSV (séparateur ",",
+point décimal), de CSV d'Excel en français (";" et virgule décimale) et, si
+pyarrow est installé, de Parquet et d'Arrow. Chaque version est relue par
+`load_workbook` et doit donner les mêmes feuilles que le classeur ; le
+script échoue (code de sortie 1) sinon :
+
+    python -m benchmarks.formats
+"""
+
+import argparse
+import io
+import sys
+import zipfile
+
+import pandas as pd
+
+from benchmarks.synthetic import make_sheets
+from planning_gardes_app import (
+    SHEET_FILE_NAMES,
+    WorkbookData,
+    load_workbook,
+    pyarrow_available,
+    table_bytes,
+)
+
+# format -> (extension, sérialisation d'une feuille)
+_WRITERS = {
+    "csv": (".csv", lambda df: table_bytes(df, "csv")),
+    "csv (Excel français)": (
+        ".csv",
+        lambda df: df.to_csv(index=False, sep=";", decimal=",").encode("utf-8-sig"),
+    ),
+    "parquet": (".parquet", lambda df: table_bytes(df, "parquet")),
+    "arrow": (".arrow", lambda df: table_bytes(df, "arrow")),
+}
+
+
+def _xlsx(sheets: dict[str, pd.DataFrame]) -> bytes:
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf, engine="xlsxwriter") as writer:
+        for name, df in sheets.items():
+            df.to_excel(writer, sheet_name=name, index=False)
+    return buf.getvalue()
+
+
+def _zip(sheets: dict[str, pd.DataFrame], suffix: str, write) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, df in sheets.items():
+            zf.writestr(f"{SHEET_FILE_NAMES[name]}{suffix}", write(df))
+    return buf.getvalue()
+
+
+def _cells(df: pd.DataFrame) -> pd.DataFrame:
+    # Parquet et Arrow gardent les cellules vides ("") qu'Excel et CSV relisent
+    # comme absentes ; l'application traite les deux de la même façon
+    return df.astype(object).mask(df.astype(object).eq(""))
+
+
+def _differences(ref: WorkbookData, other: WorkbookData) -> list[str]:
+    if other.errors:
+        return other.errors
+    out = []
+    for field in ("dispo", "pointage", "gardes", "prev"):
+        try:
+            pd.testing.assert_frame_equal(
+                _cells(getattr(ref, field)), _cells(getattr(other, field)), check_dtype=False
+            )
+        except AssertionError as exc:
+            out.append(f"{field} : {str(exc).splitlines()[0]}")
+    if (ref.params, ref.periods_ante) != (other.params, other.periods_ante):
+        out.append("paramètres différents")
+    return out
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Relecture des feuilles dans chaque format")
+    parser.add_argument("--doctors", type=int, default=12)
+    parser.add_argument("--weeks", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    sheets = make_sheets(n_doctors=args.doctors, n_weeks=args.weeks, seed=args.seed)
+    ref = load_workbook(io.BytesIO(_xlsx(sheets)))
+    failures = []
+    for fmt, (suffix, write) in _WRITERS.items():
+        if suffix in (".parquet", ".arrow") and not pyarrow_available():
+            print(f"{fmt:<22} ignoré (pyarrow absent)")
+            continue
+        diffs = _differences(ref, load_workbook(io.BytesIO(_zip(sheets, suffix, write))))
+        print(f"{fmt:<22} {'identique' if not diffs else 'DIFFÉRENT'}")
+        failures += [f"{fmt} : {d}" for d in diffs]
+
+    for failure in failures:
+        print(f"[ÉCHEC] {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""Chronométrage de chaque étape du pipeline sur des classeurs synthétiques.
+
+Étapes mesurées séparément (temps en secondes, pic mémoire Python en Mio
+via tracemalloc) : validate_file, lecture des feuilles (load_workbook),
+generate_planning, update_pointage, export xlsx, 100 simulations de
+robustesse (temps par simulation = temps / 100), fiches individuelles et
+log écrit au fil des décisions (PlanningSink). Les résultats sont écrits
+en JSON pour comparer deux versions :
+
+    python -m benchmarks.run --doctors 20,60 --weeks 12,52 -o avant.json
+
+Avec `--startup`, les temps de démarrage à froid (voir `benchmarks.startup`)
+sont ajoutés au rapport, et l'exécution échoue si leurs budgets
+(`--max-import`, `--max-render`) ne sont pas tenus.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks import startup
+from benchmarks.synthetic import make_workbook
+from planning_gardes_app import (
+    PlanningSink,
+    create_template_excel,
+    generate_planning,
+    iter_planning,
+    load_workbook,
+    to_xlsx_bytes,
+    update_pointage,
+    validate_file,
+)
+from planning_gardes_cli import evaluate_robustness, export_doctor_files
+
+
+def _measure(fn, repeat: int) -> tuple[dict, object]:
+    """Pic mémoire sur une exécution tracée, puis meilleur temps sur `repeat` exécutions.
+
+    Les deux mesures sont séparées : tracemalloc ralentit fortement le code mesuré.
+    """
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    times = []
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return {"seconds": min(times), "seconds_all": times, "peak_mib": peak / 2**20}, result
+
+
+def bench_case(case: dict, repeat: int = 3, engine: str = "greedy", seuil: int = 6, max_we: int = 1) -> dict:
+    data = make_workbook(**case)
+    stages = {}
+
+    stages["validate_file"], _ = _measure(
+        lambda: validate_file(pd.ExcelFile(io.BytesIO(data))), repeat
+    )
+    stages["parse"], wb = _measure(lambda: load_workbook(io.BytesIO(data)), repeat)
+    if wb.errors:
+        raise ValueError("; ".join(wb.errors))
+
+    stages["generate_planning"], (planning, log, _) = _measure(
+        lambda: generate_planning(
+            wb.dispo, wb.pointage, wb.gardes, wb.prev, seuil, max_we, 5, wb.periods_ante,
+            engine=engine,
+        ),
+        repeat,
+    )
+    stages["update_pointage"], pointage_update = _measure(
+        lambda: update_pointage(wb.pointage, planning, periods_ante=wb.periods_ante), repeat
+    )
+    stages["export_xlsx"], _ = _measure(
+        lambda: [to_xlsx_bytes(df) for df in (planning, log, pointage_update)], repeat
+    )
+    stages["create_template_excel"], _ = _measure(
+        lambda: create_template_excel(
+            date(2025, 1, 6), case["n_weeks"], 12, 1, 3, 3, 4,
+            doctors=list(wb.pointage["MD"]), pointage_df=pointage_update,
+        ),
+        repeat,
+    )
+    stages["robustness_x100"], _ = _measure(
+        lambda: evaluate_robustness(
+            planning, wb.dispo, wb.pointage, wb.gardes, wb.prev, seuil, max_we, 5,
+            n_runs=100, workers=1,
+        ),
+        repeat,
+    )
+    stages["doctor_files"], _ = _measure(
+        lambda: export_doctor_files(planning, io.BytesIO(), workers=1), repeat
+    )
+
+    def stream_log():
+        with PlanningSink(os.devnull, "csv") as sink:
+            for rec in iter_planning(
+                wb.dispo, wb.pointage, wb.gardes, wb.prev, seuil, max_we, 5, engine=engine
+            ):
+                sink.write(rec)
+
+    stages["stream_log"], _ = _measure(stream_log, repeat)
+
+    return {
+        "case": case,
+        "engine": engine,
+        "workbook_bytes": len(data),
+        "planning_rows": len(planning),
+        "stages": stages,
+    }
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _int_list(text: str) -> list[int]:
+    return [int(x) for x in text.split(",") if x]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks du pipeline de planification")
+    parser.add_argument("--doctors", type=_int_list, default=[20, 60], help="ex. 20,60,120")
+    parser.add_argument("--weeks", type=_int_list, default=[12, 52], help="ex. 4,52")
+    parser.add_argument("--oui", type=float, default=0.2, help="probabilité OUI")
+    parser.add_argument("--prn", type=float, default=0.6, help="probabilité PRN")
+    parser.add_argument("--non", type=float, default=0.2, help="probabilité NON")
+    parser.add_argument("--resident-coverage", type=float, default=0.5)
+    parser.add_argument("--history-weeks", type=int, default=4)
+    parser.add_argument("--periods-ante", type=int, default=12)
+    parser.add_argument("--engine", choices=["greedy", "optimal"], default="greedy")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--startup", action="store_true", help="mesurer aussi le démarrage à froid")
+    parser.add_argument("--max-import", type=float, default=1.5, help="budget import (s), avec --startup")
+    parser.add_argument(
+        "--max-render", type=float, default=5.0, help="budget premier affichage (s), avec --startup"
+    )
+    parser.add_argument("-o", "--output", default="bench_results.json")
+    args = parser.parse_args(argv)
+
+    results = []
+    for n_doctors in args.doctors:
+        for n_weeks in args.weeks:
+            case = {
+                "n_doctors": n_doctors,
+                "n_weeks": n_weeks,
+                "p_oui": args.oui,
+                "p_prn": args.prn,
+                "p_non": args.non,
+                "resident_coverage": args.resident_coverage,
+                "history_weeks": args.history_weeks,
+                "periods_ante": args.periods_ante,
+                "seed": args.seed,
+            }
+            res = bench_case(case, repeat=args.repeat, engine=args.engine)
+            results.append(res)
+            print(
+                f"{n_doctors:>4} médecins x {n_weeks:>3} semaines : "
+                + ", ".join(f"{k} {v['seconds'] * 1000:.0f} ms" for k, v in res["stages"].items())
+            )
+
+    report = {
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "results": results,
+    }
+    failures = []
+    if args.startup:
+        report["startup"] = startup.measure(args.repeat)
+        failures = startup.check(report["startup"], {"import": args.max_import, "render": args.max_render})
+    Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    for failure in failures:
+        print(f"[ÉCHEC] démarrage {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""Vérification du démarrage à froid de l'application.
+
+Chaque mesure est faite dans un processus Python neuf, avec les guides PDF
+précalculés comme dans l'image Docker :
+
+- import de `planning_gardes_app` : aucune dépendance lourde (reportlab,
+  xlsxwriter, openpyxl, streamlit) ne doit être chargée ;
+- premier affichage de la page (streamlit.testing), sans fichier importé :
+  ni reportlab, ni xlsxwriter, ni openpyxl ne doivent être chargés.
+
+Le script échoue (code de sortie 1) si un module lourd est chargé ou si
+l'affichage lève une exception. Ces vérifications ne dépendent pas de la
+machine : elles sont exécutées à la construction de l'image Docker.
+
+    python -m benchmarks.startup
+
+Les temps sont toujours affichés, mais les budgets ne sont vérifiés que
+s'ils sont donnés ; c'est une étape de mesure, à lancer sur une machine
+au repos avec `benchmarks.run` (voir `--startup`), pas à la construction :
+
+    python -m benchmarks.startup --max-import 1.5 --max-render 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+LAZY_MODULES = ["reportlab", "xlsxwriter", "openpyxl", "streamlit"]
+
+_IMPORT_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import planning_gardes_app
+seconds = time.perf_counter() - t0
+print(json.dumps({"seconds": seconds, "loaded": [m for m in %r if m in sys.modules]}))
+"""
+
+_RENDER_PROBE = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(%r, default_timeout=120)
+t0 = time.perf_counter()
+at.run()
+seconds = time.perf_counter() - t0
+print(json.dumps({
+    "seconds": seconds,
+    "loaded": [m for m in %r if m in sys.modules],
+    "exceptions": [str(e.value) for e in at.exception],
+}))
+"""
+
+
+def _probe(code: str, env: dict) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def measure(runs: int = 3, render: bool = True) -> dict:
+    """Médiane de `runs` démarrages à froid (secondes) et modules lourds chargés."""
+    assets = tempfile.mkdtemp(prefix="planning_assets_")
+    env = dict(os.environ, PLANNING_ASSETS_DIR=assets, PYTHONPATH=str(ROOT))
+    subprocess.run(
+        [sys.executable, "-c", "import planning_gardes_app as app; app.build_static_assets()"],
+        cwd=ROOT,
+        env=env,
+        check=True,
+    )
+
+    report = {}
+    probes = {"import": _IMPORT_PROBE % (LAZY_MODULES,)}
+    if render:
+        page = str(ROOT / "planning_gardes_app.py")
+        probes["render"] = _RENDER_PROBE % (page, LAZY_MODULES[:3])
+    for name, code in probes.items():
+        samples = [_probe(code, env) for _ in range(runs)]
+        report[name] = {
+            "seconds": statistics.median(s["seconds"] for s in samples),
+            "loaded": sorted({m for s in samples for m in s["loaded"]}),
+            "exceptions": sorted({e for s in samples for e in s.get("exceptions", [])}),
+        }
+    return report
+
+
+def check(report: dict, budgets: dict) -> list[str]:
+    """Affiche les mesures de `measure` et retourne les échecs.
+
+    Modules lourds chargés et exceptions échouent toujours ; un temps
+    n'échoue que si son budget (secondes) est donné dans `budgets`.
+    """
+    failures = []
+    for name, res in report.items():
+        budget = budgets.get(name)
+        print(
+            f"{name:<7} {res['seconds'] * 1000:6.0f} ms"
+            + (f" (budget {budget * 1000:.0f} ms)" if budget is not None else "")
+            + (f", modules chargés : {', '.join(res['loaded'])}" if res["loaded"] else "")
+        )
+        if budget is not None and res["seconds"] > budget:
+            failures.append(f"{name} : {res['seconds']:.2f} s > {budget:.2f} s")
+        if res["loaded"]:
+            failures.append(f"{name} : import non différé de {', '.join(res['loaded'])}")
+        if res["exceptions"]:
+            failures.append(f"{name} : " + "; ".join(res["exceptions"]))
+    return failures
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Temps de démarrage à froid de l'application")
+    parser.add_argument("--max-import", type=float, default=None, help="budget import (s)")
+    parser.add_argument("--max-render", type=float, default=None, help="budget premier affichage (s)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--no-render", action="store_true", help="ne mesurer que l'import")
+    parser.add_argument("-o", "--output", default=None, help="résultats JSON")
+    args = parser.parse_args(argv)
+
+    report = measure(args.runs, render=not args.no_render)
+    failures = check(report, {"import": args.max_import, "render": args.max_render})
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    for failure in failures:
+        print(f"[ÉCHEC] {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""Classeurs synthétiques au format de `create_template_excel`."""
+
+import io
+import random
+from datetime import date, timedelta
+
+import pandas as pd
+
+from planning_gardes_app import PARAMS_SHEET, PREV_SHEET
+
+JOURS = ["lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche"]
+
+
+def make_sheets(
+    n_doctors: int = 20,
+    n_weeks: int = 12,
+    p_oui: float = 0.2,
+    p_prn: float = 0.6,
+    p_non: float = 0.2,
+    resident_coverage: float = 0.5,
+    history_weeks: int = 4,
+    periods_ante: int = 12,
+    start: date = date(2025, 1, 6),
+    seed: int = 0,
+    pts_sem_res: int = 1,
+    pts_sem_nores: int = 3,
+    pts_we_res: int = 3,
+    pts_we_nores: int = 4,
+) -> dict[str, pd.DataFrame]:
+    """Feuilles d'un classeur d'entrée aléatoire mais reproductible (`seed`).
+
+    Les disponibilités sont tirées selon p_oui/p_prn/p_non ; `resident_coverage`
+    est la part des jours avec résident ; `history_weeks` semaines de gardes
+    passées sont écrites dans "Période précédente" ; le pointage contient
+    `periods_ante` colonnes de périodes antérieures.
+    """
+    rng = random.Random(seed)
+    doctors = [f"Dr{i + 1}" for i in range(n_doctors)]
+    dates = [start + timedelta(days=i) for i in range(n_weeks * 7)]
+
+    dispo = pd.DataFrame(
+        {
+            "Jour": [JOURS[d.weekday()] for d in dates],
+            "Moment": ["Soir" if d.weekday() < 5 else "" for d in dates],
+            "Date": dates,
+        }
+    )
+    weights = [p_oui, p_prn, p_non]
+    for m in doctors:
+        dispo[m] = rng.choices(["OUI", "PRN", "NON"], weights=weights, k=len(dates))
+
+    pointage = pd.DataFrame({"MD": doctors})
+    for k in range(periods_ante):
+        pointage[f"P-{periods_ante - k}"] = [round(rng.uniform(5, 25), 1) for _ in doctors]
+    pointage["Score actualisé"] = pointage.drop(columns="MD").mean(axis=1) if periods_ante else 0.0
+
+    residents = [rng.random() < resident_coverage for _ in dates]
+    points = [
+        (pts_sem_res if res else pts_sem_nores)
+        if d.weekday() < 5
+        else (pts_we_res if res else pts_we_nores)
+        for d, res in zip(dates, residents)
+    ]
+    gardes = pd.DataFrame(
+        {
+            "date": dates,
+            "résident": ["Rés" if res else "" for res in residents],
+            "Points": points,
+        }
+    )
+
+    prev_dates = [start - timedelta(days=i) for i in range(history_weeks * 7, 0, -1)]
+    prev = pd.DataFrame({"Date": prev_dates, "Médecin": rng.choices(doctors, k=len(prev_dates))})
+
+    params = pd.DataFrame(
+        {
+            "Paramètre": ["periods_ante", "pts_sem_res", "pts_sem_nores", "pts_we_res", "pts_we_nores"],
+            "Valeur": [periods_ante, pts_sem_res, pts_sem_nores, pts_we_res, pts_we_nores],
+        }
+    )
+    return {
+        "Dispo Période": dispo,
+        "Pointage gardes": pointage,
+        "Gardes résidents": gardes,
+        PREV_SHEET: prev,
+        PARAMS_SHEET: params,
+    }
+
+
+def make_workbook(**kwargs) -> bytes:
+    """Classeur .xlsx (bytes) construit à partir de `make_sheets(**kwargs)`."""
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf, engine="xlsxwriter") as writer:
+        for name, df in make_sheets(**kwargs).items():
+            df.to_excel(writer, sheet_name=name, index=False)
+    return buf.getvalue()
@@ -0,0 +1,464 @@
+"""Service HTTP local de calcul des plannings (intégration avec les logiciels RH et de paie).
+
+Exemples :
+
+    python planning_gardes_api.py --port 8765 --workers 4
+    curl --data-binary @service_a.xlsx "http://127.0.0.1:8765/jobs?seuil=6&max_we=1&wait=30"
+    curl http://127.0.0.1:8765/jobs/<id>
+    curl "http://127.0.0.1:8765/jobs/<id>/planning?format=csv" -o planning.csv
+
+Routes :
+
+    POST   /jobs                  classeur .xlsx, archive .zip de feuilles ou JSON -> 202 {"id": ...}
+    GET    /jobs/<id>             statut, erreurs, mesures de temps et indicateurs
+    GET    /jobs/<id>/<tableau>   planning, log ou pointage (?format=json, csv, xlsx, parquet, arrow)
+    DELETE /jobs/<id>             annule un job encore en attente
+    GET    /health                processus, jobs en attente et en cours
+
+Un corps JSON (Content-Type application/json) a la forme
+{"feuilles": {...}, "parametres": {...}}, voir `load_json_workbook`. Les
+paramètres peuvent aussi être passés dans l'URL, sous les mêmes noms qu'en
+ligne de commande (seuil, max_we, bonus_oui, periods_ante, engine,
+time_budget, weekend_order). `?wait=<secondes>` sur POST ou GET attend la
+fin du calcul avant de répondre.
+
+Les calculs tournent sur un pool borné de processus gardés chauds : les
+imports et le cache des classeurs déjà lus (`load_upload`) servent d'une
+demande à l'autre. Au-delà de `max_queue` jobs non terminés, POST répond
+503. `LocalClient` appelle le même routage sans passer par le réseau.
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib.util import find_spec
+from pathlib import Path
+from urllib.parse import parse_qsl, urlsplit
+
+from planning_gardes_app import (
+    EXPORT_FORMATS,
+    WEEKEND_ORDERS,
+    PhaseProfiler,
+    generate_planning,
+    load_json_workbook,
+    load_upload,
+    planning_log,
+    planning_metrics,
+    table_bytes,
+)
+
+logger = logging.getLogger("planning_gardes_api")
+
+# Paramètres acceptés (noms de la ligne de commande ou de `generate_planning`)
+_PARAMS = {
+    "seuil": ("seuil_proximite", int),
+    "max_we": ("max_weekends", int),
+    "bonus_oui": ("bonus_oui", int),
+    "periods_ante": ("periods_ante", int),
+    "engine": ("engine", str),
+    "time_budget": ("time_budget", float),
+    "weekend_order": ("weekend_order", str),
+}
+_PARAMS.update({name: (name, kind) for name, kind in list(_PARAMS.values())})
+TABLES = ("planning", "log", "pointage")
+MAX_BODY = 50 * 2**20
+
+
+class ApiError(Exception):
+    """Erreur renvoyée au client avec son code HTTP."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_job_params(raw: dict) -> dict:
+    """Paramètres d'un job (URL ou JSON) -> arguments de `generate_planning`."""
+    params = {}
+    for key, value in raw.items():
+        if key not in _PARAMS:
+            raise ApiError(400, f"Paramètre inconnu : {key}")
+        name, kind = _PARAMS[key]
+        try:
+            params[name] = kind(value)
+        except (TypeError, ValueError):
+            raise ApiError(400, f"Valeur invalide pour {key} : {value!r}") from None
+    if params.get("engine", "greedy") not in ("greedy", "optimal"):
+        raise ApiError(400, f"Moteur inconnu : {params['engine']!r} (attendu 'greedy' ou 'optimal')")
+    if params.get("weekend_order", "static") not in WEEKEND_ORDERS:
+        raise ApiError(400, f"Ordre des week-ends inconnu : {params['weekend_order']!r}")
+    return params
+
+
+# =========================
+# Exécution dans les processus du pool
+# =========================
+def _warm_worker() -> None:
+    # Lecteurs chargés une fois par processus, pas à la première demande
+    for name in ("openpyxl", "pyarrow"):
+        if find_spec(name) is not None:
+            importlib.import_module(name)
+
+
+def _ping() -> int:
+    # assez long pour que chaque processus du pool reçoive son propre appel
+    time.sleep(0.2)
+    return os.getpid()
+
+
+def run_job(kind: str, payload, params: dict) -> dict:
+    """Lit le classeur, calcule planning et pointage ; exécuté dans un processus du pool.
+
+    `kind` : "fichier" (octets .xlsx ou .zip) ou "json" (feuilles déjà décodées).
+    Les erreurs sont retournées, pas levées, comme pour un lot en ligne de commande.
+    """
+    started = time.time()
+    profiler = PhaseProfiler()
+    result = {"erreurs": [], "mesures": profiler.phases, "debut": started, "processus": os.getpid()}
+    try:
+        with profiler.phase("Lecture"):
+            wb = load_json_workbook(payload) if kind == "json" else load_upload(payload)[1]
+        if wb.errors:
+            result["erreurs"] = wb.errors
+        else:
+            params = dict(params)
+            params.setdefault("periods_ante", wb.periods_ante)
+            planning, _, pointage = generate_planning(
+                wb.dispo, wb.pointage, wb.gardes, wb.prev, **params, profiler=profiler
+            )
+            metrics = planning_metrics(planning, pointage, wb.dispo)
+            metrics["Week-ends par tier"] = {str(k): v for k, v in metrics["Week-ends par tier"].items()}
+            result.update(planning=planning, pointage=pointage, indicateurs=metrics)
+    except Exception as exc:
+        result["erreurs"] = [f"{type(exc).__name__}: {exc}"]
+    result["fin"] = time.time()
+    return result
+
+
+# =========================
+# Jobs et routage
+# =========================
+@dataclass
+class Job:
+    id: str
+    future: Future
+    submitted: float
+    source: str
+    params: dict
+
+    def status(self) -> str:
+        if self.future.cancelled():
+            return "annule"
+        if not self.future.done():
+            return "en_cours" if self.future.running() else "en_attente"
+        if self.future.exception() is not None or self.future.result()["erreurs"]:
+            return "echec"
+        return "termine"
+
+    def describe(self) -> dict:
+        info = {
+            "id": self.id,
+            "statut": self.status(),
+            "source": self.source,
+            "parametres": self.params,
+            "soumis_le": datetime.fromtimestamp(self.submitted).isoformat(timespec="milliseconds"),
+        }
+        if not self.future.done() or self.future.cancelled():
+            return info
+        if self.future.exception() is not None:
+            info["erreurs"] = [f"{type(self.future.exception()).__name__}: {self.future.exception()}"]
+            return info
+        res = self.future.result()
+        info["erreurs"] = res["erreurs"]
+        info["mesures"] = {
+            "attente_s": round(res["debut"] - self.submitted, 4),
+            "calcul_s": round(res["fin"] - res["debut"], 4),
+            "total_s": round(res["fin"] - self.submitted, 4),
+            "processus": res["processus"],
+            "phases": res["mesures"],
+        }
+        if "planning" in res:
+            planning = res["planning"]
+            info["jours"] = len(planning)
+            info["non_attribues"] = int(planning["Médecin"].isna().sum()) if len(planning) else 0
+            info["indicateurs"] = res["indicateurs"]
+        return info
+
+
+def _json(status: int, obj) -> tuple[int, str, bytes]:
+    body = json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+    return status, "application/json; charset=utf-8", body
+
+
+class PlanningService:
+    """File de jobs de planification sur un pool borné de processus gardés chauds.
+
+    `processes=False` exécute les jobs dans des threads du processus courant
+    (tests, petits volumes). `keep` : nombre de jobs terminés gardés en
+    mémoire, les plus anciens sont oubliés.
+    """
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        max_queue: int = 64,
+        keep: int = 256,
+        processes: bool = True,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.keep = keep
+        self.processes = processes
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = self._new_pool()
+
+    def _new_pool(self):
+        if self.processes:
+            return ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker)
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="planning-api")
+
+    def warm(self) -> list[int]:
+        """Démarre les processus du pool avant la première demande."""
+        return sorted({f.result() for f in [self._pool.submit(_ping) for _ in range(self.workers)]})
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # -- jobs --
+    def pending(self) -> int:
+        with self._lock:
+            return sum(not job.future.done() for job in self._jobs.values())
+
+    def submit(self, kind: str, payload, params: dict, source: str) -> Job:
+        with self._lock:
+            if sum(not job.future.done() for job in self._jobs.values()) >= self.max_queue:
+                raise ApiError(503, f"File pleine ({self.max_queue} jobs en attente), réessayer plus tard")
+            try:
+                future = self._pool.submit(run_job, kind, payload, params)
+            except BrokenProcessPool:
+                # un processus du pool est mort : on repart sur un pool neuf
+                self._pool = self._new_pool()
+                future = self._pool.submit(run_job, kind, payload, params)
+            job = Job(uuid.uuid4().hex, future, time.time(), source, params)
+            self._jobs[job.id] = job
+            done = [k for k, j in self._jobs.items() if j.future.done()]
+            for k in done[: max(0, len(self._jobs) - self.keep)]:
+                del self._jobs[k]
+        return job
+
+    def job(self, job_id: str, wait_s: float | None = None) -> Job:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise ApiError(404, f"Job inconnu : {job_id}")
+        if wait_s:
+            wait([job.future], timeout=wait_s)
+        return job
+
+    # -- routage commun au serveur HTTP et à LocalClient --
+    def handle(
+        self, method: str, path: str, query: dict, body: bytes = b"", content_type: str = ""
+    ) -> tuple[int, str, bytes]:
+        """Traite une requête -> (code HTTP, Content-Type, corps)."""
+        try:
+            return self._route(method, path.rstrip("/") or "/", dict(query), body, content_type)
+        except ApiError as exc:
+            return _json(exc.status, {"erreur": str(exc)})
+        except (ValueError, ImportError) as exc:
+            return _json(400, {"erreur": str(exc)})
+
+    def _route(self, method, path, query, body, content_type):
+        wait_s = float(query.pop("wait", 0) or 0)
+        parts = path.strip("/").split("/")
+        if method == "GET" and parts == ["health"]:
+            with self._lock:
+                statuses = [job.status() for job in self._jobs.values()]
+            return _json(
+                200,
+                {
+                    "processus": self.workers,
+                    "en_attente": statuses.count("en_attente"),
+                    "en_cours": statuses.count("en_cours"),
+                    "max_queue": self.max_queue,
+                },
+            )
+        if parts[0] != "jobs":
+            raise ApiError(404, f"Route inconnue : {path}")
+
+        if method == "POST" and len(parts) == 1:
+            job = self._submit_request(query, body, content_type)
+            if wait_s:
+                wait([job.future], timeout=wait_s)
+            return _json(200 if job.future.done() else 202, job.describe())
+        if len(parts) < 2:
+            raise ApiError(405, f"Méthode {method} non prise en charge sur {path}")
+
+        job = self.job(parts[1], wait_s if method == "GET" else None)
+        if method == "DELETE" and len(parts) == 2:
+            cancelled = job.future.cancel()
+            return _json(200 if cancelled else 409, job.describe())
+        if method == "GET" and len(parts) == 2:
+            return _json(200, job.describe())
+        if method == "GET" and len(parts) == 3 and parts[2] in TABLES:
+            return self._table(job, parts[2], query.get("format", "json"))
+        raise ApiError(404, f"Route inconnue : {method} {path}")
+
+    def _submit_request(self, query: dict, body: bytes, content_type: str) -> Job:
+        if not body:
+            raise ApiError(400, "Corps vide : envoyer un classeur .xlsx, une archive .zip ou du JSON")
+        if len(body) > MAX_BODY:
+            raise ApiError(413, f"Corps trop volumineux (max {MAX_BODY // 2**20} Mio)")
+        if content_type.split(";")[0].strip().lower() == "application/json":
+            try:
+                doc = json.loads(body)
+            except json.JSONDecodeError as exc:
+                raise ApiError(400, f"JSON invalide : {exc}") from None
+            if not isinstance(doc, dict) or not isinstance(doc.get("feuilles"), dict):
+                raise ApiError(400, 'JSON attendu : {"feuilles": {...}, "parametres": {...}}')
+            params = parse_job_params({**doc.get("parametres", {}), **query})
+            return self.submit("json", doc["feuilles"], params, "json")
+        return self.submit("fichier", body, parse_job_params(query), "fichier")
+
+    def _table(self, job: Job, name: str, fmt: str) -> tuple[int, str, bytes]:
+        status = job.status()
+        if status != "termine":
+            return _json(409, {"erreur": f"Job {status}", **job.describe()})
+        res = job.future.result()
+        df = {"planning": res["planning"], "pointage": res["pointage"]}.get(name)
+        if df is None:
+            df = planning_log(res["planning"])
+        if fmt == "json":
+            body = df.to_json(orient="records", date_format="iso", force_ascii=False)
+            return 200, "application/json; charset=utf-8", body.encode("utf-8")
+        if fmt not in EXPORT_FORMATS:
+            raise ApiError(400, f"Format inconnu : {fmt}")
+        return 200, EXPORT_FORMATS[fmt][1], table_bytes(df, fmt)
+
+
+# =========================
+# Serveur HTTP et client local
+# =========================
+def make_handler(service: PlanningService) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _dispatch(self, method: str) -> None:
+            url = urlsplit(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY:
+                status, ctype, payload = _json(413, {"erreur": "Corps trop volumineux"})
+                self.close_connection = True
+            else:
+                body = self.rfile.read(length) if length else b""
+                status, ctype, payload = service.handle(
+                    method, url.path, dict(parse_qsl(url.query)), body, self.headers.get("Content-Type", "")
+                )
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(payload)))
+            if status == 503:
+                self.send_header("Retry-After", "5")
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+        def do_DELETE(self):
+            self._dispatch("DELETE")
+
+        def log_message(self, format, *args):
+            logger.info("%s - %s", self.address_string(), format % args)
+
+    return Handler
+
+
+def make_server(service: PlanningService, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.daemon_threads = True
+    return server
+
+
+class LocalClient:
+    """Client sans réseau : les mêmes routes que le serveur HTTP, appelées directement."""
+
+    def __init__(self, service: PlanningService):
+        self.service = service
+
+    def request(self, method: str, path: str, body: bytes = b"", content_type: str = "") -> tuple[int, str, bytes]:
+        url = urlsplit(path)
+        return self.service.handle(method, url.path, dict(parse_qsl(url.query)), body, content_type)
+
+    def _json(self, method: str, path: str, body: bytes = b"", content_type: str = "") -> dict:
+        status, _, payload = self.request(method, path, body, content_type)
+        doc = json.loads(payload)
+        if status >= 400:
+            raise ApiError(status, doc.get("erreur", payload.decode("utf-8", "replace")))
+        return doc
+
+    def submit(self, source, wait: float | None = None, **params) -> dict:
+        """Soumet un classeur (chemin ou octets) ou des feuilles JSON ({nom: lignes})."""
+        query = {**params, **({"wait": wait} if wait else {})}
+        path = "/jobs" + ("?" + "&".join(f"{k}={v}" for k, v in query.items()) if query else "")
+        if isinstance(source, dict):
+            body = json.dumps({"feuilles": source}, ensure_ascii=False, default=str).encode("utf-8")
+            return self._json("POST", path, body, "application/json")
+        body = source if isinstance(source, bytes) else Path(source).read_bytes()
+        return self._json("POST", path, body, "application/octet-stream")
+
+    def status(self, job_id: str, wait: float | None = None) -> dict:
+        return self._json("GET", f"/jobs/{job_id}" + (f"?wait={wait}" if wait else ""))
+
+    def cancel(self, job_id: str) -> dict:
+        status, _, payload = self.request("DELETE", f"/jobs/{job_id}")
+        return json.loads(payload)
+
+    def table(self, job_id: str, name: str = "planning", fmt: str = "json") -> bytes:
+        status, _, payload = self.request("GET", f"/jobs/{job_id}/{name}?format={fmt}")
+        if status >= 400:
+            raise ApiError(status, json.loads(payload).get("erreur", ""))
+        return payload
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("-j", "--workers", type=int, default=None, help="processus de calcul")
+    parser.add_argument("--max-queue", type=int, default=64, help="jobs non terminés au maximum")
+    parser.add_argument("--keep", type=int, default=256, help="jobs terminés gardés en mémoire")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    service = PlanningService(args.workers, max_queue=args.max_queue, keep=args.keep)
+    pids = service.warm()
+    server = make_server(service, args.host, args.port)
+    logger.info("Service prêt sur http://%s:%d (%d processus : %s)", args.host, args.port, len(pids), pids)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,28 @@
+import hashlib
 import io
-from collections import defaultdict
-from datetime import date, datetime, timedelta
-
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+import zipfile
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict, defaultdict, deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from datetime import date, datetime, timedelta, timezone
+from heapq import heapify, heappop, heappush
+from importlib.util import find_spec
+from pathlib import Path, PurePosixPath
+
+import numpy as np
 import pandas as pd
-import streamlit as st
-from reportlab.pdfgen import canvas as pdf_canvas
 
 # =========================
 # Configuration par défaut
@@ -15,20 +33,36 @@ from reportlab.pdfgen import canvas as pdf_canvas
 DEFAULT_DOCTORS = ["Dr1", "Dr2", "Dr3", "Dr4", "Dr5"]
 
 PREV_SHEET = "Période précédente"
+PARAMS_SHEET = "Paramètres"
+WORKBOOK_SHEETS = ["Dispo Période", "Pointage gardes", "Gardes résidents", PREV_SHEET, PARAMS_SHEET]
 BASE_DISPO_COLS = ["Jour", "Moment", "Date"]
+WEEKDAY_NAMES = ["lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche"]
+
+# Codes de disponibilité de la matrice dense (les autres valeurs saisies
+# reçoivent un code à partir de 3, dans l'ordre d'apparition).
+DISPO_OUI, DISPO_PRN, DISPO_NON = 0, 1, 2
+DISPO_LABELS = ["OUI", "PRN", "NON"]
+
+# Ordres d'attribution des blocs week-end (voir `_assign_shifts`)
+WEEKEND_ORDERS = ("static", "dynamic")
+
+_DAY_NS = 86_400_000_000_000
+
+logger = logging.getLogger("planning_gardes")
 
 
 # =========================
 # Validation du fichier importé
 # =========================
-def validate_file(xls: pd.ExcelFile) -> list[str]:
+def validate_sheets(sheets: dict[str, pd.DataFrame]) -> list[str]:
+    """Vérifie les feuilles déjà lues (nom de feuille -> DataFrame)."""
     errors: list[str] = []
 
     # Dispo Période
-    if "Dispo Période" not in xls.sheet_names:
+    if "Dispo Période" not in sheets:
         errors.append("Feuille manquante: Dispo Période")
     else:
-        df = xls.parse("Dispo Période")
+        df = sheets["Dispo Période"]
         for col in BASE_DISPO_COLS:
             if col not in df.columns:
                 errors.append(f"Colonne manquante dans Dispo Période: {col}")
@@ -37,26 +71,26 @@ def validate_file(xls: pd.ExcelFile) -> list[str]:
             errors.append("Aucune colonne médecin détectée dans Dispo Période")
 
     # Pointage gardes
-    if "Pointage gardes" not in xls.sheet_names:
+    if "Pointage gardes" not in sheets:
         errors.append("Feuille manquante: Pointage gardes")
     else:
-        dfp = xls.parse("Pointage gardes")
+        dfp = sheets["Pointage gardes"]
         for col in ["MD", "Score actualisé"]:
             if col not in dfp.columns:
                 errors.append(f"Colonne manquante dans Pointage gardes: {col}")
 
     # Gardes résidents
-    if "Gardes résidents" not in xls.sheet_names:
+    if "Gardes résidents" not in sheets:
         errors.append("Feuille manquante: Gardes résidents")
     else:
-        dfr = xls.parse("Gardes résidents")
+        dfr = sheets["Gardes résidents"]
         for col in ["date", "résident", "Points"]:
             if col not in dfr.columns:
                 errors.append(f"Colonne manquante dans Gardes résidents: {col}")
 
     # Période précédente (optionnelle)
-    if PREV_SHEET in xls.sheet_names:
-        dfprev = xls.parse(PREV_SHEET)
+    if PREV_SHEET in sheets:
+        dfprev = sheets[PREV_SHEET]
         for col in ["Date", "Médecin"]:
             if col not in dfprev.columns:
                 errors.append(f"Colonne manquante dans {PREV_SHEET}: {col}")
@@ -64,9 +98,328 @@ def validate_file(xls: pd.ExcelFile) -> list[str]:
     return errors
 
 
+def validate_file(xls: pd.ExcelFile) -> list[str]:
+    sheets = {
+        name: xls.parse(name)
+        for name in ["Dispo Période", "Pointage gardes", "Gardes résidents", PREV_SHEET]
+        if name in xls.sheet_names
+    }
+    return validate_sheets(sheets)
+
+
+# =========================
+# Chargement du classeur
+# =========================
+@dataclass
+class WorkbookData:
+    """Feuilles d'un classeur importé, lues une seule fois et validées."""
+
+    dispo: pd.DataFrame | None
+    pointage: pd.DataFrame | None
+    gardes: pd.DataFrame | None
+    prev: pd.DataFrame | None
+    params: dict
+    periods_ante: int
+    errors: list[str]
+    timings: dict[str, float]
+
+
+def parse_params(params_df: pd.DataFrame | None) -> tuple[dict, int]:
+    """Lit la feuille Paramètres -> (dictionnaire brut, periods_ante)."""
+    if params_df is None:
+        return {}, 12
+    try:
+        params_map = dict(zip(params_df["Paramètre"], params_df["Valeur"]))
+    except KeyError:
+        return {}, 12
+    try:
+        return params_map, int(params_map.get("periods_ante", 12))
+    except (TypeError, ValueError):
+        return params_map, 12
+
+
+def _to_dates(sheets: dict, sheet: str, col: str, errors: list[str]) -> None:
+    df = sheets.get(sheet)
+    if df is None or col not in df.columns:
+        return
+    try:
+        df[col] = pd.to_datetime(df[col])
+    except (ValueError, TypeError):
+        errors.append(f"Dates invalides dans {sheet}: colonne {col}")
+
+
+# Hors Excel, chaque feuille est un fichier CSV, Parquet ou Arrow nommé
+# d'après la feuille ("Dispo Période.csv") ou son nom court
+# ("dispo_periode.parquet"), dans un dossier ou une archive zip.
+SHEET_FILE_NAMES = {
+    "Dispo Période": "dispo_periode",
+    "Pointage gardes": "pointage_gardes",
+    "Gardes résidents": "gardes_residents",
+    PREV_SHEET: "periode_precedente",
+    PARAMS_SHEET: "parametres",
+}
+TABLE_SUFFIXES = {".csv": "csv", ".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow"}
+EXPORT_FORMATS = {
+    "xlsx": (".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv": (".csv", "text/csv"),
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+    "arrow": (".arrow", "application/vnd.apache.arrow.file"),
+}
+
+
+def pyarrow_available() -> bool:
+    return find_spec("pyarrow") is not None
+
+
+def _require_pyarrow(fmt: str) -> None:
+    if not pyarrow_available():
+        raise ImportError(f"Le format {fmt} nécessite le paquet optionnel pyarrow (pip install pyarrow)")
+
+
+def available_formats() -> list[str]:
+    """Formats d'export utilisables dans cet environnement."""
+    return [f for f in EXPORT_FORMATS if f in ("xlsx", "csv") or pyarrow_available()]
+
+
+def _sheet_key(stem: str) -> str:
+    # les noms de fichiers d'archives macOS sont en NFD ("e" + accent combinant)
+    return unicodedata.normalize("NFC", stem).casefold()
+
+
+_DECIMAL_COMMA = re.compile(r"\d,\d")
+
+
+def read_table(source, fmt: str) -> pd.DataFrame:
+    """Lit une feuille au format `fmt` ("csv", "parquet" ou "arrow")."""
+    if fmt == "csv":
+        raw = source.read() if hasattr(source, "read") else Path(source).read_bytes()
+        text = raw.decode("utf-8-sig")
+        header = text.split("\n", 1)[0]
+        sep = ";" if header.count(";") > header.count(",") else ","
+        # Excel en français : séparateur ";" et virgule décimale ("13,45") ;
+        # avec ";", une virgule entre deux chiffres ne peut être qu'une décimale
+        decimal = "," if sep == ";" and _DECIMAL_COMMA.search(text) else "."
+        return pd.read_csv(io.StringIO(text), sep=sep, decimal=decimal)
+    _require_pyarrow(fmt)
+    if fmt == "parquet":
+        return pd.read_parquet(source)
+    return pd.read_feather(source)
+
+
+def table_bytes(df: pd.DataFrame, fmt: str = "xlsx") -> bytes:
+    """Sérialise un tableau au format `fmt` (voir `EXPORT_FORMATS`)."""
+    if fmt == "xlsx":
+        return to_xlsx_bytes(df)
+    if fmt == "csv":
+        return df.to_csv(index=False).encode("utf-8")
+    _require_pyarrow(fmt)
+    buf = io.BytesIO()
+    # Parquet et Arrow exigent des noms de colonnes textuels et un index par défaut
+    df = df.rename(columns=str).reset_index(drop=True)
+    if fmt == "parquet":
+        df.to_parquet(buf, index=False)
+    else:
+        df.to_feather(buf)
+    return buf.getvalue()
+
+
+def format_from_suffix(path) -> str:
+    suffix = Path(path).suffix.lower()
+    if suffix == ".xlsx":
+        return "xlsx"
+    if suffix in TABLE_SUFFIXES:
+        return TABLE_SUFFIXES[suffix]
+    raise ValueError(f"Format de fichier non reconnu : {path}")
+
+
+def is_table_dir(path) -> bool:
+    """Vrai si `path` est un dossier contenant une feuille "Dispo Période" tabulaire."""
+    path = Path(path)
+    if not path.is_dir():
+        return False
+    wanted = {_sheet_key("Dispo Période"), SHEET_FILE_NAMES["Dispo Période"]}
+    return any(f.suffix.lower() in TABLE_SUFFIXES and _sheet_key(f.stem) in wanted for f in path.iterdir())
+
+
+def detect_format(source) -> str:
+    """"xlsx", "zip" (archive de feuilles) ou "dir" (dossier de feuilles)."""
+    if isinstance(source, (str, os.PathLike)) and Path(source).is_dir():
+        return "dir"
+    probe = io.BytesIO(source) if isinstance(source, bytes) else source
+    if not zipfile.is_zipfile(probe):
+        return "xlsx"  # le lecteur Excel signalera lui-même un fichier illisible
+    if hasattr(probe, "seek"):
+        probe.seek(0)
+    with zipfile.ZipFile(probe) as zf:
+        is_xlsx = "[Content_Types].xml" in zf.namelist()
+    if hasattr(probe, "seek"):
+        probe.seek(0)
+    return "xlsx" if is_xlsx else "zip"
+
+
+def _read_sheet_files(source, fmt: str, timings: dict[str, float]) -> dict[str, pd.DataFrame]:
+    t0 = time.perf_counter()
+    if fmt == "dir":
+        entries = [(f.stem, f.suffix.lower(), f) for f in Path(source).iterdir() if f.is_file()]
+        zf = None
+    else:
+        zf = zipfile.ZipFile(io.BytesIO(source) if isinstance(source, bytes) else source)
+        entries = [
+            (PurePosixPath(n).stem, PurePosixPath(n).suffix.lower(), n)
+            for n in zf.namelist()
+            if not n.endswith("/") and not PurePosixPath(n).name.startswith(".")
+        ]
+    files = {
+        _sheet_key(stem): (TABLE_SUFFIXES[suffix], ref)
+        for stem, suffix, ref in entries
+        if suffix in TABLE_SUFFIXES
+    }
+    timings["Ouverture"] = time.perf_counter() - t0
+
+    sheets: dict[str, pd.DataFrame] = {}
+    for name in WORKBOOK_SHEETS:
+        hit = files.get(_sheet_key(name)) or files.get(SHEET_FILE_NAMES[name])
+        if hit is None:
+            continue
+        table_fmt, ref = hit
+        t0 = time.perf_counter()
+        sheets[name] = read_table(io.BytesIO(zf.read(ref)) if zf else ref, table_fmt)
+        timings[name] = time.perf_counter() - t0
+    if zf is not None:
+        zf.close()
+    return sheets
+
+
+def _read_excel_sheets(source, timings: dict[str, float]) -> dict[str, pd.DataFrame]:
+    t0 = time.perf_counter()
+    xls = pd.ExcelFile(source, engine="openpyxl")
+    timings["Ouverture"] = time.perf_counter() - t0
+
+    sheets: dict[str, pd.DataFrame] = {}
+    for name in WORKBOOK_SHEETS:
+        if name not in xls.sheet_names:
+            continue
+        t0 = time.perf_counter()
+        sheets[name] = xls.parse(name)
+        timings[name] = time.perf_counter() - t0
+    xls.close()
+    return sheets
+
+
+def load_workbook(source) -> WorkbookData:
+    """Lit chaque feuille utile du classeur une seule fois, puis la valide.
+
+    `source` est un classeur .xlsx, ou un dossier / une archive zip de
+    feuilles CSV, Parquet ou Arrow (voir `SHEET_FILE_NAMES`) ; le format est
+    détecté automatiquement. Le lecteur openpyxl de pandas ouvre les
+    classeurs en mode `read_only` (lecture en flux) ; le temps de lecture de
+    chaque feuille est mesuré dans `timings` (en secondes, clé "Ouverture"
+    pour le classeur lui-même).
+    """
+    timings: dict[str, float] = {}
+    fmt = detect_format(source)
+    if fmt == "xlsx":
+        sheets = _read_excel_sheets(source, timings)
+    else:
+        sheets = _read_sheet_files(source, fmt, timings)
+    return workbook_from_sheets(sheets, timings)
+
+
+def load_json_workbook(payload: dict) -> WorkbookData:
+    """Classeur transmis en JSON : {nom de feuille: lignes}.
+
+    Les feuilles sont nommées comme dans le classeur ("Dispo Période") ou
+    comme leurs fichiers ("dispo_periode", voir `SHEET_FILE_NAMES`) ; chaque
+    feuille est une liste d'objets (une ligne par objet, colonnes dans l'ordre
+    du premier) ou un objet {"columns": [...], "data": [[...], ...]}. Une
+    liste vide, sans colonnes, compte comme une feuille absente.
+    """
+    timings: dict[str, float] = {}
+    by_key = {_sheet_key(k): v for k, v in payload.items()}
+    sheets: dict[str, pd.DataFrame] = {}
+    for name in WORKBOOK_SHEETS:
+        rows = by_key.get(_sheet_key(name), by_key.get(SHEET_FILE_NAMES[name]))
+        if rows is None or (isinstance(rows, list) and not rows):
+            continue
+        t0 = time.perf_counter()
+        if isinstance(rows, dict):
+            sheets[name] = pd.DataFrame(rows.get("data", []), columns=rows.get("columns"))
+        else:
+            sheets[name] = pd.DataFrame(rows)
+        timings[name] = time.perf_counter() - t0
+    return workbook_from_sheets(sheets, timings)
+
+
+def workbook_from_sheets(
+    sheets: dict[str, pd.DataFrame], timings: dict[str, float] | None = None
+) -> WorkbookData:
+    """Valide et normalise des feuilles déjà lues, quelle que soit leur source."""
+    errors = validate_sheets(sheets)
+    if not errors:
+        _to_dates(sheets, "Dispo Période", "Date", errors)
+        _to_dates(sheets, "Gardes résidents", "date", errors)
+        _to_dates(sheets, PREV_SHEET, "Date", errors)
+
+    params, periods_ante = parse_params(sheets.get(PARAMS_SHEET))
+    dispo = sheets.get("Dispo Période")
+    return WorkbookData(
+        dispo=compact_dispo(dispo) if dispo is not None and not errors else dispo,
+        pointage=sheets.get("Pointage gardes"),
+        gardes=sheets.get("Gardes résidents"),
+        prev=sheets.get(PREV_SHEET),
+        params=params,
+        periods_ante=periods_ante,
+        errors=errors,
+        timings=timings or {},
+    )
+
+
+def compact_dispo(dispo_df: pd.DataFrame) -> pd.DataFrame:
+    """Colonnes médecins de "Dispo Période" en catégories (une poignée de valeurs
+    distinctes : OUI, PRN, NON...) au lieu d'une chaîne par cellule."""
+    meds = [c for c in dispo_df.columns if c not in BASE_DISPO_COLS]
+    return dispo_df.astype({m: "category" for m in meds})
+
+
+def write_sheet_files(sheets: dict[str, pd.DataFrame], target, fmt: str = "csv") -> list[str]:
+    """Écrit les feuilles d'un classeur en fichiers `fmt` dans le dossier `target`,
+    sous leurs noms courts (relisibles par `load_workbook`)."""
+    target = Path(target)
+    target.mkdir(parents=True, exist_ok=True)
+    suffix = EXPORT_FORMATS[fmt][0]
+    written = []
+    for name, df in sheets.items():
+        path = target / f"{SHEET_FILE_NAMES.get(name, name)}{suffix}"
+        path.write_bytes(table_bytes(df, fmt))
+        written.append(str(path))
+    return written
+
+
 # =========================
 # Template Excel
 # =========================
+def _template_pointage(
+    docs: list[str], pointage_df: pd.DataFrame | None, periods_ante: int, start_date: date
+) -> pd.DataFrame:
+    # Pointage repris d'une période précédente : médecins du modèle, dans l'ordre,
+    # avec leur score et les `periods_ante` dernières colonnes de périodes.
+    if pointage_df is None or "MD" not in pointage_df.columns:
+        return pd.DataFrame({"MD": docs, "Score actualisé": [0] * len(docs)})
+    prev = pointage_df.drop_duplicates("MD").set_index("MD")
+    if "Nouveau score" in prev.columns:
+        # pointage mis à jour : le nouveau score devient le score de départ
+        prev["Score actualisé"] = prev["Nouveau score"]
+    periods = [c for c in prev.columns if c not in _POINTAGE_EXCLUDED]
+    if "Période_actuelle" in prev.columns:
+        label = f"Jusqu'au {start_date - timedelta(days=1):%Y-%m-%d}"
+        prev = prev.drop(columns=[label], errors="ignore").rename(columns={"Période_actuelle": label})
+        periods = [c for c in periods if c != label] + [label]
+    periods = periods[len(periods) - periods_ante:] if periods_ante > 0 else []
+    out = prev.reindex(docs)[["Score actualisé", *periods]]
+    out["Score actualisé"] = pd.to_numeric(out["Score actualisé"], errors="coerce").fillna(0)
+    return out.rename_axis("MD").reset_index()
+
+
 def create_template_excel(
     start_date: date,
     num_weeks: int,
@@ -76,25 +429,26 @@ def create_template_excel(
     pts_we_res: int,
     pts_we_nores: int,
     doctors: list[str] | None = None,
+    pointage_df: pd.DataFrame | None = None,
 ) -> io.BytesIO:
-    docs = doctors if doctors else DEFAULT_DOCTORS.copy()
+    """Classeur modèle à remplir pour une période.
+
+    Avec `pointage_df` (pointage précédent ou mis à jour), la feuille "Pointage
+    gardes" est préremplie, et ses médecins servent de liste par défaut.
+    """
+    from xlsxwriter.utility import xl_col_to_name
+
+    if doctors:
+        docs = list(doctors)
+    elif pointage_df is not None and "MD" in pointage_df.columns and pointage_df["MD"].notna().any():
+        docs = pointage_df["MD"].dropna().astype(str).drop_duplicates().tolist()
+    else:
+        docs = DEFAULT_DOCTORS.copy()
     total_days = num_weeks * 7
     dates = [start_date + timedelta(days=i) for i in range(total_days)]
+    weekdays = [d.weekday() for d in dates]
 
-    dispo_rows = []
-    for d in dates:
-        dispo_rows.append(
-            {
-                "Jour": ["lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche"][d.weekday()],
-                "Moment": "Soir" if d.weekday() < 5 else "",
-                "Date": d,
-            }
-        )
-    dispo_df = pd.DataFrame(dispo_rows)
-    for m in docs:
-        dispo_df[m] = "PRN"
-
-    pt_df = pd.DataFrame({"MD": docs, "Score actualisé": [0] * len(docs)})
+    pt_df = _template_pointage(docs, pointage_df, periods_ante, start_date)
 
     gard_res_df = pd.DataFrame(
         {
@@ -127,30 +481,42 @@ def create_template_excel(
 
     output = io.BytesIO()
     with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        dispo_df.to_excel(writer, sheet_name="Dispo Période", index=False)
+        # Feuille la plus large (jours x médecins) : écrite ligne par ligne,
+        # sans passer par DataFrame.to_excel
+        ws_dispo = writer.book.add_worksheet("Dispo Période")
+        header = writer.book.add_format({"bold": True, "border": 1, "align": "center"})
+        date_fmt = writer.book.add_format({"num_format": "yyyy-mm-dd"})
+        ws_dispo.write_row(0, 0, [*BASE_DISPO_COLS, *docs], header)
+        prn = ["PRN"] * len(docs)
+        for r, (d, wd) in enumerate(zip(dates, weekdays), start=1):
+            ws_dispo.write_row(r, 0, [WEEKDAY_NAMES[wd], "Soir" if wd < 5 else ""])
+            ws_dispo.write_datetime(r, 2, datetime(d.year, d.month, d.day), date_fmt)
+            ws_dispo.write_row(r, 3, prn)
+
         pt_df.to_excel(writer, sheet_name="Pointage gardes", index=False)
         gard_res_df.to_excel(writer, sheet_name="Gardes résidents", index=False)
         prev_df.to_excel(writer, sheet_name=PREV_SHEET, index=False)
         params_df.to_excel(writer, sheet_name="Paramètres", index=False)
 
-        ws_dispo = writer.sheets["Dispo Période"]
-        for idx in range(3, 3 + len(docs)):
-            col = chr(ord("A") + idx)
+        # Une seule validation pour tout le bloc médecins (colonnes D et suivantes)
+        first, last = len(BASE_DISPO_COLS), len(BASE_DISPO_COLS) + len(docs) - 1
+        if docs and total_days:
             ws_dispo.data_validation(
-                f"{col}2:{col}{total_days + 1}",
-                {"validate": "list", "source": ["OUI", "PRN", "NON"]},
+                f"{xl_col_to_name(first)}2:{xl_col_to_name(last)}{total_days + 1}",
+                {"validate": "list", "source": DISPO_LABELS},
             )
 
         # Feuille Gardes résidents : colonne B = résident, colonne C = Points
         ws_res = writer.sheets["Gardes résidents"]
-        for i in range(total_days):
-            r = i + 2
-            formula = (
+        ws_res.write_column(
+            "C2",
+            [
                 f'=IF(B{r}<>"",'
-                f'IF(WEEKDAY(A{r},2)<=5,{pts_sem_res},{pts_we_res}),'
-                f'IF(WEEKDAY(A{r},2)<=5,{pts_sem_nores},{pts_we_nores}))'
-            )
-            ws_res.write_formula(f"C{r}", formula)
+                f"IF(WEEKDAY(A{r},2)<=5,{pts_sem_res},{pts_we_res}),"
+                f"IF(WEEKDAY(A{r},2)<=5,{pts_sem_nores},{pts_we_nores}))"
+                for r in range(2, total_days + 2)
+            ],
+        )
 
     output.seek(0)
     return output
@@ -159,278 +525,865 @@ def create_template_excel(
 # =========================
 # Calcul du pointage mis à jour
 # =========================
+_POINTAGE_EXCLUDED = {"MD", "Score actualisé", "Nouveau score", "Périodes_considerées", "Période_actuelle"}
+
+
+def _numeric_block(df: pd.DataFrame) -> np.ndarray:
+    """Convertit un bloc de colonnes en float en une fois (valeurs non numériques -> NaN)."""
+    out = np.full(df.shape, np.nan)
+    numeric = [j for j, dtype in enumerate(df.dtypes) if pd.api.types.is_numeric_dtype(dtype)]
+    others = [j for j in range(df.shape[1]) if j not in set(numeric)]
+    if numeric:
+        out[:, numeric] = df.iloc[:, numeric].to_numpy(dtype=float, na_value=np.nan)
+    if others:
+        flat = pd.Series(df.iloc[:, others].to_numpy(dtype=object).ravel())
+        converted = pd.to_numeric(flat, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+        out[:, others] = converted.reshape(len(df), len(others))
+    return out
+
+
+def update_pointage_batch(
+    pointage_df: pd.DataFrame,
+    plannings,
+    periods_ante: int = 12,
+):
+    """`update_pointage` pour plusieurs plannings (scénarios, services...) en un appel.
+
+    Le bloc historique (les `periods_ante` dernières colonnes de périodes) est
+    converti une seule fois, et les points de la période actuelle de tous les
+    plannings sont sommés en un seul groupby. `plannings` est une liste ou un
+    dictionnaire de plannings ; le résultat a la même forme.
+    """
+    items = list(plannings.items()) if isinstance(plannings, dict) else list(enumerate(plannings))
+    if "MD" not in pointage_df.columns:
+        outs = [pointage_df.copy() for _ in items]
+    else:
+        historical_cols = [c for c in pointage_df.columns if c not in _POINTAGE_EXCLUDED]
+        periods_ante = max(periods_ante, 0)
+        kept_cols = historical_cols[len(historical_cols) - periods_ante:] if periods_ante else []
+        hist = _numeric_block(pointage_df[kept_cols])
+        hist_present = (~np.isnan(hist)).sum(axis=1)
+        hist_total = np.nansum(hist, axis=1)
+
+        used = [
+            (k, p[["Médecin", "Points jour"]])
+            for k, (_, p) in enumerate(items)
+            if not p.empty and "Médecin" in p.columns
+        ]
+        if used:
+            current = (
+                pd.concat([p for _, p in used], keys=[k for k, _ in used], names=["run", None])
+                .groupby(["run", "Médecin"], observed=True)["Points jour"]
+                .sum()
+            )
+            runs_with_points = set(current.index.get_level_values("run"))
+        else:
+            runs_with_points = set()
+
+        outs = []
+        for k in range(len(items)):
+            out = pointage_df.copy()
+            current_points = current.loc[k].to_dict() if k in runs_with_points else {}
+            out["Période_actuelle"] = out["MD"].map(current_points).fillna(0)
+
+            now = pd.to_numeric(out["Période_actuelle"], errors="coerce").to_numpy(dtype=float)
+            periods_present = pd.Series(hist_present + ~np.isnan(now), index=out.index)
+            total_points = pd.Series(hist_total + np.nan_to_num(now), index=out.index)
+
+            out["Périodes_considerées"] = periods_present
+            # Le score précédent sert de valeur par défaut ; une colonne entière est
+            # élargie en float pour pouvoir recevoir les moyennes.
+            if "Score actualisé" in out.columns:
+                new_score = out["Score actualisé"].copy()
+                is_num = pd.api.types.is_numeric_dtype(new_score)
+                new_score = new_score.astype(float if is_num else object)
+            else:
+                new_score = pd.Series(0.0, index=out.index)
+            mask = periods_present > 0
+            new_score[mask] = total_points[mask] / periods_present[mask]
+            out["Nouveau score"] = new_score
+            outs.append(out)
+
+    if isinstance(plannings, dict):
+        return {key: out for (key, _), out in zip(items, outs)}
+    return outs
+
+
 def update_pointage(
     pointage_df: pd.DataFrame,
     planning_df: pd.DataFrame,
     periods_ante: int = 12,
 ) -> pd.DataFrame:
-    out = pointage_df.copy()
-    if "MD" not in out.columns:
-        return out
+    return update_pointage_batch(pointage_df, [planning_df], periods_ante=periods_ante)[0]
 
-    current_points = (
-        planning_df.groupby("Médecin")["Points jour"].sum().to_dict()
-        if not planning_df.empty and "Médecin" in planning_df.columns
-        else {}
-    )
 
-    out["Période_actuelle"] = out["MD"].map(current_points).fillna(0)
+# =========================
+# Mesures de performance
+# =========================
+class PhaseProfiler:
+    """Temps cumulé, nombre d'appels et lignes traitées, par phase."""
+
+    def __init__(self):
+        self.phases: dict[str, dict] = {}
+
+    @contextmanager
+    def phase(self, name: str, rows: int = 0):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0, rows)
+
+    def add(self, name: str, seconds: float, rows: int = 0) -> None:
+        stats = self.phases.setdefault(name, {"secondes": 0.0, "appels": 0, "lignes": 0})
+        stats["secondes"] += seconds
+        stats["appels"] += 1
+        stats["lignes"] += int(rows)
+
+    def merge(self, other: "PhaseProfiler", prefix: str = "") -> None:
+        for name, stats in other.phases.items():
+            mine = self.phases.setdefault(prefix + name, {"secondes": 0.0, "appels": 0, "lignes": 0})
+            for k in mine:
+                mine[k] += stats[k]
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            [{"Phase": name, **stats} for name, stats in self.phases.items()],
+            columns=["Phase", "secondes", "appels", "lignes"],
+        )
+
+    def to_json(self) -> str:
+        return json.dumps(self.phases, ensure_ascii=False, indent=2)
+
+    def log(self, level: int = logging.INFO) -> None:
+        for name, stats in self.phases.items():
+            logger.log(
+                level,
+                "%s : %.1f ms, %d appel(s), %d ligne(s)",
+                name,
+                stats["secondes"] * 1000,
+                stats["appels"],
+                stats["lignes"],
+            )
 
-    excluded = {"MD", "Score actualisé", "Nouveau score", "Périodes_considerées"}
-    historical_cols = [c for c in out.columns if c not in excluded and c != "Période_actuelle"]
 
-    if periods_ante < 0:
-        periods_ante = 0
+class _NoProfiler:
+    @contextmanager
+    def phase(self, name: str, rows: int = 0):
+        yield
 
-    kept_historical_cols = historical_cols[-periods_ante:] if historical_cols else []
-    cols_for_average = kept_historical_cols + ["Période_actuelle"]
+    def add(self, name: str, seconds: float, rows: int = 0) -> None:
+        pass
 
-    numeric_df = pd.DataFrame(index=out.index)
-    for col in cols_for_average:
-        numeric_df[col] = pd.to_numeric(out[col], errors="coerce")
 
-    periods_present = numeric_df.notna().sum(axis=1)
-    total_points = numeric_df.sum(axis=1, skipna=True)
+_NO_PROFILER = _NoProfiler()
 
-    out["Périodes_considerées"] = periods_present
-    out["Nouveau score"] = out.get("Score actualisé", 0)
-    mask = periods_present > 0
-    out.loc[mask, "Nouveau score"] = total_points[mask] / periods_present[mask]
 
-    return out
+class PlanningCancelled(Exception):
+    """Calcul interrompu par `JobProgress.cancel`."""
 
-    current_points = (
-        planning_df.groupby("Médecin")["Points jour"].sum().to_dict()
-        if not planning_df.empty and "Médecin" in planning_df.columns
-        else {}
-    )
 
-    out["Période_actuelle"] = out["MD"].map(current_points).fillna(0)
+class JobProgress:
+    """Avancement d'un calcul (étape -> fait, total), écrit par le thread de calcul
+    et lu par l'interface.
 
-    # Colonnes historiques numériques utilisables pour le recalcul
-    excluded = {"MD", "Score actualisé", "Nouveau score"}
-    candidate_cols = [c for c in out.columns if c not in excluded]
+    Après `cancel`, le prochain `update` ou `check` lève `PlanningCancelled` :
+    le calcul s'arrête au week-end ou au jour suivant. Les `keep` dernières
+    attributions décidées sont gardées pour l'affichage (`recent`).
+    """
 
-    numeric_df = pd.DataFrame(index=out.index)
-    for col in candidate_cols:
-        numeric_df[col] = pd.to_numeric(out[col], errors="coerce")
+    def __init__(self, keep: int = 10):
+        self.steps: dict[str, tuple[int, int]] = {}
+        self._cancelled = threading.Event()
+        self._recent: deque = deque(maxlen=keep)
 
-    n_periods = numeric_df.notna().sum(axis=1)
-    total_points = numeric_df.sum(axis=1, skipna=True)
+    def update(self, step: str, done: int, total: int) -> None:
+        self.check()
+        self.steps[step] = (done, total)
 
-    out["Nouveau score"] = out["Score actualisé"]
-    mask = n_periods > 0
-    out.loc[mask, "Nouveau score"] = total_points[mask] / n_periods[mask]
+    def check(self) -> None:
+        if self._cancelled.is_set():
+            raise PlanningCancelled("Calcul annulé")
 
-    return out
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def snapshot(self) -> dict[str, tuple[int, int]]:
+        return dict(self.steps)
+
+    def decided(self, record: dict) -> None:
+        self._recent.append(record)
+
+    def recent(self) -> list[dict]:
+        return list(self._recent)
+
+
+class _NoProgress:
+    def update(self, step: str, done: int, total: int) -> None:
+        pass
+
+    def decided(self, record: dict) -> None:
+        pass
+
+    def check(self) -> None:
+        pass
+
+
+_NO_PROGRESS = _NoProgress()
+
+
+# =========================
+# Matrice de disponibilités
+# =========================
+@dataclass
+class DispoMatrix:
+    """Disponibilités encodées une seule fois (lignes = dates, colonnes = médecins)."""
+
+    dates: list
+    meds: list
+    codes: np.ndarray
+    labels: list[str]
+    row_of: dict
+    col_of: dict
+
+    def statut(self, row: int, col: int) -> str:
+        return self.labels[self.codes[row, col]]
+
+
+def build_dispo_matrix(df: pd.DataFrame, meds: list) -> DispoMatrix:
+    """Encode les cellules médecins de `df` en codes int8 (OUI/PRN/NON/autres).
+
+    Chaque cellule est normalisée comme `str(x).strip().upper()`, mais une
+    seule fois par valeur distincte et par colonne.
+    """
+    labels = list(DISPO_LABELS)
+    label_code = {lab: i for i, lab in enumerate(labels)}
+    codes = np.empty((len(df), len(meds)), dtype=np.int16)
+
+    def code_of(value) -> int:
+        lab = str(value).strip().upper()
+        if lab not in label_code:
+            label_code[lab] = len(labels)
+            labels.append(lab)
+        return label_code[lab]
+
+    for j, m in enumerate(meds):
+        values = df[m].to_numpy(dtype=object)
+        col_codes, uniques = pd.factorize(values)
+        lookup = np.array([code_of(u) for u in uniques], dtype=np.int16)
+        codes[:, j] = lookup[col_codes] if len(uniques) else 0
+        # None, NaN, NaT... ne s'écrivent pas pareil : traitées cellule par cellule
+        for i in np.flatnonzero(col_codes < 0):
+            codes[i, j] = code_of(values[i])
+    if len(labels) <= np.iinfo(np.int8).max:
+        codes = codes.astype(np.int8)
+
+    dates = list(df["Date"])
+    row_of = {}
+    for i, d in enumerate(dates):
+        row_of.setdefault(d, i)
+    return DispoMatrix(
+        dates=dates,
+        meds=list(meds),
+        codes=codes,
+        labels=labels,
+        row_of=row_of,
+        col_of={m: j for j, m in enumerate(meds)},
+    )
+
+
+class ShiftHistory:
+    """Gardes déjà attribuées, triées par médecin (dates en nanosecondes).
+
+    Répond en temps logarithmique à « ce médecin a-t-il une garde à moins
+    de `seuil` jours ? », avec la même règle que `abs((d - x).days) < seuil`.
+    """
+
+    def __init__(self):
+        self._by_med: dict = defaultdict(list)
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._by_med.values())
+
+    def add(self, md, d) -> None:
+        if pd.isna(d):
+            return
+        insort(self._by_med[md], pd.Timestamp(d).value)
+
+    def discard(self, md, d) -> None:
+        shifts = self._by_med.get(md)
+        if not shifts or pd.isna(d):
+            return
+        v = pd.Timestamp(d).value
+        i = bisect_left(shifts, v)
+        if i < len(shifts) and shifts[i] == v:
+            del shifts[i]
+
+    def is_near(self, md, d, seuil: int) -> bool:
+        shifts = self._by_med.get(md)
+        if not shifts or pd.isna(d):
+            return False
+        return self.is_near_ns(md, pd.Timestamp(d).value, seuil)
+
+    def is_near_ns(self, md, v: int, seuil: int) -> bool:
+        """`is_near` pour une date déjà convertie en nanosecondes."""
+        shifts = self._by_med.get(md)
+        if not shifts:
+            return False
+        # abs(floor(d - x)) < seuil  <=>  d - seuil < x <= d + seuil - 1 (en jours)
+        i = bisect_right(shifts, v - seuil * _DAY_NS)
+        return i < len(shifts) and shifts[i] <= v + (seuil - 1) * _DAY_NS
+
+    def near(self, md, d, seuil: int) -> list[int]:
+        """Gardes (en ns) de `md` qui bloquent la date `d`."""
+        shifts = self._by_med.get(md)
+        if not shifts or pd.isna(d):
+            return []
+        v = pd.Timestamp(d).value
+        lo = bisect_right(shifts, v - seuil * _DAY_NS)
+        hi = bisect_right(shifts, v + (seuil - 1) * _DAY_NS)
+        return shifts[lo:hi]
+
+    def copy(self) -> "ShiftHistory":
+        other = ShiftHistory()
+        other._by_med.update({md: list(v) for md, v in self._by_med.items()})
+        return other
+
+
+def _weekend_tier(n_oui: int, n_prn: int, n_non: int) -> int:
+    # priorité explicite sur le bloc week-end
+    if n_oui == 3:
+        return 0
+    if n_oui == 2 and n_prn == 1:
+        return 1
+    if n_oui == 2 and n_non == 1:
+        return 2
+    if n_oui == 1 and n_prn == 2:
+        return 3
+    if n_oui == 1 and n_prn == 1 and n_non == 1:
+        return 4
+    if n_prn == 3:
+        return 5
+    if n_prn == 2 and n_non == 1:
+        return 6
+    if n_prn == 1 and n_non == 2:
+        return 7
+    return 8
 
 
 # =========================
 # Attribution des gardes
 # =========================
-def generate_planning(
-    dispo_df: pd.DataFrame,
-    pointage_df: pd.DataFrame,
-    gardes_df: pd.DataFrame,
-    prev_df: pd.DataFrame | None = None,
-    seuil_proximite: int = 6,
-    max_weekends: int = 1,
-    bonus_oui: int = 5,
-    periods_ante: int = 12,
-):
+def guard_days(dispo_df: pd.DataFrame) -> pd.DataFrame:
+    """Lignes de "Dispo Période" à couvrir : soirs de semaine et jours de week-end."""
     dispo = dispo_df.copy()
     dispo["Date"] = pd.to_datetime(dispo["Date"])
-
-    meds = [c for c in dispo.columns if c not in BASE_DISPO_COLS]
-
     mask = (
         (dispo["Moment"].fillna("").astype(str).str.lower() == "soir")
         | (dispo["Date"].dt.weekday >= 5)
     )
-    df = dispo[mask].copy()
+    return dispo[mask].reset_index(drop=True)
+
+
+@dataclass
+class PreparedPlanning:
+    """Entrées pré-traitées une fois, indépendamment des paramètres d'attribution.
+
+    Une ligne par jour de garde (soirs de semaine et jours de week-end).
+    """
+
+    meds: list
+    matrix: DispoMatrix
+    points: np.ndarray
+    we_id: list
+    pts_map: dict
+
+    @property
+    def dates(self) -> list:
+        return self.matrix.dates
+
+
+@dataclass
+class PlanningState:
+    """État qui évolue pendant l'attribution : scores, gardes, week-ends par médecin.
+
+    `shared` : gardes des médecins partagés sur les autres sites (déjà
+    incluses dans `history`), qui excluent aussi ces médecins des blocs
+    week-end trop proches.
+    """
+
+    scores: dict
+    history: ShiftHistory
+    we_count: defaultdict
+    assigned_dates: set
+    shared: ShiftHistory = field(default_factory=ShiftHistory)
+
+    def copy(self) -> "PlanningState":
+        return PlanningState(
+            scores=dict(self.scores),
+            history=self.history.copy(),
+            we_count=defaultdict(int, self.we_count),
+            assigned_dates=set(self.assigned_dates),
+            shared=self.shared.copy(),
+        )
+
+
+def _week_id(d):
+    wd = d.weekday()
+    if wd == 4:
+        return d
+    if wd == 5:
+        return d - timedelta(days=1)
+    if wd == 6:
+        return d - timedelta(days=2)
+    return None
+
+
+def prepare_planning(dispo_df: pd.DataFrame, gardes_df: pd.DataFrame) -> PreparedPlanning:
+    df = guard_days(dispo_df)
+    meds = [c for c in df.columns if c not in BASE_DISPO_COLS]
 
     grd = gardes_df.copy()
     grd["date"] = pd.to_datetime(grd["date"])
     grd["Points"] = pd.to_numeric(grd["Points"], errors="coerce").fillna(0)
     pts_map = grd.set_index("date")["Points"].to_dict()
 
-    df["Points jour"] = df["Date"].map(pts_map).fillna(0).astype(float)
-
-    for s in ["OUI", "PRN", "NON"]:
-        df[f"nb_{s}"] = df[meds].apply(
-            lambda row: sum(str(x).strip().upper() == s for x in row), axis=1
-        )
+    # vendredi/samedi/dimanche -> date du vendredi, autres jours -> NaT
+    weekday = df["Date"].dt.weekday
+    we_id = (df["Date"] - pd.to_timedelta(weekday - 4, unit="D")).where(weekday >= 4)
 
-    def week_id(d):
-        wd = d.weekday()
-        if wd == 4:
-            return d
-        if wd == 5:
-            return d - timedelta(days=1)
-        if wd == 6:
-            return d - timedelta(days=2)
-        return None
+    return PreparedPlanning(
+        meds=meds,
+        matrix=build_dispo_matrix(df, meds),
+        points=df["Date"].map(pts_map).fillna(0).astype(float).to_numpy(),
+        we_id=list(we_id),
+        pts_map=pts_map,
+    )
 
-    df["we_id"] = df["Date"].apply(week_id)
 
+def initial_state(pointage_df: pd.DataFrame, prev_df: pd.DataFrame | None = None) -> PlanningState:
     pointage_local = pointage_df.copy()
     pointage_local["Score actualisé"] = pd.to_numeric(
         pointage_local["Score actualisé"], errors="coerce"
     ).fillna(0)
     scores = pointage_local.set_index("MD")["Score actualisé"].to_dict()
-    history = defaultdict(list)
+    history = ShiftHistory()
     we_count = defaultdict(int)
 
     if prev_df is not None and not prev_df.empty:
         prev_local = prev_df.copy()
         prev_local["Date"] = pd.to_datetime(prev_local["Date"])
-        for _, r in prev_local.iterrows():
-            md = r.get("Médecin")
-            dt = r.get("Date")
+        for md, dt in zip(prev_local["Médecin"], prev_local["Date"]):
             if pd.isna(md) or pd.isna(dt):
                 continue
-            history[md].append(dt)
-            wid = week_id(dt)
-            if wid is not None:
+            history.add(md, dt)
+            if _week_id(dt) is not None:
                 we_count[md] += 1
 
-    plans = []
-    logs = []
+    return PlanningState(scores=scores, history=history, we_count=we_count, assigned_dates=set())
 
-    # Week-ends : attribution groupée vendredi-samedi-dimanche
-    weekend_groups = []
-    for wid, group in df[df["we_id"].notna()].groupby("we_id"):
-        dates = sorted(group["Date"])
-        hardest_row = group.sort_values(["nb_NON", "Date"], ascending=[False, True]).iloc[0]
-        weekend_groups.append(
+
+def add_shared_assignments(state: PlanningState, shared_df: pd.DataFrame) -> None:
+    """Prend en compte les gardes attribuées sur d'autres sites aux médecins partagés.
+
+    Elles bloquent la proximité comme l'historique, y compris pour les blocs
+    week-end (voir `_shared_blocked`), et chaque week-end tenu
+    ailleurs compte une fois dans le plafond `max_weekends` (lignes de Type
+    "WE", ou jours de week-end si la colonne Type est absente).
+    """
+    if shared_df is None or shared_df.empty:
+        return
+    dates = pd.to_datetime(shared_df["Date"])
+    is_we = shared_df["Type"].eq("WE") if "Type" in shared_df.columns else None
+    weekends = set()
+    for i, (md, d) in enumerate(zip(shared_df["Médecin"], dates)):
+        if pd.isna(md) or pd.isna(d):
+            continue
+        state.history.add(md, d)
+        state.shared.add(md, d)
+        wk = _week_id(d)
+        if wk is not None and (is_we is None or is_we.iat[i]):
+            weekends.add((md, wk.normalize()))
+    for md, _ in weekends:
+        state.we_count[md] += 1
+
+
+def _weekend_groups(prep: PreparedPlanning) -> list[dict]:
+    """Blocs vendredi-samedi-dimanche, du plus difficile (plus de NON) au plus facile."""
+    nb_non = (prep.matrix.codes == DISPO_NON).sum(axis=1)
+    rows_by_wid = defaultdict(list)
+    for i, wid in enumerate(prep.we_id):
+        if not pd.isna(wid):
+            rows_by_wid[wid].append(i)
+
+    groups = []
+    for wid in sorted(rows_by_wid):
+        rows = rows_by_wid[wid]
+        hardest = min(rows, key=lambda i: (-nb_non[i], prep.dates[i]))
+        groups.append(
             {
                 "wid": wid,
-                "group": group,
-                "dates": dates,
-                "hardest_date": hardest_row["Date"],
-                "hardest_non": int(hardest_row["nb_NON"]),
+                "dates": sorted(prep.dates[i] for i in rows),
+                "hardest_date": prep.dates[hardest],
+                "hardest_non": int(nb_non[hardest]),
             }
         )
 
     # On attribue d'abord les week-ends les plus difficiles
-    weekend_groups = sorted(
-        weekend_groups,
-        key=lambda x: (-x["hardest_non"], x["hardest_date"]),
-    )
-
-    for weekend_info in weekend_groups:
-        wid = weekend_info["wid"]
-        group = weekend_info["group"]
-        dates = weekend_info["dates"]
-        hardest_date = weekend_info["hardest_date"]
-        hardest_non = weekend_info["hardest_non"]
-
-        # 1) candidats respectant le cap de week-end
-        eligible = [m for m in meds if we_count[m] < max_weekends]
-        if not eligible:
+    return sorted(groups, key=lambda x: (-x["hardest_non"], x["hardest_date"]))
+
+
+def _simple_order(prep: PreparedPlanning) -> np.ndarray:
+    """Lignes des jours simples, les moins demandées (peu de OUI/PRN) en premier."""
+    codes = prep.matrix.codes
+    rows = np.array([i for i, wid in enumerate(prep.we_id) if pd.isna(wid)], dtype=np.intp)
+    nb_oui = (codes[rows] == DISPO_OUI).sum(axis=1)
+    nb_prn = (codes[rows] == DISPO_PRN).sum(axis=1)
+    return rows[np.lexsort((prep.points[rows], nb_prn, nb_oui))]
+
+
+def _weekend_candidates(prep: PreparedPlanning, rows: list[int], eligible: list) -> list[dict]:
+    """Candidats d'un bloc week-end : tous sauf ceux qui sont NON sur tout le bloc."""
+    matrix = prep.matrix
+    block = matrix.codes[np.ix_(rows, [matrix.col_of[m] for m in eligible])]
+    counts_oui = (block == DISPO_OUI).sum(axis=0)
+    counts_prn = (block == DISPO_PRN).sum(axis=0)
+    counts_non = (block == DISPO_NON).sum(axis=0)
+
+    candidates = []
+    for k, m in enumerate(eligible):
+        n_oui, n_prn, n_non = int(counts_oui[k]), int(counts_prn[k]), int(counts_non[k])
+        if n_non == len(rows):
+            continue
+        candidates.append(
+            {
+                "md": m,
+                "tier": _weekend_tier(n_oui, n_prn, n_non),
+                "n_oui": n_oui,
+                "n_prn": n_prn,
+                "n_non": n_non,
+            }
+        )
+    return candidates
+
+
+def _shared_blocked(state: PlanningState, meds: list, dates: list, seuil: int) -> set:
+    """Médecins dont une garde sur un autre site est à moins de `seuil` jours
+    d'une date du bloc : ils ne peuvent pas le tenir."""
+    if not len(state.shared):
+        return set()
+    return {m for m in meds if any(state.shared.is_near(m, d, seuil) for d in dates)}
+
+
+def _weekend_block_stats(prep: PreparedPlanning, groups: list[dict]) -> dict:
+    """Comptes OUI/PRN/NON et tier de chaque médecin sur chaque bloc week-end,
+    calculés une seule fois (tableaux blocs x médecins, colonnes dans l'ordre de `meds`)."""
+    matrix = prep.matrix
+    cols = [matrix.col_of[m] for m in prep.meds]
+    rows = [[matrix.row_of[d] for d in g["dates"]] for g in groups]
+    shape = (len(groups), len(cols))
+    n_oui, n_prn, n_non = (np.zeros(shape, dtype=np.int16) for _ in range(3))
+    for g, block_rows in enumerate(rows):
+        block = matrix.codes[np.ix_(block_rows, cols)]
+        n_oui[g] = (block == DISPO_OUI).sum(axis=0)
+        n_prn[g] = (block == DISPO_PRN).sum(axis=0)
+        n_non[g] = (block == DISPO_NON).sum(axis=0)
+    tier = np.vectorize(_weekend_tier, otypes=[np.int16])(n_oui, n_prn, n_non) if n_oui.size else n_oui
+    lengths = np.array([len(r) for r in rows], dtype=np.int16).reshape(-1, 1)
+    return {
+        "rows": rows,
+        "n_oui": n_oui,
+        "n_prn": n_prn,
+        "n_non": n_non,
+        "tier": tier,
+        # candidat = pas NON sur tout le bloc
+        "usable": n_non < lengths,
+    }
+
+
+def _assign_weekends_dynamic(
+    prep: PreparedPlanning,
+    state: PlanningState,
+    groups: list[dict],
+    max_weekends: int,
+    bonus_oui: int,
+    seuil_proximite: int,
+    profiler=None,
+    progress=None,
+) -> Iterator[dict]:
+    """Week-ends attribués du plus contraint au moins contraint, en continu.
+
+    Une file de priorité garde chaque bloc restant sous la clé (candidats sans
+    NON sous le cap, puis candidats sous le cap, puis difficulté statique) ;
+    quand un médecin atteint `max_weekends`, seuls les blocs où il était
+    candidat sont remis à jour (entrées périmées ignorées au dépilage). Les
+    blocs qui n'ont plus que des candidats avec NON passent après les autres,
+    et ceux sans aucun candidat sous le cap retombent sur tous les candidats.
+    """
+    meds = prep.meds
+    scores = state.scores
+    prof = profiler or _NO_PROFILER
+    progress = progress or _NO_PROGRESS
+    with prof.phase("Comptes des blocs week-end", rows=len(groups)):
+        stats = _weekend_block_stats(prep, groups)
+    usable = stats["usable"]
+    blocked = np.zeros(len(groups), dtype=bool)
+    if len(state.shared):
+        col = {m: j for j, m in enumerate(meds)}
+        for g, info in enumerate(groups):
+            for m in _shared_blocked(state, meds, info["dates"], seuil_proximite):
+                usable[g, col[m]] = False
+                blocked[g] = True
+    clean = usable & (stats["n_non"] == 0)
+    capped = np.array([state.we_count[m] >= max_weekends for m in meds], dtype=bool)
+    n_eligible = (usable & ~capped).sum(axis=1)
+    n_clean = (clean & ~capped).sum(axis=1)
+
+    def key(g):
+        return (n_eligible[g] == 0, n_clean[g] == 0, int(n_clean[g]), int(n_eligible[g]), g)
+
+    heap = [(key(g), g) for g in range(len(groups))]
+    heapify(heap)
+    done = np.zeros(len(groups), dtype=bool)
+    n_done = 0
+    while heap:
+        k, g = heappop(heap)
+        if done[g] or k != key(g):
+            continue
+        progress.update("Week-ends", n_done, len(groups))
+        done[g] = True
+        n_done += 1
+        candidates = np.flatnonzero(usable[g] & ~capped)
+        if not len(candidates):
             # fallback si le cap bloque tout
-            eligible = meds.copy()
-
-        candidate_rows = []
-        for m in eligible:
-            stats = [
-                str(group.loc[group["Date"] == d, m].iloc[0]).strip().upper()
-                for d in dates
-            ]
-            if stats.count("NON") == len(stats):
+            candidates = np.flatnonzero(usable[g])
+            if not len(candidates):
+                if blocked[g]:
+                    yield from _unfilled_weekend_records(prep, state, groups[g])
                 continue
 
-            n_oui = stats.count("OUI")
-            n_prn = stats.count("PRN")
-            n_non = stats.count("NON")
-            base_score = scores.get(m, 0)
-
-            # priorité explicite sur le bloc week-end
-            if n_oui == 3:
-                tier = 0
-            elif n_oui == 2 and n_prn == 1:
-                tier = 1
-            elif n_oui == 2 and n_non == 1:
-                tier = 2
-            elif n_oui == 1 and n_prn == 2:
-                tier = 3
-            elif n_oui == 1 and n_prn == 1 and n_non == 1:
-                tier = 4
-            elif n_prn == 3:
-                tier = 5
-            elif n_prn == 2 and n_non == 1:
-                tier = 6
-            elif n_prn == 1 and n_non == 2:
-                tier = 7
-            else:
-                tier = 8
-
-            # score secondaire : favoriser les OUI mais garder l'équité
-            adjusted_score = base_score - n_oui * bonus_oui
-
-            candidate_rows.append(
-                {
-                    "md": m,
-                    "tier": tier,
-                    "adjusted_score": adjusted_score,
-                    "base_score": base_score,
-                    "stats": stats,
-                    "n_oui": n_oui,
-                    "n_prn": n_prn,
-                    "n_non": n_non,
-                }
+        with prof.phase("Score des candidats week-end", rows=len(candidates)):
+            j = min(
+                candidates,
+                key=lambda j: (
+                    stats["tier"][g, j],
+                    scores.get(meds[j], 0) - stats["n_oui"][g, j] * bonus_oui,
+                    scores.get(meds[j], 0),
+                ),
             )
-
-        if not candidate_rows:
-            continue
-
-        # tri principal = qualité globale du week-end, tri secondaire = équité/bonus OUI
-        candidate_rows = sorted(
-            candidate_rows,
-            key=lambda x: (x["tier"], x["adjusted_score"], x["base_score"]),
-        )
-        best = candidate_rows[0]
-        sel = best["md"]
-        we_count[sel] += 1
-
-        for d in dates:
-            disp = str(df.loc[df["Date"] == d, sel].iloc[0]).strip().upper()
-            prev_sc = scores.get(sel, 0)
-            pts = pts_map.get(d, 0)
-            scores[sel] = prev_sc + pts
-            history[sel].append(d)
-            rec = {
+        best = {
+            "md": meds[j],
+            "tier": int(stats["tier"][g, j]),
+            "n_oui": int(stats["n_oui"][g, j]),
+            "n_prn": int(stats["n_prn"][g, j]),
+            "n_non": int(stats["n_non"][g, j]),
+        }
+        yield from _weekend_records(prep, state, groups[g], stats["rows"][g], best)
+
+        if not capped[j] and state.we_count[meds[j]] >= max_weekends:
+            capped[j] = True
+            for h in np.flatnonzero(usable[:, j] & ~done):
+                n_eligible[h] -= 1
+                n_clean[h] -= clean[h, j]
+                heappush(heap, (key(h), h))
+
+
+def _weekend_records(prep, state, weekend_info, rows, best) -> list[dict]:
+    sel = best["md"]
+    sel_col = prep.matrix.col_of[sel]
+    state.we_count[sel] += 1
+    records = []
+    for d, r in zip(weekend_info["dates"], rows):
+        prev_sc = state.scores.get(sel, 0)
+        pts = prep.pts_map.get(d, 0)
+        state.scores[sel] = prev_sc + pts
+        state.history.add(sel, d)
+        if not pd.isna(d):
+            state.assigned_dates.add(d)
+        records.append(
+            {
                 "Date": d,
                 "Médecin": sel,
-                "Statut": disp,
+                "Statut": prep.matrix.statut(r, sel_col),
                 "Points jour": pts,
                 "Score avant": prev_sc,
-                "Score après": scores[sel],
+                "Score après": state.scores[sel],
                 "Type": "WE",
                 "Weekend_tier": best["tier"],
                 "Weekend_oui": best["n_oui"],
                 "Weekend_prn": best["n_prn"],
                 "Weekend_non": best["n_non"],
-                "Weekend_hardest_date": hardest_date,
-                "Weekend_hardest_non": hardest_non,
+                "Weekend_hardest_date": weekend_info["hardest_date"],
+                "Weekend_hardest_non": weekend_info["hardest_non"],
             }
-            plans.append(rec)
-            logs.append(rec.copy())
+        )
+    return records
 
-    # Jours simples
-    simple = df[df["we_id"].isna()].sort_values(["nb_OUI", "nb_PRN", "Points jour"])
 
-    for _, row in simple.iterrows():
-        d = row["Date"]
-        if any(p["Date"] == d for p in plans):
+def _unfilled_weekend_records(prep, state, weekend_info) -> list[dict]:
+    """Bloc week-end dont tous les candidats sont pris sur un autre site :
+    ses jours restent non attribués."""
+    records = []
+    for d in weekend_info["dates"]:
+        if not pd.isna(d):
+            state.assigned_dates.add(d)
+        records.append(
+            {
+                "Date": d,
+                "Médecin": None,
+                "Statut": None,
+                "Points jour": prep.pts_map.get(d, 0),
+                "Score avant": None,
+                "Score après": None,
+                "Type": "WE",
+                "Weekend_tier": None,
+                "Weekend_oui": None,
+                "Weekend_prn": None,
+                "Weekend_non": None,
+                "Weekend_hardest_date": weekend_info["hardest_date"],
+                "Weekend_hardest_non": weekend_info["hardest_non"],
+            }
+        )
+    return records
+
+
+def _simple_record(state, d, pts, sel, sel_disp) -> dict:
+    prev_sc = state.scores.get(sel, 0) if sel else None
+    if sel:
+        state.scores[sel] = prev_sc + pts
+        state.history.add(sel, d)
+    if not pd.isna(d):
+        state.assigned_dates.add(d)
+    return {
+        "Date": d,
+        "Médecin": sel,
+        "Statut": sel_disp,
+        "Points jour": pts,
+        "Score avant": prev_sc,
+        "Score après": state.scores.get(sel),
+        "Type": "Simple",
+    }
+
+
+def _lock_assignments(state: PlanningState, locked: list[dict]) -> None:
+    """Intègre à l'état des attributions déjà décidées (re-planification incrémentale)."""
+    locked_weekends = set()
+    for rec in locked:
+        md, d = rec["Médecin"], rec["Date"]
+        if pd.isna(md) or pd.isna(d):
+            continue
+        state.scores[md] = state.scores.get(md, 0) + rec["Points jour"]
+        state.history.add(md, d)
+        state.assigned_dates.add(d)
+        wid = _week_id(d)
+        if wid is not None and rec.get("Type") == "WE":
+            locked_weekends.add((md, wid))
+    for md, _ in locked_weekends:
+        state.we_count[md] += 1
+
+
+def _iter_shifts(
+    prep: PreparedPlanning,
+    state: PlanningState,
+    seuil_proximite: int,
+    max_weekends: int,
+    bonus_oui: int,
+    only_dates: set | None = None,
+    profiler: "PhaseProfiler | None" = None,
+    weekend_order: str = "static",
+    progress: JobProgress | None = None,
+) -> Iterator[dict]:
+    """Attribution gloutonne : blocs week-end puis jours simples.
+
+    Génère les attributions dans l'ordre où elles sont décidées, dès qu'elles
+    le sont ; `state` est mis à jour au fil de l'eau. `only_dates` : si fourni, seuls ces jours
+    (et les blocs week-end qui les contiennent) sont attribués.
+    `weekend_order` : "static" (plus de NON d'abord, ordre fixé au départ) ou
+    "dynamic" (moins de candidats restants d'abord, voir
+    `_assign_weekends_dynamic`). `progress` reçoit le nombre de week-ends et
+    de jours simples traités (voir `JobProgress`).
+    """
+    meds = prep.meds
+    matrix = prep.matrix
+    scores = state.scores
+    prof = profiler or _NO_PROFILER
+    progress = progress or _NO_PROGRESS
+
+    with prof.phase("Regroupement et tri des week-ends", rows=len(matrix.dates)):
+        weekend_groups = _weekend_groups(prep)
+        if only_dates is not None:
+            weekend_groups = [
+                g for g in weekend_groups if any(d in only_dates for d in g["dates"])
+            ]
+
+    n_weekends = len(weekend_groups)
+    progress.update("Week-ends", 0, n_weekends)
+    progress.update("Jours simples", 0, sum(1 for wid in prep.we_id if pd.isna(wid)))
+    if weekend_order == "dynamic":
+        yield from _assign_weekends_dynamic(
+            prep, state, weekend_groups, max_weekends, bonus_oui, seuil_proximite,
+            profiler, progress,
+        )
+        weekend_groups = []
+
+    # Week-ends : attribution groupée vendredi-samedi-dimanche
+    for k, weekend_info in enumerate(weekend_groups):
+        progress.update("Week-ends", k, n_weekends)
+        dates = weekend_info["dates"]
+
+        # 1) candidats respectant le cap de week-end, hors médecins pris sur
+        # un autre site à proximité du bloc
+        blocked = _shared_blocked(state, meds, dates, seuil_proximite)
+        free = [m for m in meds if m not in blocked]
+        eligible = [m for m in free if state.we_count[m] < max_weekends]
+        if not eligible:
+            # fallback si le cap bloque tout
+            eligible = free
+
+        rows = [matrix.row_of[d] for d in dates]
+        with prof.phase("Score des candidats week-end", rows=len(eligible)):
+            candidate_rows = _weekend_candidates(prep, rows, eligible)
+            # tri principal = qualité globale du week-end, tri secondaire = équité/bonus OUI
+            # (score ajusté : favoriser les OUI mais garder l'équité)
+            best = min(
+                candidate_rows,
+                key=lambda x: (
+                    x["tier"],
+                    scores.get(x["md"], 0) - x["n_oui"] * bonus_oui,
+                    scores.get(x["md"], 0),
+                ),
+                default=None,
+            )
+        # hors de la phase : le temps passé par le consommateur n'y est pas compté
+        if best is not None:
+            yield from _weekend_records(prep, state, weekend_info, rows, best)
+        elif blocked:
+            yield from _unfilled_weekend_records(prep, state, weekend_info)
+
+    progress.update("Week-ends", n_weekends, n_weekends)
+
+    # Jours simples : chronométrés entre deux `yield`, sans le temps du consommateur
+    elapsed = 0.0
+    t0 = time.perf_counter()
+    simple_rows = _simple_order(prep)
+    for k, r in enumerate(simple_rows):
+        progress.update("Jours simples", k, len(simple_rows))
+        d = matrix.dates[r]
+        if d in state.assigned_dates or (only_dates is not None and d not in only_dates):
             continue
 
         cands = []
         non_cands = []
 
-        for m in meds:
-            disp = str(row[m]).strip().upper()
-            if any(abs((d - x).days) < seuil_proximite for x in history[m]):
+        # date convertie une fois pour tous les médecins
+        v = None if pd.isna(d) else pd.Timestamp(d).value
+        labels = [matrix.labels[c] for c in matrix.codes[r]]
+        for m, disp in zip(meds, labels):
+            if v is not None and state.history.is_near_ns(m, v, seuil_proximite):
                 continue
             score = scores.get(m, 0) - (bonus_oui if disp == "OUI" else 0)
             if disp == "NON":
@@ -445,34 +1398,1269 @@ def generate_planning(
         else:
             sel, sel_disp = None, None
 
-        prev_sc = scores.get(sel, 0) if sel else None
-        pts = row["Points jour"]
-        if sel:
-            scores[sel] = prev_sc + pts
-            history[sel].append(d)
-
-        rec = {
-            "Date": d,
-            "Médecin": sel,
-            "Statut": sel_disp,
-            "Points jour": pts,
-            "Score avant": prev_sc,
-            "Score après": scores.get(sel),
-            "Type": "Simple",
-        }
-        plans.append(rec)
-        logs.append(rec.copy())
+        rec = _simple_record(state, d, prep.points[r], sel, sel_disp)
+        elapsed += time.perf_counter() - t0
+        yield rec
+        t0 = time.perf_counter()
+    progress.update("Jours simples", len(simple_rows), len(simple_rows))
+    elapsed += time.perf_counter() - t0
+    prof.add("Boucle des jours simples", elapsed, rows=len(simple_rows))
+
+
+def _assign_shifts(*args, **kwargs) -> list[dict]:
+    """Toutes les attributions de `_iter_shifts`, dans l'ordre de décision."""
+    return list(_iter_shifts(*args, **kwargs))
 
-    planning_df = pd.DataFrame(plans).sort_values("Date").reset_index(drop=True)
-    log_df = pd.DataFrame(logs)
-    pointage_update_df = update_pointage(pointage_df, planning_df, periods_ante=periods_ante)
+
+# =========================
+# Moteur optimisé
+# =========================
+# Poids de l'objectif global : un jour non couvert coûte plus que n'importe
+# quelle garde NON, elle-même plus chère que n'importe quel écart d'équité.
+_COST_UNFILLED = 10_000.0
+_COST_NON = 1_000.0
+_COST_TIER = 1_000.0
+_COST_OVER_CAP = 10 * _COST_TIER
+
+
+class _MinCostFlow:
+    """Flot de coût minimum par plus courts chemins successifs (Dijkstra + potentiels)."""
+
+    def __init__(self, n: int):
+        self.n = n
+        self.graph: list[list[list]] = [[] for _ in range(n)]
+
+    def add_edge(self, u: int, v: int, cap: int, cost: float) -> tuple[int, int]:
+        self.graph[u].append([v, cap, cost, len(self.graph[v])])
+        self.graph[v].append([u, 0, -cost, len(self.graph[u]) - 1])
+        return u, len(self.graph[u]) - 1
+
+    def flow_on(self, edge: tuple[int, int]) -> int:
+        u, i = edge
+        v, _, _, rev = self.graph[u][i]
+        return self.graph[v][rev][1]
+
+    def solve(self, s: int, t: int, deadline: float | None = None) -> int:
+        inf = float("inf")
+        # potentiels initiaux (Bellman-Ford) : les coûts d'arcs peuvent être négatifs
+        pot = [inf] * self.n
+        pot[s] = 0.0
+        for _ in range(self.n):
+            changed = False
+            for u in range(self.n):
+                if pot[u] == inf:
+                    continue
+                for v, cap, cost, _ in self.graph[u]:
+                    if cap > 0 and pot[u] + cost < pot[v]:
+                        pot[v] = pot[u] + cost
+                        changed = True
+            if not changed:
+                break
+        pot = [0.0 if p == inf else p for p in pot]
+
+        flow = 0
+        while True:
+            if deadline is not None and time.perf_counter() > deadline:
+                raise TimeoutError
+            dist = [inf] * self.n
+            dist[s] = 0.0
+            prev: list[tuple[int, int] | None] = [None] * self.n
+            heap = [(0.0, s)]
+            while heap:
+                d, u = heappop(heap)
+                if d > dist[u]:
+                    continue
+                for i, (v, cap, cost, _) in enumerate(self.graph[u]):
+                    if cap <= 0:
+                        continue
+                    nd = d + cost + pot[u] - pot[v]
+                    if nd < dist[v] - 1e-9:
+                        dist[v] = nd
+                        prev[v] = (u, i)
+                        heappush(heap, (nd, v))
+            if dist[t] == inf:
+                return flow
+            for v in range(self.n):
+                if dist[v] < inf:
+                    pot[v] += dist[v]
+
+            push = inf
+            v = t
+            while v != s:
+                u, i = prev[v]
+                push = min(push, self.graph[u][i][1])
+                v = u
+            v = t
+            while v != s:
+                u, i = prev[v]
+                edge = self.graph[u][i]
+                edge[1] -= push
+                self.graph[v][edge[3]][1] += push
+                v = u
+            flow += push
+
+
+def _equity_cost(score: float, scale: float) -> float:
+    # coût convexe : à total de points égal, minimal quand les scores sont proches
+    return score * score / scale
+
+
+def _plan_cost(plans: list[dict], base_scores: dict, bonus_oui: int, scale: float) -> float:
+    """Objectif commun aux deux moteurs (plus petit = meilleur)."""
+    cost = 0.0
+    final = dict(base_scores)
+    seen_blocks = set()
+    for rec in plans:
+        md = rec["Médecin"]
+        if md is None or pd.isna(md):
+            cost += _COST_UNFILLED
+            continue
+        final[md] = final.get(md, 0) + rec["Points jour"]
+        if rec["Type"] == "WE":
+            block = (md, rec["Weekend_hardest_date"])
+            if block not in seen_blocks:
+                seen_blocks.add(block)
+                cost += rec["Weekend_tier"] * _COST_TIER - rec["Weekend_oui"] * bonus_oui
+        elif rec["Statut"] == "NON":
+            cost += _COST_NON
+        elif rec["Statut"] == "OUI":
+            cost -= bonus_oui
+    return cost + sum(_equity_cost(v, scale) for v in final.values())
+
+
+def _solve_weekends(
+    prep, state, groups, max_weekends, bonus_oui, scale, deadline, seuil_proximite
+) -> dict:
+    """Choix global des médecins de week-end par flot de coût minimum.
+
+    Chaque bloc est couvert s'il a au moins un candidat. Le cap de week-ends
+    est une capacité ; le dépasser reste possible mais coûte plus cher que
+    tout choix sous le cap. L'équité est un coût convexe par week-end
+    supplémentaire d'un même médecin. Les médecins pris sur un autre site à
+    proximité d'un bloc n'y sont pas candidats.
+    """
+    meds = prep.meds
+    n_groups = len(groups)
+    src, sink = 0, n_groups + len(meds) + 1
+    net = _MinCostFlow(sink + 1)
+    doctor_node = {m: n_groups + 1 + j for j, m in enumerate(meds)}
+
+    block_pts = [
+        sum(prep.pts_map.get(d, 0) for d in g["dates"]) for g in groups
+    ]
+    avg_block = float(np.mean(block_pts)) if block_pts else 0.0
+
+    arcs = {}
+    for gi, g in enumerate(groups):
+        rows = [prep.matrix.row_of[d] for d in g["dates"]]
+        blocked = _shared_blocked(state, meds, g["dates"], seuil_proximite)
+        cands = _weekend_candidates(prep, rows, [m for m in meds if m not in blocked])
+        if not cands:
+            continue
+        net.add_edge(src, gi + 1, 1, 0.0)
+        for c in cands:
+            cost = c["tier"] * _COST_TIER - c["n_oui"] * bonus_oui
+            arcs[gi, c["md"]] = (net.add_edge(gi + 1, doctor_node[c["md"]], 1, cost), c)
+
+    for m in meds:
+        base = state.scores.get(m, 0)
+        cap = max(0, max_weekends - state.we_count[m])
+        for k in range(min(cap, n_groups)):
+            marginal = _equity_cost(base + (k + 1) * avg_block, scale) - _equity_cost(
+                base + k * avg_block, scale
+            )
+            net.add_edge(doctor_node[m], sink, 1, marginal)
+        over = _equity_cost(base + (cap + 1) * avg_block, scale) - _equity_cost(
+            base + cap * avg_block, scale
+        )
+        net.add_edge(doctor_node[m], sink, n_groups, _COST_OVER_CAP + over)
+
+    net.solve(src, sink, deadline)
+    return {gi: cand for (gi, _), (edge, cand) in arcs.items() if net.flow_on(edge)}
+
+
+def _optimise_shifts(
+    prep: PreparedPlanning,
+    start_state: PlanningState,
+    seuil_proximite: int,
+    max_weekends: int,
+    bonus_oui: int,
+    time_budget: float,
+    weekend_order: str = "static",
+    progress: JobProgress | None = None,
+) -> list[dict]:
+    """Moteur global : week-ends par flot de coût minimum, puis recherche locale
+    bornée dans le temps sur les jours simples.
+
+    Le résultat est comparé au glouton sur le même objectif (jours non
+    couverts, gardes NON, tiers de week-end, bonus OUI, équité des scores) ;
+    le meilleur des deux est retourné, et le glouton si le budget de temps est
+    épuisé avant d'avoir une solution complète.
+    """
+    deadline = time.perf_counter() + time_budget
+    progress = progress or _NO_PROGRESS
+    greedy = _assign_shifts(
+        prep, start_state.copy(), seuil_proximite, max_weekends, bonus_oui,
+        weekend_order=weekend_order, progress=progress,
+    )
+
+    positive = prep.points[prep.points > 0]
+    scale = 2.0 * (float(positive.mean()) if len(positive) else 1.0)
+    groups = sorted(_weekend_groups(prep), key=lambda g: g["dates"][0])
+    try:
+        weekend_choice = _solve_weekends(
+            prep, start_state, groups, max_weekends, bonus_oui, scale, deadline,
+            seuil_proximite,
+        )
+    except TimeoutError:
+        return greedy
+
+    matrix = prep.matrix
+    state = start_state.copy()
+    scores = state.scores
+    for gi, best in weekend_choice.items():
+        for d in groups[gi]["dates"]:
+            scores[best["md"]] = scores.get(best["md"], 0) + prep.pts_map.get(d, 0)
+            state.history.add(best["md"], d)
+            state.assigned_dates.add(d)
+
+    # Jours simples : une ligne par date, dans l'ordre du glouton
+    days = []
+    for r in _simple_order(prep):
+        d = matrix.dates[r]
+        if pd.isna(d) or d in state.assigned_dates:
+            continue
+        state.assigned_dates.add(d)
+        days.append((int(r), d, float(prep.points[r])))
+    day_of = {pd.Timestamp(d).value: i for i, (_, d, _) in enumerate(days)}
+
+    def pref(i, m):
+        lab = matrix.statut(days[i][0], matrix.col_of[m])
+        return _COST_NON if lab == "NON" else (-bonus_oui if lab == "OUI" else 0.0)
+
+    def gain(m, pts):
+        s = scores.get(m, 0)
+        return _equity_cost(s + pts, scale) - _equity_cost(s, scale)
+
+    def move(i, new):
+        _, d, pts = days[i]
+        old = assign[i]
+        if old is not None:
+            scores[old] -= pts
+            state.history.discard(old, d)
+        if new is not None:
+            scores[new] = scores.get(new, 0) + pts
+            state.history.add(new, d)
+        assign[i] = new
+
+    def best_doctor(i, exclude=None):
+        _, d, pts = days[i]
+        best, best_cost = None, None
+        for m in prep.meds:
+            if m == exclude or state.history.is_near(m, d, seuil_proximite):
+                continue
+            cost = pref(i, m) + gain(m, pts)
+            if best_cost is None or cost < best_cost:
+                best, best_cost = m, cost
+        return best, best_cost
+
+    assign: list = [None] * len(days)
+    for i in range(len(days)):
+        m, _ = best_doctor(i)
+        move(i, m)
+
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i, (_, d, pts) in enumerate(days):
+            if time.perf_counter() > deadline:
+                break
+            progress.update("Recherche locale", i, len(days))
+            old = assign[i]
+            if old is not None:
+                current = pref(i, old) + _equity_cost(scores[old], scale) - _equity_cost(
+                    scores[old] - pts, scale
+                )
+                move(i, None)
+                m, cost = best_doctor(i)
+                if m is not None and cost < current - 1e-9:
+                    move(i, m)
+                    improved = True
+                else:
+                    move(i, old)
+                continue
+
+            # Jour non couvert : libérer un médecin en déplaçant une seule de ses gardes simples
+            for m in prep.meds:
+                blocking = state.history.near(m, d, seuil_proximite)
+                if len(blocking) != 1 or blocking[0] not in day_of:
+                    continue
+                j = day_of[blocking[0]]
+                if assign[j] != m:
+                    # garde tenue sur un autre site le même jour
+                    continue
+                move(j, None)
+                other, _ = best_doctor(j, exclude=m)
+                if other is not None and not state.history.is_near(m, d, seuil_proximite):
+                    move(j, other)
+                    move(i, m)
+                    improved = True
+                    break
+                move(j, m)
+
+    # Restitution dans l'ordre chronologique, scores recalculés pas à pas
+    out_state = start_state.copy()
+    events = [(groups[gi]["dates"][0], "WE", gi) for gi in weekend_choice]
+    # blocs sans candidat parce que tous sont pris sur un autre site
+    events += [
+        (g["dates"][0], "WE", gi)
+        for gi, g in enumerate(groups)
+        if gi not in weekend_choice
+        and _shared_blocked(start_state, prep.meds, g["dates"], seuil_proximite)
+    ]
+    events += [(d, "Simple", i) for i, (_, d, _) in enumerate(days)]
+    plans = []
+    for _, kind, k in sorted(events, key=lambda e: (e[0], e[1] == "Simple")):
+        if kind == "WE":
+            g = groups[k]
+            if k not in weekend_choice:
+                plans.extend(_unfilled_weekend_records(prep, out_state, g))
+                continue
+            rows = [matrix.row_of[d] for d in g["dates"]]
+            plans.extend(_weekend_records(prep, out_state, g, rows, weekend_choice[k]))
+        else:
+            r, d, pts = days[k]
+            sel = assign[k]
+            disp = matrix.statut(r, matrix.col_of[sel]) if sel is not None else None
+            plans.append(_simple_record(out_state, d, prep.points[r], sel, disp))
+
+    base_scores = dict(start_state.scores)
+    if _plan_cost(plans, base_scores, bonus_oui, scale) < _plan_cost(
+        greedy, base_scores, bonus_oui, scale
+    ):
+        return plans
+    return greedy
+
+
+# Colonnes à peu de valeurs distinctes, stockées en catégories
+PLANNING_CATEGORIES = ("Médecin", "Statut", "Type")
+# Rang de décision de chaque attribution : le log détaillé est le planning trié
+# sur cette colonne, pas une seconde copie des mêmes lignes
+ORDER_COL = "Ordre"
+
+
+def _categorize(df: pd.DataFrame) -> pd.DataFrame:
+    return df.astype({c: "category" for c in PLANNING_CATEGORIES if c in df.columns})
+
+
+def planning_frame(plans: list[dict], first_order: int = 0) -> pd.DataFrame:
+    """Attributions (dans l'ordre de décision) -> planning trié par date.
+
+    La colonne `ORDER_COL` garde le rang de décision, à partir de `first_order`.
+    """
+    df = pd.DataFrame(plans)
+    df[ORDER_COL] = np.arange(first_order, first_order + len(df))
+    return _categorize(df).sort_values("Date").reset_index(drop=True)
+
+
+def planning_log(planning_df: pd.DataFrame) -> pd.DataFrame:
+    """Log détaillé : les attributions du planning dans l'ordre où elles ont été décidées."""
+    if ORDER_COL not in planning_df.columns:
+        return planning_df
+    return planning_df.sort_values(ORDER_COL).drop(columns=ORDER_COL).reset_index(drop=True)
+
+
+def iter_planning(
+    dispo_df: pd.DataFrame,
+    pointage_df: pd.DataFrame,
+    gardes_df: pd.DataFrame,
+    prev_df: pd.DataFrame | None = None,
+    seuil_proximite: int = 6,
+    max_weekends: int = 1,
+    bonus_oui: int = 5,
+    engine: str = "greedy",
+    time_budget: float = 5.0,
+    weekend_order: str = "static",
+    profiler: PhaseProfiler | None = None,
+    store: "ScheduleStore | None" = None,
+    shared_df: pd.DataFrame | None = None,
+    progress: JobProgress | None = None,
+) -> Iterator[dict]:
+    """Attributions de la période, générées une à une dans l'ordre de décision.
+
+    Chaque attribution (Date, Médecin, Statut, Points jour, Score avant /
+    après, Type et, pour un week-end, Weekend_*) est produite dès qu'elle est
+    décidée : le glouton n'attend pas la fin des passes, le moteur optimal
+    (qui ne conclut qu'à la fin de sa recherche) produit tout d'un coup.
+    Les arguments sont ceux de `generate_planning` ; ils sont vérifiés dès
+    l'appel, le calcul ne commence qu'à la première attribution demandée.
+    """
+    if engine not in ("greedy", "optimal"):
+        raise ValueError(f"Moteur inconnu : {engine!r} (attendu 'greedy' ou 'optimal')")
+    if weekend_order not in WEEKEND_ORDERS:
+        raise ValueError(f"Ordre des week-ends inconnu : {weekend_order!r} (attendu 'static' ou 'dynamic')")
+    return _iter_planning(
+        dispo_df, pointage_df, gardes_df, prev_df, seuil_proximite, max_weekends, bonus_oui,
+        engine, time_budget, weekend_order, profiler, store, shared_df, progress,
+    )
+
+
+def _iter_planning(
+    dispo_df, pointage_df, gardes_df, prev_df, seuil_proximite, max_weekends, bonus_oui,
+    engine, time_budget, weekend_order, profiler, store, shared_df, progress,
+) -> Iterator[dict]:
+    prof = profiler or _NO_PROFILER
+    if store is not None and prev_df is None:
+        with prof.phase("Lecture de l'historique publié"):
+            start = pd.to_datetime(dispo_df["Date"], errors="coerce").min()
+            if not pd.isna(start):
+                prev_df = store.previous_assignments(start, seuil_proximite)
+    with prof.phase("Normalisation des entrées", rows=len(dispo_df)):
+        prep = prepare_planning(dispo_df, gardes_df)
+        state = initial_state(pointage_df, prev_df)
+        if shared_df is not None:
+            add_shared_assignments(state, shared_df)
+    if engine == "optimal":
+        with prof.phase("Moteur optimal", rows=len(prep.dates)):
+            plans = _optimise_shifts(
+                prep, state, seuil_proximite, max_weekends, bonus_oui, time_budget, weekend_order,
+                progress,
+            )
+    else:
+        plans = _iter_shifts(
+            prep, state, seuil_proximite, max_weekends, bonus_oui,
+            profiler=profiler, weekend_order=weekend_order, progress=progress,
+        )
+    progress = progress or _NO_PROGRESS
+    for rec in plans:
+        progress.decided(rec)
+        yield rec
+
+
+def generate_planning(
+    dispo_df: pd.DataFrame,
+    pointage_df: pd.DataFrame,
+    gardes_df: pd.DataFrame,
+    prev_df: pd.DataFrame | None = None,
+    seuil_proximite: int = 6,
+    max_weekends: int = 1,
+    bonus_oui: int = 5,
+    periods_ante: int = 12,
+    engine: str = "greedy",
+    time_budget: float = 5.0,
+    weekend_order: str = "static",
+    profiler: PhaseProfiler | None = None,
+    store: "ScheduleStore | None" = None,
+    shared_df: pd.DataFrame | None = None,
+    progress: JobProgress | None = None,
+):
+    """Attribue les gardes de la période.
+
+    Rassemble les attributions de `iter_planning` en (planning trié par date,
+    log dans l'ordre de décision, pointage mis à jour).
+
+    `engine="greedy"` : passes gloutonnes historiques (week-ends les plus
+    difficiles d'abord, puis jours simples). `engine="optimal"` : moteur
+    global borné par `time_budget` secondes, qui retombe sur le glouton
+    s'il ne fait pas mieux (voir `_optimise_shifts`). `weekend_order` choisit
+    l'ordre des blocs week-end du glouton : "static" (historique) ou
+    "dynamic" (le plus contraint d'abord, réévalué à chaque attribution).
+
+    Avec `profiler`, le temps de chaque phase y est cumulé. Avec `store` et
+    sans `prev_df`, l'historique est lu dans les plannings publiés.
+    `shared_df` contient les gardes de la même période déjà attribuées sur
+    d'autres sites aux médecins partagés (voir `add_shared_assignments`).
+    Avec `progress`, l'avancement y est publié et le calcul peut être annulé
+    (`PlanningCancelled`).
+    """
+    prof = profiler or _NO_PROFILER
+    plans = list(
+        iter_planning(
+            dispo_df, pointage_df, gardes_df, prev_df, seuil_proximite, max_weekends, bonus_oui,
+            engine, time_budget, weekend_order, profiler, store, shared_df, progress,
+        )
+    )
+
+    if progress is not None:
+        progress.check()
+    with prof.phase("Assemblage des tableaux", rows=len(plans)):
+        planning_df = planning_frame(plans)
+        log_df = planning_log(planning_df)
+    with prof.phase("update_pointage", rows=len(pointage_df)):
+        pointage_update_df = update_pointage(pointage_df, planning_df, periods_ante=periods_ante)
     return planning_df, log_df, pointage_update_df
 
 
+# =========================
+# Re-planification incrémentale
+# =========================
+def diff_dispo(old_dispo_df: pd.DataFrame, new_dispo_df: pd.DataFrame) -> pd.DataFrame:
+    """Cellules médecins modifiées entre deux versions de "Dispo Période".
+
+    Retourne un DataFrame (Date, Médecin, Avant, Après). Les deux versions
+    doivent couvrir les mêmes dates, dans le même ordre ; sinon ValueError.
+    """
+    old_dates = pd.to_datetime(old_dispo_df["Date"]).reset_index(drop=True)
+    new_dates = pd.to_datetime(new_dispo_df["Date"]).reset_index(drop=True)
+    if not old_dates.equals(new_dates):
+        raise ValueError("Les dates de Dispo Période ont changé : recalcul complet nécessaire")
+
+    old_meds = [c for c in old_dispo_df.columns if c not in BASE_DISPO_COLS]
+    new_meds = [c for c in new_dispo_df.columns if c not in BASE_DISPO_COLS]
+    if set(old_meds) != set(new_meds):
+        raise ValueError("La liste des médecins a changé : recalcul complet nécessaire")
+
+    old_m = build_dispo_matrix(old_dispo_df.reset_index(drop=True).assign(Date=old_dates), new_meds)
+    new_m = build_dispo_matrix(new_dispo_df.reset_index(drop=True).assign(Date=new_dates), new_meds)
+    rows, cols = np.nonzero(
+        np.asarray(old_m.labels, dtype=object)[old_m.codes]
+        != np.asarray(new_m.labels, dtype=object)[new_m.codes]
+    )
+    return pd.DataFrame(
+        {
+            "Date": new_dates.iloc[rows].to_numpy(),
+            "Médecin": [new_meds[j] for j in cols],
+            "Avant": [old_m.statut(i, j) for i, j in zip(rows, cols)],
+            "Après": [new_m.statut(i, j) for i, j in zip(rows, cols)],
+        }
+    )
+
+
+def _dates_to_replan(dispo_df: pd.DataFrame, changed_dates: set, seuil_proximite: int) -> set:
+    """Jours à recalculer : blocs week-end touchés + jours simples proches d'un changement."""
+    df = guard_days(dispo_df)
+    weekday = df["Date"].dt.weekday
+    we_id = (df["Date"] - pd.to_timedelta(weekday - 4, unit="D")).where(weekday >= 4)
+
+    touched_we = set(we_id[df["Date"].isin(changed_dates) & we_id.notna()])
+    we_dates = set(df.loc[we_id.isin(touched_we), "Date"])
+
+    seeds = ShiftHistory()
+    for d in changed_dates | we_dates:
+        seeds.add("changement", d)
+    simple_dates = {
+        d
+        for d in df.loc[we_id.isna(), "Date"]
+        if d in changed_dates or seeds.is_near("changement", d, seuil_proximite)
+    }
+    return we_dates | simple_dates
+
+
+def replan_incremental(
+    dispo_df: pd.DataFrame,
+    pointage_df: pd.DataFrame,
+    gardes_df: pd.DataFrame,
+    prev_df: pd.DataFrame | None,
+    planning_df: pd.DataFrame,
+    changes: pd.DataFrame,
+    seuil_proximite: int = 6,
+    max_weekends: int = 1,
+    bonus_oui: int = 5,
+    periods_ante: int = 12,
+    pointage_update_df: pd.DataFrame | None = None,
+    weekend_order: str = "static",
+):
+    """Met à jour un planning publié après modification de quelques disponibilités.
+
+    `dispo_df` est la version modifiée de "Dispo Période" et `changes` la
+    liste des cellules modifiées (colonne "Date", voir `diff_dispo`). Seuls
+    les blocs week-end contenant une date modifiée et les jours simples à
+    moins de `seuil_proximite` jours d'un changement sont recalculés ; toutes
+    les autres attributions sont conservées telles quelles. Les scores
+    "avant/après" des jours recalculés partent du pointage augmenté des
+    attributions conservées.
+
+    Avec `pointage_update_df` (pointage mis à jour du planning précédent),
+    seules les lignes des médecins concernés sont recalculées. Les jours
+    recalculés prennent place après les autres dans l'ordre de décision.
+    Retourne (planning_df, log_df, pointage_update_df) comme `generate_planning`.
+    """
+    changed_dates = set(pd.to_datetime(changes["Date"]).dropna())
+    if not changed_dates:
+        if pointage_update_df is None:
+            pointage_update_df = update_pointage(pointage_df, planning_df, periods_ante=periods_ante)
+        return planning_df, planning_log(planning_df), pointage_update_df
+
+    replan_dates = _dates_to_replan(dispo_df, changed_dates, seuil_proximite)
+    keep = ~planning_df["Date"].isin(replan_dates)
+    locked = planning_df[keep].to_dict("records")
+
+    prep = prepare_planning(dispo_df, gardes_df)
+    state = initial_state(pointage_df, prev_df)
+    _lock_assignments(state, locked)
+    plans = _assign_shifts(
+        prep, state, seuil_proximite, max_weekends, bonus_oui,
+        only_dates=replan_dates, weekend_order=weekend_order,
+    )
+
+    first_order = 0
+    if ORDER_COL in planning_df.columns and len(planning_df):
+        first_order = int(planning_df[ORDER_COL].max()) + 1
+    new_planning = _categorize(
+        pd.concat([planning_df[keep], planning_frame(plans, first_order)], ignore_index=True)
+        .sort_values("Date", kind="stable")
+        .reset_index(drop=True)
+    )
+    new_log = planning_log(new_planning)
+
+    if pointage_update_df is None or "MD" not in pointage_df.columns:
+        return new_planning, new_log, update_pointage(pointage_df, new_planning, periods_ante=periods_ante)
+
+    touched = set(planning_df.loc[~keep, "Médecin"].dropna()) | {
+        p["Médecin"] for p in plans if not pd.isna(p["Médecin"])
+    }
+    rows = pointage_df["MD"].isin(touched)
+    new_pointage = pointage_update_df.copy()
+    if rows.any():
+        partial = update_pointage(pointage_df[rows], new_planning, periods_ante=periods_ante)
+        new_pointage.loc[rows, partial.columns] = partial
+    return new_planning, new_log, new_pointage
+
+
+# =========================
+# Indicateurs d'équité
+# =========================
+def planning_metrics(
+    planning_df: pd.DataFrame,
+    pointage_update_df: pd.DataFrame,
+    dispo_df: pd.DataFrame | None = None,
+) -> dict:
+    """Indicateurs de comparaison d'un planning (équité, NON, jours non couverts).
+
+    Avec `dispo_df`, les jours de week-end restés sans aucune ligne dans le
+    planning (aucun candidat) sont aussi comptés comme non attribués.
+    """
+    if "Nouveau score" in pointage_update_df.columns:
+        new_scores = pd.to_numeric(pointage_update_df["Nouveau score"], errors="coerce")
+    else:
+        new_scores = pd.Series(dtype=float)
+    assigned = planning_df[planning_df["Médecin"].notna()] if len(planning_df) else planning_df
+    if dispo_df is not None:
+        expected = set(guard_days(dispo_df)["Date"].dropna())
+        unfilled = len(expected - set(assigned["Date"])) if len(assigned) else len(expected)
+    else:
+        unfilled = int(planning_df["Médecin"].isna().sum()) if len(planning_df) else 0
+
+    tiers: dict[int, int] = {}
+    if "Weekend_tier" in planning_df.columns:
+        blocks = planning_df[planning_df["Type"] == "WE"].drop_duplicates("Weekend_hardest_date")
+        tiers = {int(t): int(n) for t, n in blocks["Weekend_tier"].value_counts().sort_index().items()}
+
+    return {
+        "Écart scores": float(new_scores.max() - new_scores.min()) if new_scores.notna().any() else 0.0,
+        "Écart-type scores": float(new_scores.std(ddof=0)) if new_scores.notna().any() else 0.0,
+        "Gardes NON": int((assigned["Statut"] == "NON").sum()) if len(assigned) else 0,
+        "Jours non attribués": unfilled,
+        "Week-ends par tier": tiers,
+    }
+
+
+# =========================
+# Robustesse (Monte Carlo)
+# =========================
+def perturb_planning(
+    prep: PreparedPlanning,
+    rng: np.random.Generator,
+    prn_to_non: float = 0.05,
+    points_prob: float = 0.1,
+    points_jitter: int = 1,
+) -> PreparedPlanning:
+    """Copie de `prep` avec des désistements et des points résidents tirés au hasard.
+
+    Chaque cellule PRN passe NON avec la probabilité `prn_to_non` ; les points
+    de chaque jour changent avec la probabilité `points_prob`, d'un entier
+    entre -`points_jitter` et +`points_jitter` (sans descendre sous zéro).
+    Seuls les codes et les points sont copiés : dates, index et médecins
+    restent partagés avec `prep`.
+    """
+    codes = prep.matrix.codes
+    flip = (codes == DISPO_PRN) & (rng.random(codes.shape) < prn_to_non)
+    new_codes = codes.copy()
+    new_codes[flip] = DISPO_NON
+
+    points, pts_map = prep.points, prep.pts_map
+    if points_prob > 0 and points_jitter > 0 and len(points):
+        change = rng.random(len(points)) < points_prob
+        delta = rng.integers(-points_jitter, points_jitter + 1, size=len(points))
+        points = np.where(change, np.maximum(points + delta, 0), points)
+        pts_map = dict(pts_map)
+        for r in np.flatnonzero(change):
+            pts_map[prep.dates[r]] = points[r]
+    return replace(prep, matrix=replace(prep.matrix, codes=new_codes), points=points, pts_map=pts_map)
+
+
+def robustness_reference(
+    prep: PreparedPlanning, state: PlanningState, planning_df: pd.DataFrame
+) -> tuple[np.ndarray, np.ndarray]:
+    """Planning de référence sous forme compacte : indice du médecin de garde
+    par jour (-1 si personne, ordre de `prep.dates`) et score final par médecin
+    (ordre de `prep.meds`)."""
+    med_of = {m: j for j, m in enumerate(prep.meds)}
+    ref_rows = np.full(len(prep.dates), -1, dtype=np.int32)
+    ref_scores = np.array([state.scores.get(m, 0) for m in prep.meds], dtype=float)
+    assigned = planning_df[planning_df["Médecin"].notna()]
+    for d, md, pts in zip(assigned["Date"], assigned["Médecin"], assigned["Points jour"]):
+        j = med_of.get(md)
+        if j is None:
+            continue
+        ref_scores[j] += pts
+        r = prep.matrix.row_of.get(d)
+        if r is not None:
+            ref_rows[r] = j
+    return ref_rows, ref_scores
+
+
+def simulate_robustness(
+    prep: PreparedPlanning,
+    state: PlanningState,
+    ref_rows: np.ndarray,
+    ref_scores: np.ndarray,
+    seeds: list,
+    seuil_proximite: int = 6,
+    max_weekends: int = 1,
+    bonus_oui: int = 5,
+    weekend_order: str = "static",
+    engine: str = "greedy",
+    time_budget: float = 5.0,
+    **perturbation,
+) -> dict[str, np.ndarray]:
+    """Relance le moteur `engine` sur une perturbation de `prep` par graine de `seeds`.
+
+    Le moteur et son budget (par simulation) doivent être ceux de la
+    référence : sinon les jours modifiés mêlent l'effet des imprévus et les
+    écarts entre moteurs.
+    `perturbation` : arguments de `perturb_planning`. Retourne, une ligne par
+    simulation : jours non couverts et jours changés par rapport à la
+    référence (simulations x jours), dérive des scores finaux (simulations x
+    médecins), nombres de gardes NON et de gardes attribuées.
+    """
+    n, n_rows = len(seeds), len(prep.dates)
+    med_of = {m: j for j, m in enumerate(prep.meds)}
+    row_of = prep.matrix.row_of
+    out = {
+        "unfilled": np.zeros((n, n_rows), dtype=bool),
+        "changed": np.zeros((n, n_rows), dtype=bool),
+        "drift": np.zeros((n, len(prep.meds))),
+        "non": np.zeros(n, dtype=np.int32),
+        "assigned": np.zeros(n, dtype=np.int32),
+    }
+    for k, seed in enumerate(seeds):
+        sim = perturb_planning(prep, np.random.default_rng(seed), **perturbation)
+        if engine == "optimal":
+            plans = _optimise_shifts(
+                sim, state, seuil_proximite, max_weekends, bonus_oui, time_budget, weekend_order
+            )
+        else:
+            plans = _assign_shifts(
+                sim, state.copy(), seuil_proximite, max_weekends, bonus_oui, weekend_order=weekend_order
+            )
+        rows = np.full(n_rows, -1, dtype=np.int32)
+        scores = dict(state.scores)
+        for rec in plans:
+            md = rec["Médecin"]
+            if md is not None:
+                rows[row_of[rec["Date"]]] = med_of[md]
+                scores[md] = scores.get(md, 0) + rec["Points jour"]
+                out["non"][k] += rec["Statut"] == "NON"
+        out["unfilled"][k] = rows < 0
+        out["changed"][k] = rows != ref_rows
+        out["assigned"][k] = (rows >= 0).sum()
+        out["drift"][k] = [scores.get(m, 0) for m in prep.meds]
+    out["drift"] -= ref_scores
+    return out
+
+
+def robustness_summary(
+    prep: PreparedPlanning, ref_scores: np.ndarray, results: dict[str, np.ndarray]
+) -> tuple[dict, pd.DataFrame, pd.DataFrame]:
+    """Résumé des simulations (voir `simulate_robustness`), détail par jour et par médecin."""
+    unfilled, changed, drift = results["unfilled"], results["changed"], results["drift"]
+    n_assigned = int(results["assigned"].sum())
+    summary = {
+        "Simulations": len(unfilled),
+        "Probabilité d'un jour non attribué": float(unfilled.any(axis=1).mean()),
+        "Jours non attribués (moyenne)": float(unfilled.sum(axis=1).mean()),
+        "Part de gardes NON": float(results["non"].sum() / n_assigned) if n_assigned else 0.0,
+        "Jours modifiés (moyenne)": float(changed.sum(axis=1).mean()),
+    }
+    per_day = pd.DataFrame(
+        {
+            "Date": prep.dates,
+            "P(non attribué)": unfilled.mean(axis=0),
+            "P(médecin changé)": changed.mean(axis=0),
+        }
+    ).sort_values("Date", ignore_index=True)
+    per_doctor = pd.DataFrame(
+        {
+            "Médecin": prep.meds,
+            "Score de référence": ref_scores,
+            "Dérive moyenne": drift.mean(axis=0),
+            "Dérive écart-type": drift.std(axis=0),
+            "Dérive max (abs)": np.abs(drift).max(axis=0),
+        }
+    )
+    return summary, per_day, per_doctor
+
+
+# =========================
+# Historique publié
+# =========================
+_STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS periods (
+    service TEXT NOT NULL DEFAULT '',
+    period TEXT NOT NULL,
+    start TEXT NOT NULL,
+    end TEXT NOT NULL,
+    published_at TEXT NOT NULL,
+    PRIMARY KEY (service, period)
+);
+CREATE TABLE IF NOT EXISTS assignments (
+    service TEXT NOT NULL DEFAULT '',
+    period TEXT NOT NULL,
+    date TEXT NOT NULL,
+    md TEXT NOT NULL,
+    statut TEXT,
+    type TEXT,
+    points REAL,
+    weekend INTEGER NOT NULL,
+    FOREIGN KEY (service, period) REFERENCES periods (service, period)
+);
+CREATE INDEX IF NOT EXISTS assignments_md_date ON assignments (service, md, date);
+CREATE INDEX IF NOT EXISTS assignments_date ON assignments (service, period, date);
+CREATE TABLE IF NOT EXISTS pointage (
+    service TEXT NOT NULL DEFAULT '',
+    period TEXT NOT NULL,
+    md TEXT NOT NULL,
+    points REAL,
+    score REAL,
+    PRIMARY KEY (service, period, md),
+    FOREIGN KEY (service, period) REFERENCES periods (service, period)
+);
+"""
+
+
+def _migrate_store(conn: sqlite3.Connection) -> None:
+    """Bases créées avant la colonne `service` : leurs périodes passent au service ""."""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(periods)")]
+    if not columns or "service" in columns:
+        return
+    with conn:
+        for table in ("periods", "assignments", "pointage"):
+            conn.execute(f"ALTER TABLE {table} RENAME TO {table}_v1")
+        conn.execute("DROP INDEX IF EXISTS assignments_md_date")
+        conn.execute("DROP INDEX IF EXISTS assignments_date")
+        conn.executescript(_STORE_SCHEMA)
+        conn.execute("INSERT INTO periods SELECT '', * FROM periods_v1")
+        conn.execute("INSERT INTO assignments SELECT '', * FROM assignments_v1")
+        conn.execute("INSERT INTO pointage SELECT '', * FROM pointage_v1")
+        for table in ("assignments", "pointage", "periods"):
+            conn.execute(f"DROP TABLE {table}_v1")
+
+
+def _store_ts(d) -> str:
+    return pd.Timestamp(d).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class ScheduleStore:
+    """Plannings et pointages publiés, dans une base SQLite locale.
+
+    Remplace le copier-coller de la feuille "Période précédente" : chaque
+    planning publié y est conservé, indexé par médecin et par date, et
+    `previous_assignments` ne relit que la fenêtre utile au calcul suivant.
+    Une base peut servir à plusieurs services : chaque instance ne lit et
+    n'écrit que les périodes de son `service`.
+    """
+
+    def __init__(self, path=":memory:", service: str = ""):
+        self.path = str(path)
+        self.service = str(service)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        _migrate_store(self._conn)
+        with self._conn:
+            self._conn.executescript(_STORE_SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def publish(
+        self,
+        planning_df: pd.DataFrame,
+        pointage_update_df: pd.DataFrame | None = None,
+        label: str | None = None,
+    ) -> str:
+        """Enregistre un planning (et son pointage) ; republier une période du même
+        service la remplace."""
+        rows = planning_df[planning_df["Médecin"].notna() & planning_df["Date"].notna()]
+        if rows.empty:
+            raise ValueError("Planning vide : rien à publier")
+        dates = pd.to_datetime(rows["Date"])
+        start, end = dates.min(), dates.max()
+        label = label or f"{start:%Y-%m-%d} → {end:%Y-%m-%d}"
+
+        assignments = [
+            (
+                self.service, label, _store_ts(d), str(md), statut, typ, float(pts),
+                int(_week_id(d) is not None),
+            )
+            for d, md, statut, typ, pts in zip(
+                dates,
+                rows["Médecin"],
+                rows.get("Statut", pd.Series(None, index=rows.index)),
+                rows.get("Type", pd.Series(None, index=rows.index)),
+                pd.to_numeric(rows["Points jour"], errors="coerce").fillna(0),
+            )
+        ]
+        pointage = []
+        if pointage_update_df is not None and "MD" in pointage_update_df.columns:
+            pts = pd.to_numeric(pointage_update_df.get("Période_actuelle"), errors="coerce")
+            scores = pd.to_numeric(pointage_update_df.get("Nouveau score"), errors="coerce")
+            pointage = [
+                (
+                    self.service,
+                    label,
+                    str(md),
+                    None if pd.isna(p) else float(p),
+                    None if pd.isna(sc) else float(sc),
+                )
+                for md, p, sc in zip(pointage_update_df["MD"], pts, scores)
+                if not pd.isna(md)
+            ]
+
+        key = (self.service, label)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM assignments WHERE service = ? AND period = ?", key)
+            self._conn.execute("DELETE FROM pointage WHERE service = ? AND period = ?", key)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO periods VALUES (?, ?, ?, ?, ?)",
+                (*key, _store_ts(start), _store_ts(end), datetime.now().isoformat(timespec="microseconds")),
+            )
+            self._conn.executemany("INSERT INTO assignments VALUES (?, ?, ?, ?, ?, ?, ?, ?)", assignments)
+            self._conn.executemany("INSERT INTO pointage VALUES (?, ?, ?, ?, ?)", pointage)
+        return label
+
+    def _query(self, sql: str, params=()) -> list[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def revision(self) -> tuple:
+        """Change à chaque publication (sert de clé de cache)."""
+        rows = self._query(
+            "SELECT COUNT(*), MAX(published_at) FROM periods WHERE service = ?", (self.service,)
+        )
+        return tuple(rows[0])
+
+    def periods(self) -> pd.DataFrame:
+        rows = self._query(
+            "SELECT period, start, end, published_at FROM periods WHERE service = ? ORDER BY start",
+            (self.service,),
+        )
+        return pd.DataFrame(rows, columns=["Période", "Début", "Fin", "Publiée le"])
+
+    def previous_assignments(self, start, seuil_proximite: int = 6) -> pd.DataFrame:
+        """Équivalent de la feuille "Période précédente" pour une période débutant à `start`.
+
+        Seules les lignes qui influencent le calcul sont lues, dans la dernière
+        période publiée avant `start` : les gardes des `seuil_proximite` derniers
+        jours (proximité) et ses jours de week-end (plafond de week-ends).
+        """
+        start = pd.Timestamp(start)
+        last = self._query(
+            "SELECT period FROM periods WHERE service = ? AND start < ? ORDER BY start DESC LIMIT 1",
+            (self.service, _store_ts(start)),
+        )
+        if not last:
+            return pd.DataFrame({"Date": pd.Series(dtype="datetime64[ns]"), "Médecin": pd.Series(dtype=object)})
+        window = _store_ts(start - timedelta(days=seuil_proximite))
+        rows = self._query(
+            "SELECT date, md FROM assignments WHERE service = ? AND period = ? AND date < ?"
+            " AND (date >= ? OR weekend = 1) ORDER BY date",
+            (self.service, last[0][0], _store_ts(start), window),
+        )
+        out = pd.DataFrame(rows, columns=["Date", "Médecin"])
+        out["Date"] = pd.to_datetime(out["Date"])
+        return out
+
+    def doctor_history(self, md: str, start=None, end=None) -> pd.DataFrame:
+        """Gardes publiées d'un médecin, éventuellement bornées à [start, end]."""
+        sql = "SELECT date, period, statut, type, points FROM assignments WHERE service = ? AND md = ?"
+        params = [self.service, md]
+        if start is not None:
+            sql += " AND date >= ?"
+            params.append(_store_ts(start))
+        if end is not None:
+            sql += " AND date <= ?"
+            params.append(_store_ts(end))
+        out = pd.DataFrame(
+            self._query(sql + " ORDER BY date", params),
+            columns=["Date", "Période", "Statut", "Type", "Points jour"],
+        )
+        out["Date"] = pd.to_datetime(out["Date"])
+        return out
+
+    def roster(self) -> list[str]:
+        """Médecins du dernier pointage publié (ordre d'origine)."""
+        rows = self._query(
+            "SELECT md FROM pointage WHERE service = ?1 AND period ="
+            " (SELECT period FROM periods WHERE service = ?1 ORDER BY start DESC LIMIT 1) ORDER BY rowid",
+            (self.service,),
+        )
+        return [md for (md,) in rows]
+
+    def pointage_frame(self, periods_ante: int | None = None) -> pd.DataFrame:
+        """Feuille "Pointage gardes" reconstituée : une colonne de points par période
+        publiée (les `periods_ante` dernières) et le dernier score comme "Score actualisé".
+        """
+        rows = self._query("SELECT period FROM periods WHERE service = ? ORDER BY start", (self.service,))
+        periods = [p for (p,) in rows]
+        if periods_ante is not None:
+            periods = periods[len(periods) - periods_ante:] if periods_ante > 0 else []
+        rows = self._query(
+            "SELECT p.md, p.period, p.points, p.score FROM pointage p"
+            " JOIN periods USING (service, period) WHERE p.service = ? ORDER BY periods.start",
+            (self.service,),
+        )
+        data = pd.DataFrame(rows, columns=["MD", "Période", "points", "score"])
+        if data.empty:
+            return pd.DataFrame(columns=["MD", "Score actualisé", *periods])
+        scores = data.dropna(subset=["score"]).groupby("MD", sort=False)["score"].last()
+        points = data[data["Période"].isin(periods)].pivot(index="MD", columns="Période", values="points")
+        out = pd.DataFrame({"MD": data["MD"].unique()})
+        out["Score actualisé"] = out["MD"].map(scores)
+        return out.join(points.reindex(columns=periods), on="MD")
+
+
+# =========================
+# Export consolidé
+# =========================
+def calendar_view(planning_df: pd.DataFrame) -> pd.DataFrame:
+    """Planning en grille : une ligne par semaine (lundi), une colonne par jour."""
+    if planning_df.empty:
+        return pd.DataFrame(columns=["Semaine du", *WEEKDAY_NAMES])
+    dates = pd.to_datetime(planning_df["Date"])
+    cells = pd.DataFrame(
+        {
+            "Semaine du": (dates - pd.to_timedelta(dates.dt.weekday, unit="D")).dt.normalize(),
+            "Jour": dates.dt.weekday.map(dict(enumerate(WEEKDAY_NAMES))),
+            "Médecin": planning_df["Médecin"].astype(object).where(planning_df["Médecin"].notna(), "—"),
+        }
+    )
+    grid = cells.pivot_table(index="Semaine du", columns="Jour", values="Médecin", aggfunc=" / ".join)
+    return grid.reindex(columns=WEEKDAY_NAMES).reset_index().rename_axis(columns=None)
+
+
+def doctor_summary(planning_df: pd.DataFrame, pointage_df: pd.DataFrame) -> pd.DataFrame:
+    """Synthèse par médecin : gardes, week-ends, points, statuts et scores."""
+    assigned = planning_df[planning_df["Médecin"].notna()]
+    grouped = assigned.groupby("Médecin", sort=True)
+    summary = pd.DataFrame(
+        {
+            "Gardes": grouped.size(),
+            "Jours de week-end": grouped["Type"].agg(lambda t: int((t == "WE").sum())),
+            "Points": grouped["Points jour"].sum(),
+            "OUI": grouped["Statut"].agg(lambda t: int((t == "OUI").sum())),
+            "PRN": grouped["Statut"].agg(lambda t: int((t == "PRN").sum())),
+            "NON": grouped["Statut"].agg(lambda t: int((t == "NON").sum())),
+            "Première garde": grouped["Date"].min(),
+            "Dernière garde": grouped["Date"].max(),
+        }
+    )
+    if "MD" in pointage_df.columns:
+        scores = pointage_df.drop_duplicates("MD").set_index("MD")
+        summary = summary.reindex(summary.index.union(scores.index, sort=False))
+        for col in ("Score actualisé", "Nouveau score"):
+            if col in scores.columns:
+                summary[col] = scores[col]
+        summary[["Gardes", "Jours de week-end", "OUI", "PRN", "NON"]] = (
+            summary[["Gardes", "Jours de week-end", "OUI", "PRN", "NON"]].fillna(0).astype(int)
+        )
+        summary["Points"] = summary["Points"].fillna(0)
+    return summary.rename_axis("Médecin").reset_index()
+
+
+_EXCEL_EPOCH = pd.Timestamp("1899-12-30")
+
+
+def _add_sheet(workbook, name: str, df: pd.DataFrame):
+    """Feuille avec en-tête figé et colonnes de dates formatées ; retourne (feuille, is_date)."""
+    ws = workbook.add_worksheet(name)
+    header = workbook.add_format({"bold": True, "bottom": 1})
+    date_fmt = workbook.add_format({"num_format": "yyyy-mm-dd"})
+    ws.freeze_panes(1, 0)
+    is_date = [pd.api.types.is_datetime64_any_dtype(df[c]) for c in df.columns]
+    for j, dated in enumerate(is_date):
+        ws.set_column(j, j, 14, date_fmt if dated else None)
+    ws.write_row(0, 0, [str(c) for c in df.columns], header)
+    return ws, is_date
+
+
+def _write_block(ws, first_row: int, block: pd.DataFrame, is_date: list[bool]) -> None:
+    columns = []
+    for c, dated in zip(block.columns, is_date):
+        col = block[c]
+        if dated:
+            # numéro de série Excel, converti en bloc (la mise en forme vient de la colonne)
+            col = (col.dt.tz_localize(None) if col.dt.tz else col) - _EXCEL_EPOCH
+            col = col / pd.Timedelta(days=1)
+        columns.append(col.astype(object).where(col.notna(), None).tolist())
+    for offset, row in enumerate(zip(*columns)):
+        ws.write_row(first_row + offset, 0, row)
+
+
+def _write_frame(workbook, name: str, df: pd.DataFrame, chunk: int = 5000) -> None:
+    # mode constant_memory : les lignes doivent être écrites dans l'ordre, une seule fois
+    ws, is_date = _add_sheet(workbook, name, df)
+    for start in range(0, len(df), chunk):
+        _write_block(ws, start + 1, df.iloc[start:start + chunk], is_date)
+
+
+def consolidated_workbook(
+    planning_df: pd.DataFrame, log_df: pd.DataFrame, pointage_df: pd.DataFrame
+) -> bytes:
+    """Un seul classeur : planning, log, pointage, calendrier et synthèse par médecin.
+
+    Écrit en flux avec le mode `constant_memory` de xlsxwriter : la mémoire
+    utilisée ne dépend pas du nombre de lignes du log.
+    """
+    import xlsxwriter
+
+    buf = io.BytesIO()
+    workbook = xlsxwriter.Workbook(buf, {"constant_memory": True})
+    _write_frame(workbook, "Planning", planning_df)
+    _write_frame(workbook, "Calendrier", calendar_view(planning_df))
+    _write_frame(workbook, "Synthèse médecins", doctor_summary(planning_df, pointage_df))
+    _write_frame(workbook, "Pointage", pointage_df)
+    _write_frame(workbook, "Log", log_df)
+    workbook.close()
+    return buf.getvalue()
+
+
+# =========================
+# Export au fil de l'eau
+# =========================
+# Colonnes et types fixes : chaque bloc écrit a le même schéma, qu'il
+# contienne ou non des week-ends. "string" (et non "str") garde les jours
+# sans médecin vides avec toutes les versions de pandas : avant pandas 3,
+# astype("str") écrit le texte "None".
+STREAM_DTYPES = {
+    "Date": "datetime64[ns]",
+    "Médecin": "string",
+    "Statut": "string",
+    "Points jour": "float64",
+    "Score avant": "float64",
+    "Score après": "float64",
+    "Type": "string",
+    "Weekend_tier": "Int64",
+    "Weekend_oui": "Int64",
+    "Weekend_prn": "Int64",
+    "Weekend_non": "Int64",
+    "Weekend_hardest_date": "datetime64[ns]",
+    "Weekend_hardest_non": "Int64",
+    ORDER_COL: "int64",
+}
+
+
+class PlanningSink:
+    """Écrit des attributions (voir `iter_planning`) dans un fichier, au fil de l'eau.
+
+    Les lignes sont écrites par blocs de `chunk`, dans l'ordre de décision
+    (le contenu du log, avec la colonne `ORDER_COL`) : la mémoire utilisée
+    ne dépend pas de la longueur du planning. Seuls les points par médecin
+    sont cumulés, pour `update_pointage` (voir `points_frame`). `target` :
+    chemin ou fichier binaire ; `fmt` : "csv", "xlsx", "parquet" ou "arrow".
+
+        with PlanningSink("log.parquet", "parquet") as sink:
+            for rec in iter_planning(dispo, pointage, gardes):
+                sink.write(rec)
+    """
+
+    def __init__(self, target, fmt: str = "csv", chunk: int = 1000):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Format inconnu : {fmt!r}")
+        if fmt in ("parquet", "arrow"):
+            _require_pyarrow(fmt)
+        self.target = target
+        self.fmt = fmt
+        self.chunk = chunk
+        self.rows = 0
+        self.points: dict[str, float] = defaultdict(float)
+        self._pending: list[dict] = []
+        self._writer = None
+        self._sheet = None
+
+    def write(self, record: dict) -> None:
+        if record.get("Médecin"):
+            pts = record["Points jour"]
+            self.points[record["Médecin"]] += 0 if pd.isna(pts) else pts
+        self._pending.append(record)
+        if len(self._pending) >= self.chunk:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending and self._writer is not None:
+            return
+        block = pd.DataFrame(self._pending, columns=list(STREAM_DTYPES)[:-1])
+        block[ORDER_COL] = np.arange(self.rows, self.rows + len(block))
+        block = block.astype(STREAM_DTYPES)
+        self._write(block)
+        self.rows += len(block)
+        self._pending = []
+
+    def _write(self, block: pd.DataFrame) -> None:
+        first = self._writer is None
+        if self.fmt == "csv":
+            if first:
+                self._writer = open(self.target, "wb") if isinstance(self.target, (str, Path)) else self.target
+            block.to_csv(self._writer, header=first, index=False, encoding="utf-8")
+        elif self.fmt == "xlsx":
+            if first:
+                import xlsxwriter
+
+                self._writer = xlsxwriter.Workbook(self.target, {"constant_memory": True})
+                self._sheet = _add_sheet(self._writer, "Log", block)
+            ws, is_date = self._sheet
+            _write_block(ws, self.rows + 1, block, is_date)
+        else:
+            import pyarrow as pa
+
+            table = pa.Table.from_pandas(block, preserve_index=False)
+            if first:
+                if self.fmt == "parquet":
+                    import pyarrow.parquet as pq
+
+                    self._writer = pq.ParquetWriter(self.target, table.schema)
+                else:
+                    self._writer = pa.ipc.new_file(self.target, table.schema)
+            self._writer.write_table(table)
+
+    def close(self) -> None:
+        self.flush()
+        if self.fmt == "csv":
+            if isinstance(self.target, (str, Path)):
+                self._writer.close()
+        else:
+            self._writer.close()
+
+    def points_frame(self) -> pd.DataFrame:
+        """Points cumulés par médecin, à passer à `update_pointage` comme planning."""
+        return pd.DataFrame(
+            {"Médecin": list(self.points), "Points jour": list(self.points.values())},
+            columns=["Médecin", "Points jour"],
+        )
+
+    def __enter__(self) -> "PlanningSink":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
 # =========================
 # Guides PDF
 # =========================
 def make_guide_planner():
+    from reportlab.pdfgen import canvas as pdf_canvas
+
     buf = io.BytesIO()
     c = pdf_canvas.Canvas(buf)
     t = c.beginText(40, 800)
@@ -493,6 +2681,8 @@ def make_guide_planner():
 
 
 def make_guide_physician():
+    from reportlab.pdfgen import canvas as pdf_canvas
+
     buf = io.BytesIO()
     c = pdf_canvas.Canvas(buf)
     t = c.beginText(40, 800)
@@ -511,27 +2701,442 @@ def make_guide_physician():
     return buf.getvalue()
 
 
+# Guides précalculés (voir le Dockerfile) : lus tels quels s'ils existent,
+# sinon générés une fois par processus.
+ASSETS_DIR = Path(os.environ.get("PLANNING_ASSETS_DIR", Path(__file__).with_name("assets")))
+GUIDE_FILES = {"planner": "guide_gestionnaire.pdf", "physician": "guide_medecin.pdf"}
+_GUIDE_BUILDERS = {"planner": make_guide_planner, "physician": make_guide_physician}
+
+
+def build_static_assets(target=None) -> list[str]:
+    """Écrit les guides PDF dans `target` (par défaut ASSETS_DIR), au build de l'image."""
+    target = Path(target or ASSETS_DIR)
+    target.mkdir(parents=True, exist_ok=True)
+    written = []
+    for kind, name in GUIDE_FILES.items():
+        (target / name).write_bytes(_GUIDE_BUILDERS[kind]())
+        written.append(str(target / name))
+    return written
+
+
+# =========================
+# Fiches individuelles (PDF et iCalendar)
+# =========================
+DOCTOR_FILE_COLS = ["Date", "Type", "Statut", "Points jour", "Score avant", "Score après"]
+
+
+def doctor_schedules(planning_df: pd.DataFrame) -> list[tuple[str, pd.DataFrame]]:
+    """Planning découpé par médecin (ordre alphabétique), gardes triées par date."""
+    assigned = planning_df[planning_df["Médecin"].notna() & planning_df["Date"].notna()]
+    cols = [c for c in (*DOCTOR_FILE_COLS, ORDER_COL) if c in assigned.columns]
+    return [
+        (str(md), rows[cols].sort_values("Date").reset_index(drop=True))
+        for md, rows in assigned.groupby("Médecin", sort=True, observed=True)
+    ]
+
+
+def doctor_file_stem(doctor: str) -> str:
+    """Nom de fichier ASCII pour un médecin ("Dr Émile Roux" -> "Dr_Emile_Roux")."""
+    text = unicodedata.normalize("NFKD", doctor).encode("ascii", "ignore").decode()
+    stem = "".join(ch if ch.isalnum() else "_" for ch in text)
+    return "_".join(part for part in stem.split("_") if part) or "medecin"
+
+
+def _fmt_points(value) -> str:
+    if value is None or pd.isna(value):
+        return "—"
+    return f"{value:g}" if isinstance(value, float) else str(value)
+
+
+def _score_range(rows: pd.DataFrame) -> tuple:
+    # scores dans l'ordre de décision : avant la première attribution, après la dernière
+    ordered = rows.sort_values(ORDER_COL) if ORDER_COL in rows.columns else rows
+    return ordered["Score avant"].iloc[0], ordered["Score après"].iloc[-1]
+
+
+def make_doctor_pdf(doctor: str, rows: pd.DataFrame) -> bytes:
+    """Fiche PDF d'un médecin : ses gardes (date, type, statut, points, scores) et un résumé."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas as pdf_canvas
+
+    buf = io.BytesIO()
+    c = pdf_canvas.Canvas(buf, pagesize=A4)
+    c.setTitle(f"Planning de garde - {doctor}")
+    _, height = A4
+    columns = [
+        ("Date", 40),
+        ("Jour", 115),
+        ("Type", 195),
+        ("Statut", 255),
+        ("Points", 315),
+        ("Score avant", 375),
+        ("Score après", 460),
+    ]
+
+    def header(y: float) -> float:
+        c.setFont("Helvetica-Bold", 10)
+        for label, x in columns:
+            c.drawString(x, y, label)
+        c.line(40, y - 4, 555, y - 4)
+        c.setFont("Helvetica", 10)
+        return y - 18
+
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(40, height - 50, f"Planning de garde : {doctor}")
+    c.setFont("Helvetica", 10)
+    we_days = int((rows["Type"] == "WE").sum())
+    start, end = _score_range(rows) if len(rows) else (None, None)
+    summary = [
+        f"Gardes : {len(rows)} (dont {we_days} jour(s) de week-end)",
+        f"Points : {_fmt_points(rows['Points jour'].sum())}",
+        f"Score : {_fmt_points(start)} -> {_fmt_points(end)}",
+    ]
+    if len(rows):
+        summary.insert(0, f"Du {rows['Date'].min():%d/%m/%Y} au {rows['Date'].max():%d/%m/%Y}")
+    y = height - 70
+    for line in summary:
+        c.drawString(40, y, line)
+        y -= 14
+    y = header(y - 12)
+    for rec in rows.itertuples(index=False):
+        if y < 50:
+            c.showPage()
+            y = header(height - 50)
+        d = rec[0]
+        values = [
+            f"{d:%d/%m/%Y}",
+            WEEKDAY_NAMES[d.weekday()],
+            str(rec[1]),
+            str(rec[2]),
+            *(_fmt_points(v) for v in rec[3:6]),
+        ]
+        for (_, x), text in zip(columns, values):
+            c.drawString(x, y, text)
+        y -= 14
+    c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+def _ical_text(text: str) -> str:
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def _ical_fold(line: str) -> list[str]:
+    # RFC 5545 : lignes de 75 octets au plus, suite précédée d'un espace
+    parts, current, size = [], "", 0
+    for ch in line:
+        n = len(ch.encode("utf-8"))
+        if size + n > 75:
+            parts.append(current)
+            current, size = " ", 1
+        current += ch
+        size += n
+    return [*parts, current]
+
+
+def make_doctor_ical(doctor: str, rows: pd.DataFrame, stamp: datetime | None = None) -> bytes:
+    """Calendrier iCalendar d'un médecin : un événement d'une journée par garde."""
+    stamp = (stamp or datetime.now(timezone.utc)).strftime("%Y%m%dT%H%M%SZ")
+    stem = doctor_file_stem(doctor)
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//planning-gardes//Planning de garde//FR",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{_ical_text(f'Gardes - {doctor}')}",
+    ]
+    for rec in rows.itertuples(index=False):
+        d, kind, statut, pts, before, after = rec[:6]
+        description = (
+            f"Statut : {statut}\nPoints : {_fmt_points(pts)}\n"
+            f"Score : {_fmt_points(before)} -> {_fmt_points(after)}"
+        )
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:{d:%Y%m%d}-{stem}@planning-gardes",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART;VALUE=DATE:{d:%Y%m%d}",
+            f"DTEND;VALUE=DATE:{d + timedelta(days=1):%Y%m%d}",
+            "SUMMARY:" + _ical_text("Garde de week-end" if kind == "WE" else "Garde"),
+            f"DESCRIPTION:{_ical_text(description)}",
+            "TRANSP:OPAQUE",
+            "END:VEVENT",
+        ]
+    lines.append("END:VCALENDAR")
+    return ("\r\n".join(part for line in lines for part in _ical_fold(line)) + "\r\n").encode("utf-8")
+
+
+def doctor_files(doctor: str, rows: pd.DataFrame, stamp: datetime | None = None) -> list[tuple[str, bytes]]:
+    """Fiche PDF et calendrier .ics d'un médecin -> [(nom de fichier, contenu)]."""
+    stem = doctor_file_stem(doctor)
+    return [
+        (f"{stem}.pdf", make_doctor_pdf(doctor, rows)),
+        (f"{stem}.ics", make_doctor_ical(doctor, rows, stamp)),
+    ]
+
+
+# =========================
+# Cache partagé entre reruns et sessions
+# =========================
+class BoundedCache:
+    """Cache LRU borné et thread-safe, partagé par toutes les sessions du processus.
+
+    Les valeurs mises en cache sont partagées : elles ne doivent pas être
+    modifiées par l'appelant.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                return self._data[key]
+        value = compute()
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_TEMPLATE_CACHE = BoundedCache(16)
+_GUIDE_CACHE = BoundedCache(2)
+_UPLOAD_CACHE = BoundedCache(8)
+_PLANNING_CACHE = BoundedCache(32)
+_EXPORT_CACHE = BoundedCache(64)
+_STORE_CACHE = BoundedCache(4)
+
+
+def cached_template(*template_args, store=None) -> bytes:
+    """Modèle Excel, mis en cache selon les arguments de `create_template_excel`.
+
+    Avec `store`, il est prérempli avec les médecins et le pointage du dernier
+    planning publié.
+    """
+    if store is None:
+        return _TEMPLATE_CACHE.get_or_compute(
+            template_args, lambda: create_template_excel(*template_args).getvalue()
+        )
+
+    def compute():
+        periods_ante = template_args[2]
+        return create_template_excel(
+            *template_args,
+            doctors=store.roster() or None,
+            pointage_df=store.pointage_frame(periods_ante),
+        ).getvalue()
+
+    return _TEMPLATE_CACHE.get_or_compute(
+        (*template_args, store.path, store.service, store.revision()), compute
+    )
+
+
+def cached_guide(kind: str) -> bytes:
+    """Guide PDF ("planner" ou "physician"), précalculé ou généré une fois par processus."""
+
+    def compute():
+        prebuilt = ASSETS_DIR / GUIDE_FILES[kind]
+        if prebuilt.is_file():
+            return prebuilt.read_bytes()
+        return _GUIDE_BUILDERS[kind]()
+
+    return _GUIDE_CACHE.get_or_compute(kind, compute)
+
+
+def load_upload(data: bytes) -> tuple[str, WorkbookData]:
+    """Charge un classeur importé, sans le relire si son contenu n'a pas changé."""
+    digest = hashlib.sha256(data).hexdigest()
+    return digest, _UPLOAD_CACHE.get_or_compute(digest, lambda: load_workbook(io.BytesIO(data)))
+
+
+def planning_key(digest: str, run_args: tuple, store=None) -> tuple:
+    """Clé de `cached_planning` ; avec `store`, la révision de l'historique publié en fait partie."""
+    key = (digest, *run_args)
+    if store is not None:
+        key += (store.path, store.service, store.revision())
+    return key
+
+
+def cached_planning(digest: str, dispo, pointage, gardes, prev, *run_args, store=None, progress=None):
+    """`generate_planning` mis en cache selon l'empreinte du fichier et les paramètres.
+
+    `run_args` = (seuil_proximite, max_weekends, bonus_oui, periods_ante, engine, time_budget,
+    weekend_order). Un calcul annulé via `progress` n'est pas mis en cache.
+    Retourne (clé, (planning, pointage mis à jour), profiler) : le log détaillé
+    n'est pas gardé en mémoire, il se déduit du planning (`planning_log`).
+    """
+    key = planning_key(digest, run_args, store)
+
+    def compute():
+        profiler = PhaseProfiler()
+        planning, _, pointage_update = generate_planning(
+            dispo, pointage, gardes, prev, *run_args, profiler=profiler, store=store,
+            progress=progress,
+        )
+        return (planning, pointage_update), profiler
+
+    result, profiler = _PLANNING_CACHE.get_or_compute(key, compute)
+    return key, result, profiler
+
+
+def open_store(path: str, service: str = "") -> ScheduleStore:
+    """Une connexion par base, service et processus, partagée entre sessions."""
+    return _STORE_CACHE.get_or_compute((str(path), str(service)), lambda: ScheduleStore(path, service))
+
+
+def to_xlsx_bytes(df: pd.DataFrame) -> bytes:
+    buf = io.BytesIO()
+    df.to_excel(buf, index=False)
+    return buf.getvalue()
+
+
+def cached_workbook_export(key, planning_df, log_df, pointage_df) -> bytes:
+    """Classeur consolidé, construit à la demande puis réutilisé tant que `key` ne change pas."""
+    return _EXPORT_CACHE.get_or_compute(
+        (key, "classeur"), lambda: consolidated_workbook(planning_df, log_df, pointage_df)
+    )
+
+
+def cached_doctor_files(key, planning_df: pd.DataFrame) -> bytes:
+    """Archive zip des fiches PDF et calendriers .ics de chaque médecin, rendus en parallèle."""
+    # importé par son nom : les processus du pool doivent pouvoir retrouver les fonctions
+    from planning_gardes_cli import export_doctor_files
+
+    def compute():
+        buf = io.BytesIO()
+        export_doctor_files(planning_df, buf)
+        return buf.getvalue()
+
+    return _EXPORT_CACHE.get_or_compute((key, "fiches"), compute)
+
+
+def cached_export(key, df: pd.DataFrame, fmt: str = "xlsx") -> bytes:
+    """Export de `df` au format `fmt`, mis en cache sous `key` (clé du calcul qui l'a produit)."""
+    return _EXPORT_CACHE.get_or_compute((key, fmt), lambda: table_bytes(df, fmt))
+
+
+# =========================
+# Calculs en arrière-plan
+# =========================
+# Threads du processus Streamlit : le calcul ne bloque plus le script de la
+# page, et survit aux reruns déclenchés pendant qu'il tourne. Un seul pool
+# par processus (module importé, voir le bas du fichier), borné par
+# PLANNING_JOB_WORKERS pour toutes les sessions.
+_JOB_WORKERS = int(os.environ.get("PLANNING_JOB_WORKERS", "2"))
+_JOB_EXECUTOR: ThreadPoolExecutor | None = None
+_JOB_EXECUTOR_LOCK = threading.Lock()
+
+
+def _job_executor() -> ThreadPoolExecutor:
+    global _JOB_EXECUTOR
+    with _JOB_EXECUTOR_LOCK:
+        if _JOB_EXECUTOR is None:
+            _JOB_EXECUTOR = ThreadPoolExecutor(max_workers=_JOB_WORKERS, thread_name_prefix="planning")
+        return _JOB_EXECUTOR
+
+
+@dataclass
+class PlanningJob:
+    """Calcul de planning soumis en arrière-plan pour une session."""
+
+    key: tuple
+    future: Future
+    progress: JobProgress
+    store: tuple | None = None  # (base, service) de l'historique utilisé
+    run_args: tuple = ()  # paramètres du calcul (voir `cached_planning`)
+
+    def done(self) -> bool:
+        return self.future.done()
+
+
+def submit_planning(
+    current: PlanningJob | None, digest: str, dispo, pointage, gardes, prev, *run_args, store=None
+) -> PlanningJob:
+    """Lance `cached_planning` en arrière-plan et retourne le job de la session.
+
+    Une demande identique à `current` encore en cours le réutilise tel quel ;
+    une demande différente annule `current`, devenu inutile.
+    """
+    key = planning_key(digest, run_args, store)
+    if current is not None and not current.done():
+        if current.key == key:
+            return current
+        current.progress.cancel()
+    progress = JobProgress()
+    future = _job_executor().submit(
+        cached_planning, digest, dispo, pointage, gardes, prev, *run_args,
+        store=store, progress=progress,
+    )
+    return PlanningJob(
+        key, future, progress, (store.path, store.service) if store is not None else None, run_args
+    )
+
+
+def progress_text(steps: dict[str, tuple[int, int]]) -> tuple[float, str]:
+    """Fraction globale et libellé (« Week-ends 3/26 · Jours simples 0/130 »)."""
+    done = sum(d for d, _ in steps.values())
+    total = sum(t for _, t in steps.values())
+    label = " · ".join(f"{step} {d}/{t}" for step, (d, t) in steps.items())
+    return (done / total if total else 0.0), (label or "Préparation des données...")
+
+
 # =========================
 # Interface utilisateur
 # =========================
 def main():
+    # Import local : le moteur reste utilisable sans Streamlit (CLI, traitements par lot)
+    import streamlit as st
+
     st.set_page_config(page_title="Planning Gardes", layout="wide")
     st.title("Planning de gardes optimisé")
 
     with st.sidebar.expander("📖 Guides & Consignes", expanded=True):
         st.download_button(
             "Guide gestionnaire (.pdf)",
-            make_guide_planner(),
+            cached_guide("planner"),
             "guide_gestionnaire.pdf",
             "application/pdf",
         )
         st.download_button(
             "Guide médecin (.pdf)",
-            make_guide_physician(),
+            cached_guide("physician"),
             "guide_medecin.pdf",
             "application/pdf",
         )
 
+    st.sidebar.header("Historique publié")
+    store_path = st.sidebar.text_input(
+        "Base d'historique", os.environ.get("PLANNING_STORE", "planning_gardes.db")
+    )
+    use_store = st.sidebar.checkbox(
+        "Utiliser l'historique publié",
+        help="Remplace une feuille \"Période précédente\" vide par les plannings déjà publiés.",
+    )
+    # une base peut être partagée : chaque service n'y voit que ses propres périodes ;
+    # par défaut, le nom du fichier importé (déjà connu ici, avant sa lecture)
+    uploaded = st.session_state.get("upload")
+    service = st.sidebar.text_input(
+        "Service",
+        Path(uploaded.name).stem if uploaded is not None else st.session_state.get("upload_name", ""),
+        disabled=not use_store,
+    ).strip()
+    if use_store and not service:
+        st.sidebar.warning("Indiquez le service (par défaut, le nom du fichier importé).")
+    store = open_store(store_path, service) if store_path and use_store and service else None
+    if store is not None:
+        st.sidebar.caption(f"{len(store.periods())} période(s) publiée(s)")
+
     st.sidebar.header("Modèle Excel d'entrée")
     sd = st.sidebar.date_input("Date de début", datetime.today().date())
     nw = st.sidebar.number_input("Nombre de semaines", 1, 52, 4)
@@ -541,93 +3146,357 @@ def main():
     pwr = st.sidebar.number_input("Pts WE AVEC rés", 0, 10, 3)
     pwn = st.sidebar.number_input("Pts WE SANS rés", 0, 10, 4)
 
-    tpl = create_template_excel(sd, nw, pa, psr, psn, pwr, pwn)
-    st.sidebar.download_button(
-        "Télécharger modèle Excel",
-        tpl,
-        "template_planning_gardes.xlsx",
-        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    prefill = store is not None and st.sidebar.checkbox(
+        "Préremplir depuis l'historique",
+        help="Médecins et pointage du dernier planning publié.",
+    )
+    template_args = (sd, nw, pa, psr, psn, pwr, pwn)
+    template_store = store if prefill else None
+    template_key = (
+        template_args,
+        (template_store.path, template_store.service, template_store.revision()) if template_store else None,
     )
+    if st.sidebar.button("Préparer le modèle Excel"):
+        st.session_state["template_key"] = template_key
+    # construit à la demande : le premier affichage n'écrit aucun classeur
+    if st.session_state.get("template_key") == template_key:
+        st.sidebar.download_button(
+            "Télécharger modèle Excel",
+            cached_template(*template_args, store=template_store),
+            "template_planning_gardes.xlsx",
+            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        )
 
     st.sidebar.header("Paramètres attribution")
     seuil = st.sidebar.number_input("Seuil proximité (jours)", 1, 28, 6)
     mw = st.sidebar.number_input("Max WE par médecin", 0, 52, 1)
     bo = st.sidebar.number_input("Bonus OUI (pts)", 0, 100, 5)
+    engine = {"Glouton": "greedy", "Optimisé": "optimal"}[
+        st.sidebar.radio("Moteur d'attribution", ["Glouton", "Optimisé"], horizontal=True)
+    ]
+    budget = 5.0
+    if engine == "optimal":
+        budget = st.sidebar.number_input("Budget de calcul (s)", 1.0, 120.0, 5.0)
+    weekend_order = {"Statique": "static", "Dynamique": "dynamic"}[
+        st.sidebar.radio(
+            "Ordre des week-ends",
+            ["Statique", "Dynamique"],
+            horizontal=True,
+            help="Dynamique : le week-end le plus contraint restant est attribué en premier.",
+        )
+    ]
 
-    up = st.sidebar.file_uploader("Importer fichier Excel (.xlsx)", type=["xlsx"])
+    show_perf = st.sidebar.checkbox("Afficher les performances")
+    ui_prof = PhaseProfiler()
+
+    export_fmt = st.sidebar.selectbox("Format des exports", available_formats())
+    ext, mime = EXPORT_FORMATS[export_fmt]
+
+    up = st.sidebar.file_uploader(
+        "Importer fichier Excel (.xlsx) ou feuilles CSV/Parquet (.zip)", type=["xlsx", "zip"], key="upload"
+    )
     if up:
-        xls = pd.ExcelFile(up)
-        errs = validate_file(xls)
-        if errs:
-            st.sidebar.error("Erreurs de format :\n" + "\n".join(errs))
+        with ui_prof.phase("Lecture du fichier importé"):
+            digest, wb = load_upload(up.getvalue())
+        if wb.errors:
+            st.sidebar.error("Erreurs de format :\n" + "\n".join(wb.errors))
             st.stop()
-        st.session_state["dispo"] = xls.parse("Dispo Période")
-        st.session_state["pointage"] = xls.parse("Pointage gardes")
-        st.session_state["gardes"] = xls.parse("Gardes résidents")
-        st.session_state["prev"] = xls.parse(PREV_SHEET) if PREV_SHEET in xls.sheet_names else None
-        if "Paramètres" in xls.sheet_names:
-            params_df = xls.parse("Paramètres")
+        previous = st.session_state.get("upload_digest")
+        if previous is not None and previous != digest and "planning" in st.session_state:
+            # Nouvelle version du même classeur : proposer une mise à jour incrémentale
             try:
-                params_map = dict(zip(params_df["Paramètre"], params_df["Valeur"]))
-                st.session_state["periods_ante"] = int(params_map.get("periods_ante", 12))
-            except Exception:
-                st.session_state["periods_ante"] = 12
-        else:
-            st.session_state["periods_ante"] = 12
+                st.session_state["dispo_changes"] = diff_dispo(
+                    st.session_state["workbook"].dispo, wb.dispo
+                )
+            except (ValueError, KeyError):
+                st.session_state.pop("dispo_changes", None)
+        # Référence au classeur normalisé de `_UPLOAD_CACHE` (module importé,
+        # donc commun aux reruns et aux sessions) : les sessions qui importent
+        # le même fichier partagent un seul objet. Sorti du cache, il reste
+        # tenu par les sessions qui l'utilisent, sans nouvelle lecture.
+        st.session_state["upload_digest"] = digest
+        st.session_state["upload_name"] = Path(up.name).stem
+        st.session_state["workbook"] = wb
+        st.sidebar.caption(
+            "Lecture : " + ", ".join(f"{k} {v * 1000:.0f} ms" for k, v in wb.timings.items())
+        )
 
-    if "dispo" in st.session_state:
+    wb = st.session_state.get("workbook")
+    if wb is not None:
+        # paramètres du calcul : arguments de `cached_planning` et clé des exports
+        run_args = (seuil, mw, bo, wb.periods_ante, engine, budget, weekend_order)
         if st.sidebar.button("Recalculer le planning"):
-            p, l, pt = generate_planning(
-                st.session_state["dispo"],
-                st.session_state["pointage"],
-                st.session_state["gardes"],
-                st.session_state["prev"],
-                seuil,
-                mw,
-                bo,
-                st.session_state.get("periods_ante", 12),
+            prev = wb.prev
+            run_store = store if store is not None and (prev is None or prev.empty) else None
+            job = submit_planning(
+                st.session_state.get("planning_job"),
+                st.session_state["upload_digest"],
+                wb.dispo,
+                wb.pointage,
+                wb.gardes,
+                None if run_store is not None else prev,
+                *run_args,
+                store=run_store,
+            )
+            st.session_state["planning_job"] = job
+            # Un calcul court (ou déjà en cache) est rattaché dès ce passage
+            wait([job.future], timeout=0.2)
+
+        @st.fragment(run_every=0.5)
+        def planning_job_status():
+            job = st.session_state.get("planning_job")
+            if job is None:
+                return
+            if job.done():
+                st.rerun()
+            fraction, label = progress_text(job.progress.snapshot())
+            st.progress(fraction, text=label)
+            recent = job.progress.recent()
+            if recent:
+                # dernières attributions décidées, affichées pendant le calcul
+                st.dataframe(
+                    pd.DataFrame(recent, columns=["Date", "Médecin", "Statut", "Type"]).iloc[::-1],
+                    hide_index=True,
+                )
+            if st.button("Annuler le calcul", disabled=job.progress.cancelled):
+                job.progress.cancel()
+
+        job = st.session_state.get("planning_job")
+        if job is not None and job.done():
+            del st.session_state["planning_job"]
+            try:
+                run_key, (p, pt), planning_prof = job.future.result()
+            except PlanningCancelled:
+                st.sidebar.info("Calcul du planning annulé.")
+            else:
+                st.session_state["history_store"] = job.store
+                st.session_state["run_args"] = job.run_args
+                st.session_state["run_key"] = run_key
+                st.session_state["planning_perf"] = planning_prof
+                st.session_state["planning"] = p
+                st.session_state["pt_update"] = pt
+                st.session_state.pop("dispo_changes", None)
+        elif job is not None:
+            with st.sidebar:
+                planning_job_status()
+
+        changes = st.session_state.get("dispo_changes")
+        if changes is not None and len(changes) and "planning" in st.session_state:
+            if st.sidebar.button(f"Mettre à jour le planning ({len(changes)} dispo modifiées)"):
+                planning_prof = PhaseProfiler()
+                prev = wb.prev
+                history = None
+                if st.session_state.get("history_store"):
+                    history = open_store(*st.session_state["history_store"])
+                    prev = history.previous_assignments(wb.dispo["Date"].min(), seuil)
+                with planning_prof.phase("Re-planification incrémentale", rows=len(changes)):
+                    p, _, pt = replan_incremental(
+                        wb.dispo,
+                        wb.pointage,
+                        wb.gardes,
+                        prev,
+                        st.session_state["planning"],
+                        changes,
+                        seuil,
+                        mw,
+                        bo,
+                        wb.periods_ante,
+                        pointage_update_df=st.session_state["pt_update"],
+                        weekend_order=weekend_order,
+                    )
+                # Les exports sont en cache pour tout le processus : la clé reprend
+                # les paramètres de la mise à jour, pas seulement le planning de départ
+                st.session_state["run_key"] = (
+                    "incrémental",
+                    st.session_state["run_key"],
+                    planning_key(st.session_state["upload_digest"], run_args, history),
+                )
+                st.session_state["planning_perf"] = planning_prof
+                st.session_state["planning"] = p
+                st.session_state["pt_update"] = pt
+                st.session_state.pop("dispo_changes")
+
+    if wb is not None:
+        with st.expander("🔬 Explorer des scénarios"):
+            c1, c2, c3 = st.columns(3)
+            seuils = c1.slider("Seuil proximité (jours)", 1, 28, (max(1, seuil - 2), min(28, seuil + 2)))
+            max_wes = c2.slider("Max WE par médecin", 0, 52, (mw, min(52, mw + 1)))
+            bonuses = c3.slider("Bonus OUI (pts)", 0, 100, (max(0, bo - 5), min(100, bo + 5)), step=5)
+            grid = (
+                list(range(seuils[0], seuils[1] + 1)),
+                list(range(max_wes[0], max_wes[1] + 1)),
+                list(range(bonuses[0], bonuses[1] + 1, 5)),
             )
-            st.session_state["planning"] = p
-            st.session_state["log"] = l
-            st.session_state["pt_update"] = pt
+            n_scenarios = len(grid[0]) * len(grid[1]) * len(grid[2])
+            if st.button(f"Comparer {n_scenarios} scénarios"):
+                # Import par nom : les processus du pool doivent pouvoir réimporter le moteur
+                from planning_gardes_cli import sweep_parameters
+
+                st.session_state["scenarios"] = sweep_parameters(
+                    wb.dispo,
+                    wb.pointage,
+                    wb.gardes,
+                    wb.prev,
+                    *grid,
+                    periods_ante=wb.periods_ante,
+                )
+            if "scenarios" in st.session_state:
+                st.dataframe(st.session_state["scenarios"])
 
     if "planning" in st.session_state:
+        with st.expander("🎲 Robustesse du planning"):
+            c1, c2, c3 = st.columns(3)
+            n_runs = c1.number_input("Simulations", 100, 20000, 1000, step=100)
+            prn_to_non = c2.slider("Désistement PRN → NON", 0.0, 0.5, 0.05, step=0.01)
+            points_prob = c3.slider("Changement des points résidents", 0.0, 1.0, 0.1, step=0.05)
+            if st.button(f"Simuler {n_runs} imprévus"):
+                # Import par nom : les processus du pool doivent pouvoir réimporter le moteur
+                from planning_gardes_cli import evaluate_robustness
+
+                prev = wb.prev
+                if st.session_state.get("history_store"):
+                    prev = open_store(*st.session_state["history_store"]).previous_assignments(
+                        wb.dispo["Date"].min(), seuil
+                    )
+                # même moteur que le planning de référence (une mise à jour
+                # incrémentale garde celui du calcul complet dont elle part)
+                _, _, _, _, ref_engine, ref_budget, _ = st.session_state["run_args"]
+                with st.spinner("Simulation en cours..."):
+                    st.session_state["robustness"] = (
+                        st.session_state["run_key"],
+                        evaluate_robustness(
+                            st.session_state["planning"],
+                            wb.dispo,
+                            wb.pointage,
+                            wb.gardes,
+                            prev,
+                            seuil,
+                            mw,
+                            bo,
+                            n_runs=int(n_runs),
+                            weekend_order=weekend_order,
+                            engine=ref_engine,
+                            time_budget=ref_budget,
+                            prn_to_non=prn_to_non,
+                            points_prob=points_prob,
+                        ),
+                    )
+            robustness = st.session_state.get("robustness")
+            if robustness is not None and robustness[0] == st.session_state["run_key"]:
+                summary, per_day, per_doctor = robustness[1]
+                shown = {
+                    "Probabilité d'un jour non attribué": "{:.1%}",
+                    "Jours non attribués (moyenne)": "{:.2f}",
+                    "Part de gardes NON": "{:.1%}",
+                    "Jours modifiés (moyenne)": "{:.1f}",
+                }
+                for col, (label, fmt) in zip(st.columns(len(shown)), shown.items()):
+                    col.metric(label, fmt.format(summary[label]))
+                st.dataframe(per_day[per_day["P(non attribué)"] > 0])
+                st.dataframe(per_doctor)
+
+    # seulement si l'historique est utilisé : sinon aucune base n'est créée
+    if "planning" in st.session_state and store is not None:
+        if st.sidebar.button("Publier le planning"):
+            try:
+                label = store.publish(
+                    st.session_state["planning"], st.session_state["pt_update"]
+                )
+                st.sidebar.success(f"Période publiée : {label}")
+            except ValueError as exc:
+                st.sidebar.error(str(exc))
+
+    if "planning" in st.session_state:
+        run_key = st.session_state["run_key"]
+
         st.subheader("🚑 Planning")
         st.dataframe(st.session_state["planning"])
-        buf1 = io.BytesIO()
-        st.session_state["planning"].to_excel(buf1, index=False)
-        buf1.seek(0)
-        st.download_button(
-            "Télécharger planning",
-            buf1,
-            "planning.xlsx",
-            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        )
+        with ui_prof.phase("Export planning"):
+            export_planning = cached_export(
+                (run_key, "planning"), st.session_state["planning"], export_fmt
+            )
+        st.download_button("Télécharger planning", export_planning, f"planning{ext}", mime)
 
         st.subheader("📋 Log détaillé")
-        st.dataframe(st.session_state["log"])
-        buf2 = io.BytesIO()
-        st.session_state["log"].to_excel(buf2, index=False)
-        buf2.seek(0)
-        st.download_button(
-            "Télécharger log",
-            buf2,
-            "log.xlsx",
-            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        )
+        # déduit du planning à l'affichage plutôt que gardé en double dans la session
+        log = planning_log(st.session_state["planning"])
+        st.dataframe(log)
+        with ui_prof.phase("Export log"):
+            export_log = cached_export((run_key, "log"), log, export_fmt)
+        st.download_button("Télécharger log", export_log, f"log{ext}", mime)
 
         st.subheader("📊 Pointage mis à jour")
         st.dataframe(st.session_state["pt_update"])
-        buf3 = io.BytesIO()
-        st.session_state["pt_update"].to_excel(buf3, index=False)
-        buf3.seek(0)
-        st.download_button(
-            "Télécharger pointage",
-            buf3,
-            "pointage.xlsx",
-            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        )
+        with ui_prof.phase("Export pointage"):
+            export_pointage = cached_export(
+                (run_key, "pointage"), st.session_state["pt_update"], export_fmt
+            )
+        st.download_button("Télécharger pointage", export_pointage, f"pointage{ext}", mime)
+
+        st.subheader("📦 Classeur complet")
+        st.caption("Planning, calendrier, synthèse par médecin, pointage et log dans un seul fichier.")
+        if st.button("Préparer le classeur complet"):
+            with ui_prof.phase("Export classeur complet"):
+                st.session_state["workbook_export"] = (
+                    run_key,
+                    cached_workbook_export(
+                        run_key, st.session_state["planning"], log, st.session_state["pt_update"]
+                    ),
+                )
+        # construit à la demande, puis gardé dans la session tant que le planning ne change pas
+        export_key, export_full = st.session_state.get("workbook_export", (None, None))
+        if export_key == run_key:
+            st.download_button(
+                "Télécharger le classeur complet",
+                export_full,
+                "planning_complet.xlsx",
+                EXPORT_FORMATS["xlsx"][1],
+            )
+        elif export_key is not None:
+            # planning recalculé : l'ancien classeur n'est plus téléchargeable
+            del st.session_state["workbook_export"]
+
+        st.subheader("🗂️ Fiches individuelles")
+        st.caption("Pour chaque médecin : ses gardes en PDF et un calendrier .ics à importer dans son agenda.")
+        if st.button("Préparer les fiches individuelles"):
+            with ui_prof.phase("Export fiches individuelles"):
+                with st.spinner("Génération des fiches..."):
+                    st.session_state["doctor_files"] = (
+                        run_key,
+                        cached_doctor_files(run_key, st.session_state["planning"]),
+                    )
+        # rendu une fois (pool de processus), puis gardé dans la session tant que le planning ne change pas
+        fiches_key, export_fiches = st.session_state.get("doctor_files", (None, None))
+        if fiches_key == run_key:
+            st.download_button(
+                "Télécharger les fiches (.zip)", export_fiches, "fiches_medecins.zip", "application/zip"
+            )
+        elif fiches_key is not None:
+            del st.session_state["doctor_files"]
+
+    if show_perf:
+        with st.expander("⏱️ Performance", expanded=True):
+            perf = PhaseProfiler()
+            if "planning_perf" in st.session_state:
+                perf.merge(st.session_state["planning_perf"], prefix="Planning · ")
+            for sheet, seconds in (wb.timings if wb is not None else {}).items():
+                perf.add(f"Lecture · {sheet}", seconds)
+            perf.merge(ui_prof, prefix="Interface · ")
+            perf.log()
+            st.dataframe(perf.to_frame())
+            st.download_button(
+                "Exporter les mesures (JSON)", perf.to_json(), "performance.json", "application/json"
+            )
 
 
 if __name__ == "__main__":
-    main()
+    # `streamlit run` exécute ce fichier comme un nouveau module __main__ à
+    # chaque rerun : ses variables globales (caches, pool de calcul) y
+    # repartiraient de zéro. L'interface passe donc par le module importé,
+    # chargé une fois par processus et partagé entre reruns et sessions.
+    here = str(Path(__file__).resolve().parent)
+    if here not in sys.path:
+        sys.path.insert(0, here)
+    import planning_gardes_app
+
+    planning_gardes_app.main()
@@ -0,0 +1,890 @@
+"""Génération des plannings sans interface (ligne de commande, traitements par lot).
+
+Exemples :
+
+    python planning_gardes_cli.py plan service_a.xlsx -o sorties/
+    python planning_gardes_cli.py plan classeurs/ -o sorties/ --workers 8 --seuil 6
+    python planning_gardes_cli.py plan service_a.xlsx --store historique.db --publish
+    python planning_gardes_cli.py plan service_a.xlsx service_b.xlsx --store historique.db --publish
+    python planning_gardes_cli.py plan service_b/ --format parquet -o sorties/
+    python planning_gardes_cli.py plan horizon_5_ans.xlsx --stream --format parquet -o sorties/
+    python planning_gardes_cli.py multisite site_nord.xlsx site_sud.xlsx -o sorties/
+    python planning_gardes_cli.py sweep service_a.xlsx --seuil 4-8 --max-we 1-2 --bonus-oui 0,5,10
+    python planning_gardes_cli.py robustness service_a.xlsx --runs 2000 --prn-non 0.1 -o sorties/
+    python planning_gardes_cli.py fiches service_a.xlsx -o fiches_service_a.zip
+
+Chaque classeur doit suivre le format du modèle Excel ("Dispo Période",
+"Pointage gardes", "Gardes résidents", et optionnellement "Période
+précédente" / "Paramètres"), ou être un dossier / une archive zip de ces
+feuilles en CSV, Parquet ou Arrow (un fichier par feuille, nommé d'après la
+feuille). Pour chaque classeur, trois fichiers sont écrits : <nom>_planning,
+<nom>_log et <nom>_pointage, en .xlsx par défaut (voir --format).
+"""
+
+import argparse
+import itertools
+import os
+import sys
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from planning_gardes_app import (
+    BASE_DISPO_COLS,
+    EXPORT_FORMATS,
+    WEEKEND_ORDERS,
+    PhaseProfiler,
+    ScheduleStore,
+    WorkbookData,
+    PlanningSink,
+    consolidated_workbook,
+    doctor_files,
+    doctor_schedules,
+    format_from_suffix,
+    generate_planning,
+    initial_state,
+    iter_planning,
+    is_table_dir,
+    load_workbook,
+    planning_metrics,
+    prepare_planning,
+    robustness_reference,
+    robustness_summary,
+    simulate_robustness,
+    table_bytes,
+    update_pointage,
+)
+
+
+def collect_workbooks(paths: list[str]) -> list[Path]:
+    """Classeurs désignés par `paths` : fichiers .xlsx, archives .zip de feuilles
+    CSV/Parquet/Arrow, ou dossiers de feuilles. Les autres dossiers sont
+    parcourus, non récursivement."""
+    found: list[Path] = []
+    for p in map(Path, paths):
+        if p.is_dir() and not is_table_dir(p):
+            found.extend(
+                sorted(
+                    f
+                    for f in p.iterdir()
+                    if (f.suffix.lower() in (".xlsx", ".zip") and not f.name.startswith("~$"))
+                    or is_table_dir(f)
+                )
+            )
+        else:
+            found.append(p)
+    return found
+
+
+def write_outputs(
+    stem: str, out_dir: Path, planning, log, pointage, profiler=None, fmt: str = "xlsx"
+) -> list[str]:
+    """Écrit <stem>_planning/_log/_pointage.<fmt> dans `out_dir` et retourne leurs chemins."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    profiler = profiler or PhaseProfiler()
+    ext = EXPORT_FORMATS[fmt][0]
+    outputs = []
+    for suffix, df in [("planning", planning), ("log", log), ("pointage", pointage)]:
+        target = out_dir / f"{stem}_{suffix}{ext}"
+        with profiler.phase(f"Export {suffix}", rows=len(df)):
+            target.write_bytes(table_bytes(df, fmt))
+        outputs.append(str(target))
+    return outputs
+
+
+def run_workbook(
+    path: Path,
+    out_dir: Path,
+    seuil_proximite: int = 6,
+    max_weekends: int = 1,
+    bonus_oui: int = 5,
+    periods_ante: int | None = None,
+    engine: str = "greedy",
+    time_budget: float = 5.0,
+    weekend_order: str = "static",
+    profile: bool = False,
+    store_path: str | None = None,
+    publish: bool = False,
+    service: str | None = None,
+    output_format: str = "xlsx",
+    single_workbook: bool = False,
+    stream: bool = False,
+) -> dict:
+    """Calcule le planning d'un classeur et écrit planning, log et pointage dans `out_dir`.
+
+    `periods_ante=None` reprend la valeur de la feuille Paramètres du classeur.
+    Avec `profile`, les temps par phase sont écrits dans <nom>_performance.json.
+    Avec `store_path`, l'historique publié remplace une feuille "Période
+    précédente" vide, et `publish` y enregistre le planning calculé ; les
+    périodes y sont rangées par `service` (par défaut, le nom du classeur).
+    `output_format` : "xlsx", "csv", "parquet" ou "arrow" ; avec `single_workbook`,
+    un seul classeur <nom>_complet.xlsx est écrit à la place des trois fichiers.
+    Avec `stream`, les attributions sont écrites dans <nom>_log au fur et à
+    mesure qu'elles sont décidées (voir `PlanningSink`), sans garder le
+    planning en mémoire ; seuls le log et le pointage sont écrits.
+    """
+    path = Path(path)
+    profiler = PhaseProfiler()
+    with profiler.phase("Lecture du classeur"):
+        wb = load_workbook(path)
+    if wb.errors:
+        return {"fichier": str(path), "erreurs": wb.errors, "sorties": []}
+    for sheet, seconds in wb.timings.items():
+        profiler.add(f"Lecture · {sheet}", seconds)
+
+    store = ScheduleStore(store_path, path.stem if service is None else service) if store_path else None
+    prev = wb.prev if store is None or (wb.prev is not None and len(wb.prev)) else None
+    if stream:
+        if publish or single_workbook:
+            raise ValueError("L'écriture au fil de l'eau exclut la publication et le classeur complet")
+        result = _stream_workbook(
+            path, out_dir, wb, prev, store, output_format,
+            seuil_proximite=seuil_proximite,
+            max_weekends=max_weekends,
+            bonus_oui=bonus_oui,
+            engine=engine,
+            time_budget=time_budget,
+            weekend_order=weekend_order,
+            profiler=profiler,
+        )
+        pointage = update_pointage(
+            wb.pointage, result.pop("points"), wb.periods_ante if periods_ante is None else periods_ante
+        )
+        target = Path(out_dir) / f"{path.stem}_pointage{EXPORT_FORMATS[output_format][0]}"
+        with profiler.phase("Export pointage", rows=len(pointage)):
+            target.write_bytes(table_bytes(pointage, output_format))
+        result["sorties"].append(str(target))
+        if profile:
+            target = Path(out_dir) / f"{path.stem}_performance.json"
+            target.write_text(profiler.to_json(), encoding="utf-8")
+            result["sorties"].append(str(target))
+        return result
+
+    planning, log, pointage = generate_planning(
+        wb.dispo,
+        wb.pointage,
+        wb.gardes,
+        prev,
+        seuil_proximite,
+        max_weekends,
+        bonus_oui,
+        wb.periods_ante if periods_ante is None else periods_ante,
+        engine=engine,
+        time_budget=time_budget,
+        weekend_order=weekend_order,
+        profiler=profiler,
+        store=store,
+    )
+    if store is not None:
+        if publish:
+            with profiler.phase("Publication dans l'historique", rows=len(planning)):
+                store.publish(planning, pointage)
+        store.close()
+
+    if single_workbook:
+        target = Path(out_dir) / f"{path.stem}_complet.xlsx"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with profiler.phase("Export classeur complet", rows=len(log)):
+            target.write_bytes(consolidated_workbook(planning, log, pointage))
+        outputs = [str(target)]
+    else:
+        outputs = write_outputs(path.stem, out_dir, planning, log, pointage, profiler, output_format)
+    if profile:
+        target = Path(out_dir) / f"{path.stem}_performance.json"
+        target.write_text(profiler.to_json(), encoding="utf-8")
+        outputs.append(str(target))
+
+    return {
+        "fichier": str(path),
+        "erreurs": [],
+        "sorties": outputs,
+        "jours": len(planning),
+        "non_attribues": int(planning["Médecin"].isna().sum()) if len(planning) else 0,
+    }
+
+
+def _stream_workbook(path, out_dir, wb, prev, store, fmt, **params) -> dict:
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    target = out_dir / f"{path.stem}_log{EXPORT_FORMATS[fmt][0]}"
+    unassigned = 0
+    with PlanningSink(target, fmt) as sink:
+        for rec in iter_planning(wb.dispo, wb.pointage, wb.gardes, prev, store=store, **params):
+            unassigned += not rec["Médecin"]
+            sink.write(rec)
+    if store is not None:
+        store.close()
+    return {
+        "fichier": str(path),
+        "erreurs": [],
+        "sorties": [str(target)],
+        "jours": sink.rows,
+        "non_attribues": unassigned,
+        "points": sink.points_frame(),
+    }
+
+
+def _run_workbook_safe(path: Path, out_dir: Path, **params) -> dict:
+    # un classeur illisible ne doit pas interrompre le reste du lot
+    try:
+        return run_workbook(path, out_dir, **params)
+    except Exception as exc:
+        return {"fichier": str(path), "erreurs": [f"{type(exc).__name__}: {exc}"], "sorties": []}
+
+
+def run_batch(paths: list[Path], out_dir: Path, workers: int | None = None, **params) -> list[dict]:
+    """Traite plusieurs classeurs, en parallèle sur un pool de processus si possible."""
+    if workers is None:
+        workers = min(len(paths), os.cpu_count() or 1)
+    if workers <= 1 or len(paths) <= 1:
+        return [_run_workbook_safe(p, out_dir, **params) for p in paths]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_run_workbook_safe, p, out_dir, **params) for p in paths]
+        return [fut.result() for fut in futures]
+
+
+# =========================
+# Planification multi-sites
+# =========================
+def doctor_index(sites: dict[str, WorkbookData]) -> dict[str, list[str]]:
+    """Index global des médecins : médecin -> sites où il figure dans "Dispo Période"."""
+    index: dict[str, list[str]] = defaultdict(list)
+    for name, wb in sites.items():
+        for md in wb.dispo.columns:
+            if md not in BASE_DISPO_COLS:
+                index[md].append(name)
+    return dict(index)
+
+
+def site_components(sites: dict[str, WorkbookData]) -> list[list[str]]:
+    """Regroupe les sites reliés par au moins un médecin commun (composantes connexes).
+
+    Deux composantes n'ont aucun médecin en commun et peuvent être calculées
+    indépendamment ; l'ordre des sites d'entrée est conservé.
+    """
+    parent = {name: name for name in sites}
+
+    def find(name):
+        while parent[name] != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
+
+    for names in doctor_index(sites).values():
+        root = find(names[0])
+        for other in names[1:]:
+            parent[find(other)] = root
+
+    components: dict[str, list[str]] = {}
+    for name in sites:
+        components.setdefault(find(name), []).append(name)
+    return list(components.values())
+
+
+def _plan_component(component: list[tuple[str, WorkbookData]], params: dict) -> dict[str, tuple]:
+    # Les sites d'une composante sont calculés l'un après l'autre : les gardes
+    # déjà attribuées aux médecins partagés sont transmises aux sites suivants,
+    # qui les respectent (proximité, week-ends). Pas de parallélisme ici : le
+    # temps d'une composante est la somme de celui de ses sites.
+    shared = {md for md, names in doctor_index(dict(component)).items() if len(names) > 1}
+    params = dict(params)
+    periods_ante = params.pop("periods_ante", None)
+    taken: list[pd.DataFrame] = []
+    results = {}
+    for name, wb in component:
+        planning, log, pointage = generate_planning(
+            wb.dispo,
+            wb.pointage,
+            wb.gardes,
+            wb.prev,
+            periods_ante=wb.periods_ante if periods_ante is None else periods_ante,
+            shared_df=pd.concat(taken, ignore_index=True) if taken else None,
+            **params,
+        )
+        if shared and len(planning):
+            taken.append(planning.loc[planning["Médecin"].isin(shared), ["Date", "Médecin", "Type"]])
+        results[name] = (planning, log, pointage)
+    return results
+
+
+def plan_sites(
+    sites: dict[str, WorkbookData], workers: int | None = None, **params
+) -> dict[str, tuple]:
+    """Calcule les plannings de plusieurs sites partageant une partie de leurs médecins.
+
+    Les composantes indépendantes (voir `site_components`) sont calculées en
+    parallèle ; les sites qui partagent des médecins restent calculés l'un
+    après l'autre (voir `_plan_component`), sans gain de temps. Le temps total
+    est celui de la plus lente composante, somme de ses sites.
+    `params` : arguments de `generate_planning` (seuil_proximite, max_weekends,
+    bonus_oui, periods_ante, engine, time_budget, weekend_order).
+    """
+    groups = [[(name, sites[name]) for name in comp] for comp in site_components(sites)]
+    if workers is None:
+        workers = min(len(groups), os.cpu_count() or 1)
+
+    results: dict[str, tuple] = {}
+    if workers <= 1 or len(groups) <= 1:
+        for group in groups:
+            results.update(_plan_component(group, params))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for fut in [pool.submit(_plan_component, group, params) for group in groups]:
+                results.update(fut.result())
+    return {name: results[name] for name in sites}
+
+
+def cross_site_conflicts(results: dict[str, tuple], seuil_proximite: int = 6) -> pd.DataFrame:
+    """Gardes d'un même médecin sur deux sites à moins de `seuil_proximite` jours."""
+    rows = pd.concat(
+        [
+            planning.loc[planning["Médecin"].notna(), ["Date", "Médecin"]].assign(Site=name)
+            for name, (planning, _, _) in results.items()
+        ],
+        ignore_index=True,
+    )
+    pairs = rows.merge(rows, on="Médecin", suffixes=("", " autre"))
+    gap = (pairs["Date autre"] - pairs["Date"]).dt.days.abs()
+    keep = (pairs["Site"] < pairs["Site autre"]) & (gap < seuil_proximite)
+    return pairs.loc[keep, ["Médecin", "Site", "Date", "Site autre", "Date autre"]].reset_index(drop=True)
+
+
+# =========================
+# Exploration de scénarios
+# =========================
+_SWEEP_INPUTS: tuple | None = None
+
+
+def _init_sweep_worker(inputs: tuple) -> None:
+    # Les données sont transmises une fois par processus, pas une fois par scénario
+    global _SWEEP_INPUTS
+    _SWEEP_INPUTS = inputs
+
+
+def _run_scenario(params: tuple[int, int, int]) -> dict:
+    dispo, pointage, gardes, prev, periods_ante, engine_args = _SWEEP_INPUTS
+    seuil, max_we, bonus = params
+    planning, _, pointage_update = generate_planning(
+        dispo, pointage, gardes, prev, seuil, max_we, bonus, periods_ante, **engine_args
+    )
+    metrics = planning_metrics(planning, pointage_update, dispo)
+    tiers = metrics.pop("Week-ends par tier")
+    row = {"Seuil proximité": seuil, "Max WE": max_we, "Bonus OUI": bonus, **metrics}
+    row.update({f"WE tier {t}": n for t, n in tiers.items()})
+    return row
+
+
+def sweep_parameters(
+    dispo_df: pd.DataFrame,
+    pointage_df: pd.DataFrame,
+    gardes_df: pd.DataFrame,
+    prev_df: pd.DataFrame | None,
+    seuils: list[int],
+    max_weekends: list[int],
+    bonus_ouis: list[int],
+    periods_ante: int = 12,
+    workers: int | None = None,
+    engine: str = "greedy",
+    time_budget: float = 5.0,
+    weekend_order: str = "static",
+) -> pd.DataFrame:
+    """Lance `generate_planning` sur toute la grille de paramètres et compare les résultats.
+
+    Retourne une ligne par scénario, triée du meilleur au moins bon : jours
+    non attribués, puis gardes NON, puis écart de scores.
+    """
+    grid = list(itertools.product(seuils, max_weekends, bonus_ouis))
+    engine_args = {"engine": engine, "time_budget": time_budget, "weekend_order": weekend_order}
+    inputs = (dispo_df, pointage_df, gardes_df, prev_df, periods_ante, engine_args)
+    if workers is None:
+        workers = min(len(grid), os.cpu_count() or 1)
+
+    if workers <= 1 or len(grid) <= 1:
+        _init_sweep_worker(inputs)
+        rows = [_run_scenario(params) for params in grid]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_sweep_worker, initargs=(inputs,)
+        ) as pool:
+            rows = list(pool.map(_run_scenario, grid))
+
+    table = pd.DataFrame(rows)
+    tier_cols = sorted(c for c in table.columns if c.startswith("WE tier "))
+    table[tier_cols] = table[tier_cols].fillna(0).astype(int)
+    table = table[[c for c in table.columns if c not in tier_cols] + tier_cols]
+    return table.sort_values(
+        ["Jours non attribués", "Gardes NON", "Écart scores"], kind="stable"
+    ).reset_index(drop=True)
+
+
+# =========================
+# Robustesse (Monte Carlo)
+# =========================
+_ROBUSTNESS_INPUTS: tuple | None = None
+
+
+def _init_robustness_worker(inputs: tuple) -> None:
+    # Entrées pré-traitées envoyées une fois par processus, pas une fois par lot de graines
+    global _ROBUSTNESS_INPUTS
+    _ROBUSTNESS_INPUTS = inputs
+
+
+def _run_robustness_chunk(seeds: list) -> dict:
+    prep, state, ref_rows, ref_scores, params = _ROBUSTNESS_INPUTS
+    return simulate_robustness(prep, state, ref_rows, ref_scores, seeds, **params)
+
+
+def evaluate_robustness(
+    planning_df: pd.DataFrame,
+    dispo_df: pd.DataFrame,
+    pointage_df: pd.DataFrame,
+    gardes_df: pd.DataFrame,
+    prev_df: pd.DataFrame | None = None,
+    seuil_proximite: int = 6,
+    max_weekends: int = 1,
+    bonus_oui: int = 5,
+    n_runs: int = 1000,
+    workers: int | None = None,
+    seed: int = 0,
+    weekend_order: str = "static",
+    engine: str = "greedy",
+    time_budget: float = 5.0,
+    **perturbation,
+) -> tuple[dict, pd.DataFrame, pd.DataFrame]:
+    """Fragilité d'un planning (sortie de `generate_planning`) face aux imprévus.
+
+    Les entrées sont pré-traitées une fois, puis `n_runs` perturbations tirées
+    au hasard (voir `perturb_planning`, arguments `perturbation`) sont
+    recalculées par le moteur qui a produit `planning_df` (`engine`,
+    `time_budget` par simulation), réparties sur un pool de processus. Les
+    résultats ne dépendent que de `seed`, pas du nombre de processus.
+    Retourne (résumé, détail par jour, détail par médecin), voir
+    `robustness_summary`.
+    """
+    if n_runs < 1:
+        raise ValueError("Il faut au moins une simulation")
+    prep = prepare_planning(dispo_df, gardes_df)
+    state = initial_state(pointage_df, prev_df)
+    ref_rows, ref_scores = robustness_reference(prep, state, planning_df)
+    params = {
+        "seuil_proximite": seuil_proximite,
+        "max_weekends": max_weekends,
+        "bonus_oui": bonus_oui,
+        "weekend_order": weekend_order,
+        "engine": engine,
+        "time_budget": time_budget,
+        **perturbation,
+    }
+    inputs = (prep, state, ref_rows, ref_scores, params)
+    if workers is None:
+        workers = min(n_runs, os.cpu_count() or 1)
+
+    seeds = [[seed, i] for i in range(n_runs)]
+    if workers <= 1:
+        _init_robustness_worker(inputs)
+        chunks = [_run_robustness_chunk(seeds)]
+    else:
+        # Quelques lots par processus pour équilibrer la charge
+        bounds = np.linspace(0, n_runs, min(n_runs, workers * 4) + 1).astype(int)
+        batches = [seeds[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_robustness_worker, initargs=(inputs,)
+        ) as pool:
+            chunks = list(pool.map(_run_robustness_chunk, batches))
+    results = {k: np.concatenate([c[k] for c in chunks]) for k in chunks[0]}
+    return robustness_summary(prep, ref_scores, results)
+
+
+# =========================
+# Fiches individuelles
+# =========================
+def _render_doctor_chunk(chunk: list[tuple[str, pd.DataFrame]], stamp: datetime) -> list[tuple[str, bytes]]:
+    return [item for doctor, rows in chunk for item in doctor_files(doctor, rows, stamp)]
+
+
+def export_doctor_files(planning_df: pd.DataFrame, target, workers: int | None = None) -> int:
+    """Fiche PDF et calendrier .ics de chaque médecin, réunis dans une archive zip.
+
+    `target` : chemin ou fichier ouvert en écriture binaire. Le rendu est
+    réparti par lots de médecins sur un pool de processus ; chaque lot est
+    écrit dans l'archive dès qu'il est prêt, dans l'ordre alphabétique.
+    Retourne le nombre de médecins exportés.
+    """
+    schedules = doctor_schedules(planning_df)
+    stamp = datetime.now(timezone.utc)
+    if workers is None:
+        workers = min(len(schedules), os.cpu_count() or 1)
+    # Quelques lots par processus pour équilibrer la charge
+    n_chunks = max(1, min(len(schedules), workers * 4))
+    bounds = np.linspace(0, len(schedules), n_chunks + 1).astype(int)
+    chunks = [schedules[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+    seen: set[str] = set()
+    with zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as zf:
+
+        def write(files: list[tuple[str, bytes]]) -> None:
+            for name, content in files:
+                # deux médecins au même nom de fichier (accents, ponctuation) : suffixe
+                stem, ext = os.path.splitext(name)
+                unique, k = name, 2
+                while unique in seen:
+                    unique, k = f"{stem}_{k}{ext}", k + 1
+                seen.add(unique)
+                zf.writestr(unique, content)
+
+        if workers <= 1:
+            for chunk in chunks:
+                write(_render_doctor_chunk(chunk, stamp))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for files in pool.map(_render_doctor_chunk, chunks, itertools.repeat(stamp)):
+                    write(files)
+    return len(schedules)
+
+
+def parse_range(text: str) -> list[int]:
+    """"4-8" -> [4..8], "0-10:5" -> [0, 5, 10], "1,3,7" -> [1, 3, 7]."""
+    values: list[int] = []
+    for part in text.split(","):
+        part = part.strip()
+        step = 1
+        if ":" in part:
+            part, step_text = part.split(":")
+            step = int(step_text)
+        if "-" in part:
+            lo, hi = part.split("-", 1)
+            values.extend(range(int(lo), int(hi) + 1, step))
+        else:
+            values.append(int(part))
+    return sorted(set(values))
+
+
+def _add_planning_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--seuil", type=int, default=6, help="seuil de proximité (jours)")
+    parser.add_argument("--max-we", type=int, default=1, help="nombre max de week-ends par médecin")
+    parser.add_argument("--bonus-oui", type=int, default=5, help="bonus OUI (points)")
+    parser.add_argument(
+        "--periods-ante",
+        type=int,
+        default=None,
+        help="périodes antérieures (défaut : feuille Paramètres du classeur)",
+    )
+    parser.add_argument(
+        "--engine", choices=["greedy", "optimal"], default="greedy", help="moteur d'attribution"
+    )
+    parser.add_argument(
+        "--time-budget", type=float, default=5.0, help="budget du moteur optimal (secondes)"
+    )
+    parser.add_argument(
+        "--weekend-order",
+        choices=list(WEEKEND_ORDERS),
+        default="static",
+        help="ordre des week-ends (dynamic : le plus contraint restant d'abord)",
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    plan = sub.add_parser("plan", help="calculer le planning d'un ou plusieurs classeurs")
+    plan.add_argument(
+        "inputs", nargs="+", help="classeurs .xlsx, archives .zip, dossiers de feuilles ou de classeurs"
+    )
+    plan.add_argument("-o", "--output", default=".", help="dossier de sortie")
+    plan.add_argument("-j", "--workers", type=int, default=None, help="processus en parallèle")
+    plan.add_argument(
+        "--profile", action="store_true", help="écrire les temps par phase (<nom>_performance.json)"
+    )
+    plan.add_argument(
+        "--format", choices=list(EXPORT_FORMATS), default="xlsx", help="format des fichiers écrits"
+    )
+    plan.add_argument(
+        "--classeur",
+        action="store_true",
+        help="un seul classeur <nom>_complet.xlsx (planning, calendrier, synthèse, pointage, log)",
+    )
+    plan.add_argument(
+        "--stream",
+        action="store_true",
+        help="écrire le log au fil des décisions, sans garder le planning en mémoire (log et pointage seuls)",
+    )
+    plan.add_argument("--store", default=None, help="base d'historique publié (SQLite)")
+    plan.add_argument(
+        "--publish", action="store_true", help="enregistrer les plannings calculés dans --store"
+    )
+    plan.add_argument(
+        "--service",
+        default=None,
+        help="service dans --store (défaut : nom de chaque classeur, sans extension)",
+    )
+    _add_planning_args(plan)
+
+    sweep = sub.add_parser("sweep", help="comparer une grille de paramètres sur un classeur")
+    sweep.add_argument("input", help="classeur .xlsx, archive .zip ou dossier de feuilles")
+    sweep.add_argument("--seuil", type=parse_range, default=[6], help='ex. "4-8" ou "3,6,9"')
+    sweep.add_argument("--max-we", type=parse_range, default=[1], help='ex. "1-2"')
+    sweep.add_argument("--bonus-oui", type=parse_range, default=[5], help='ex. "0-10:5"')
+    sweep.add_argument("--periods-ante", type=int, default=None)
+    sweep.add_argument("--engine", choices=["greedy", "optimal"], default="greedy")
+    sweep.add_argument("--time-budget", type=float, default=5.0)
+    sweep.add_argument("--weekend-order", choices=list(WEEKEND_ORDERS), default="static")
+    sweep.add_argument("-j", "--workers", type=int, default=None, help="processus en parallèle")
+    sweep.add_argument(
+        "-o", "--output", default=None, help="tableau comparatif (.xlsx, .csv, .parquet ou .arrow)"
+    )
+
+    robust = sub.add_parser("robustness", help="simuler des imprévus sur le planning d'un classeur")
+    robust.add_argument("input", help="classeur .xlsx, archive .zip ou dossier de feuilles")
+    robust.add_argument("-n", "--runs", type=int, default=1000, help="nombre de simulations")
+    robust.add_argument(
+        "--prn-non", type=float, default=0.05, help="probabilité qu'une dispo PRN passe NON"
+    )
+    robust.add_argument(
+        "--points-prob", type=float, default=0.1, help="probabilité que les points d'un jour changent"
+    )
+    robust.add_argument("--points-jitter", type=int, default=1, help="variation max des points")
+    robust.add_argument("--seed", type=int, default=0)
+    robust.add_argument("-j", "--workers", type=int, default=None, help="processus en parallèle")
+    robust.add_argument("-o", "--output", default=None, help="dossier des détails par jour et par médecin")
+    robust.add_argument(
+        "--format", choices=list(EXPORT_FORMATS), default="xlsx", help="format des fichiers écrits"
+    )
+    _add_planning_args(robust)
+
+    fiches = sub.add_parser("fiches", help="fiche PDF et calendrier .ics de chaque médecin (zip)")
+    fiches.add_argument("input", help="classeur .xlsx, archive .zip ou dossier de feuilles")
+    fiches.add_argument("-o", "--output", default=None, help="archive écrite (défaut : <nom>_fiches.zip)")
+    fiches.add_argument("-j", "--workers", type=int, default=None, help="processus en parallèle")
+    _add_planning_args(fiches)
+
+    multi = sub.add_parser(
+        "multisite",
+        help="planifier plusieurs sites partageant des médecins",
+        description=(
+            "Planifie plusieurs sites sans garde d'un médecin partagé à moins de --seuil jours "
+            "d'une autre, tous sites confondus. Les sites reliés par des médecins partagés sont "
+            "calculés l'un après l'autre : leur temps est la somme de celui de chaque site. Seuls "
+            "les groupes de sites sans médecin commun sont calculés en parallèle (temps total : "
+            "celui du groupe le plus lent)."
+        ),
+    )
+    multi.add_argument("inputs", nargs="+", help="un classeur par site, ou des dossiers de classeurs")
+    multi.add_argument("-o", "--output", default=".", help="dossier de sortie")
+    multi.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=None,
+        help="groupes de sites indépendants calculés en parallèle (sans effet sur un seul groupe)",
+    )
+    multi.add_argument(
+        "--format", choices=list(EXPORT_FORMATS), default="xlsx", help="format des fichiers écrits"
+    )
+    _add_planning_args(multi)
+
+    args = parser.parse_args(argv)
+    if args.command == "sweep":
+        return _main_sweep(args)
+    if args.command == "multisite":
+        return _main_multisite(args)
+    if args.command == "robustness":
+        return _main_robustness(args)
+    if args.command == "fiches":
+        return _main_fiches(args)
+
+    paths = collect_workbooks(args.inputs)
+    if not paths:
+        print("Aucun classeur trouvé.", file=sys.stderr)
+        return 1
+    if args.publish and not args.store:
+        parser.error("--publish nécessite --store")
+    if args.stream and (args.publish or args.classeur):
+        parser.error("--stream exclut --publish et --classeur")
+    if args.store:
+        # deux classeurs d'un même service écraseraient mutuellement leurs périodes
+        services = [p.stem for p in paths] if args.service is None else [args.service] * len(paths)
+        if args.publish and len(set(services)) < len(services):
+            parser.error(
+                "--publish : plusieurs classeurs pour un même service ("
+                + ", ".join(sorted({s for s in services if services.count(s) > 1}))
+                + ") ; renommez-les ou publiez-les séparément avec --service"
+            )
+    results = run_batch(
+        paths,
+        Path(args.output),
+        workers=args.workers,
+        seuil_proximite=args.seuil,
+        max_weekends=args.max_we,
+        bonus_oui=args.bonus_oui,
+        periods_ante=args.periods_ante,
+        engine=args.engine,
+        time_budget=args.time_budget,
+        weekend_order=args.weekend_order,
+        profile=args.profile,
+        store_path=args.store,
+        publish=args.publish,
+        service=args.service,
+        output_format=args.format,
+        single_workbook=args.classeur,
+        stream=args.stream,
+    )
+
+    failed = 0
+    for res in results:
+        if res["erreurs"]:
+            failed += 1
+            print(f"[ERREUR] {res['fichier']}: " + "; ".join(res["erreurs"]), file=sys.stderr)
+        else:
+            print(f"[OK] {res['fichier']}: {res['jours']} jours, {res['non_attribues']} non attribués")
+    return 1 if failed else 0
+
+
+def _main_multisite(args: argparse.Namespace) -> int:
+    sites = {}
+    for path in collect_workbooks(args.inputs):
+        wb = load_workbook(path)
+        if wb.errors:
+            print(f"[ERREUR] {path}: " + "; ".join(wb.errors), file=sys.stderr)
+            return 1
+        sites[path.stem] = wb
+    if not sites:
+        print("Aucun classeur trouvé.", file=sys.stderr)
+        return 1
+
+    shared = sorted(md for md, names in doctor_index(sites).items() if len(names) > 1)
+    components = site_components(sites)
+    print(f"{len(sites)} sites, {len(shared)} médecins partagés, {len(components)} groupe(s) indépendant(s)")
+    if len(components) < len(sites):
+        print("Les sites d'un même groupe sont calculés l'un après l'autre, seuls les groupes en parallèle.")
+    results = plan_sites(
+        sites,
+        workers=args.workers,
+        seuil_proximite=args.seuil,
+        max_weekends=args.max_we,
+        bonus_oui=args.bonus_oui,
+        periods_ante=args.periods_ante,
+        engine=args.engine,
+        time_budget=args.time_budget,
+        weekend_order=args.weekend_order,
+    )
+    for name, (planning, log, pointage) in results.items():
+        write_outputs(name, Path(args.output), planning, log, pointage, fmt=args.format)
+        unfilled = int(planning["Médecin"].isna().sum()) if len(planning) else 0
+        print(f"[OK] {name}: {len(planning)} jours, {unfilled} non attribués")
+    conflicts = cross_site_conflicts(results, args.seuil)
+    if len(conflicts):
+        print(f"{len(conflicts)} conflit(s) de proximité entre sites :", file=sys.stderr)
+        print(conflicts.to_string(index=False), file=sys.stderr)
+    return 0
+
+
+def _main_robustness(args: argparse.Namespace) -> int:
+    wb = load_workbook(args.input)
+    if wb.errors:
+        print("[ERREUR] " + "; ".join(wb.errors), file=sys.stderr)
+        return 1
+    planning, _, _ = generate_planning(
+        wb.dispo,
+        wb.pointage,
+        wb.gardes,
+        wb.prev,
+        args.seuil,
+        args.max_we,
+        args.bonus_oui,
+        wb.periods_ante if args.periods_ante is None else args.periods_ante,
+        engine=args.engine,
+        time_budget=args.time_budget,
+        weekend_order=args.weekend_order,
+    )
+    summary, per_day, per_doctor = evaluate_robustness(
+        planning,
+        wb.dispo,
+        wb.pointage,
+        wb.gardes,
+        wb.prev,
+        args.seuil,
+        args.max_we,
+        args.bonus_oui,
+        n_runs=args.runs,
+        workers=args.workers,
+        seed=args.seed,
+        weekend_order=args.weekend_order,
+        engine=args.engine,
+        time_budget=args.time_budget,
+        prn_to_non=args.prn_non,
+        points_prob=args.points_prob,
+        points_jitter=args.points_jitter,
+    )
+    if args.output:
+        out_dir = Path(args.output)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        ext = EXPORT_FORMATS[args.format][0]
+        stem = Path(args.input).stem
+        for name, df in (("jours", per_day), ("medecins", per_doctor)):
+            (out_dir / f"{stem}_robustesse_{name}{ext}").write_bytes(table_bytes(df, args.format))
+    for label, value in summary.items():
+        print(f"{label} : {value:.3f}" if isinstance(value, float) else f"{label} : {value}")
+    print(per_doctor.sort_values("Dérive écart-type", ascending=False).to_string(index=False))
+    return 0
+
+
+def _main_fiches(args: argparse.Namespace) -> int:
+    wb = load_workbook(args.input)
+    if wb.errors:
+        print("[ERREUR] " + "; ".join(wb.errors), file=sys.stderr)
+        return 1
+    planning, _, _ = generate_planning(
+        wb.dispo,
+        wb.pointage,
+        wb.gardes,
+        wb.prev,
+        args.seuil,
+        args.max_we,
+        args.bonus_oui,
+        wb.periods_ante if args.periods_ante is None else args.periods_ante,
+        engine=args.engine,
+        time_budget=args.time_budget,
+        weekend_order=args.weekend_order,
+    )
+    output = Path(args.output or f"{Path(args.input).stem}_fiches.zip")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    n = export_doctor_files(planning, output, workers=args.workers)
+    print(f"[OK] {output}: fiches de {n} médecin(s)")
+    return 0
+
+
+def _main_sweep(args: argparse.Namespace) -> int:
+    wb = load_workbook(args.input)
+    if wb.errors:
+        print("[ERREUR] " + "; ".join(wb.errors), file=sys.stderr)
+        return 1
+    table = sweep_parameters(
+        wb.dispo,
+        wb.pointage,
+        wb.gardes,
+        wb.prev,
+        args.seuil,
+        args.max_we,
+        args.bonus_oui,
+        wb.periods_ante if args.periods_ante is None else args.periods_ante,
+        workers=args.workers,
+        engine=args.engine,
+        time_budget=args.time_budget,
+        weekend_order=args.weekend_order,
+    )
+    if args.output:
+        Path(args.output).write_bytes(table_bytes(table, format_from_suffix(args.output)))
+    print(table.to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())